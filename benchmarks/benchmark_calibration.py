@@ -0,0 +1,80 @@
+import argparse
+import time
+
+import numpy as np
+
+import biota.calibrate
+
+"""
+This is a script to compare the time taken to calibrate DN to gamma0 and AGB by lookup table and by calculating each pixel, using synthetic DN values the size of an ALOS mosaic tile.
+"""
+
+
+def _calculate(DN, slope, intercept, dtype):
+    '''
+    Calibrate DN to gamma0 (natural units) and AGB by calculating each pixel, as LoadTile does with the speckle filter.
+    '''
+
+    dtype = np.dtype(dtype).type
+
+    DN = np.ma.array(DN).astype(dtype)
+
+    gamma0 = dtype(10.) * np.ma.log10(DN * DN) + dtype(biota.calibrate.CALIBRATION_FACTOR['HV'])
+    gamma0 = dtype(10.) ** (gamma0 / dtype(10.))
+
+    AGB = dtype(slope) * gamma0 + dtype(intercept)
+
+    return gamma0, AGB
+
+
+def _lookup(DN, slope, intercept, dtype):
+    '''
+    Calibrate DN to gamma0 (natural units) and AGB by lookup table, including the time to build each table.
+    '''
+
+    gamma0 = biota.calibrate.applyLUT(biota.calibrate.getLUT(polarisation = 'HV', units = 'natural', dtype = dtype), DN)
+    AGB = biota.calibrate.applyLUT(biota.calibrate.getLUT(polarisation = 'HV', units = 'natural', slope = slope, intercept = intercept, dtype = dtype), DN)
+
+    return gamma0, AGB
+
+
+def main(size = 4500, repeats = 3, slope = 715.667, intercept = -5.967):
+    '''
+    Time calibration by each method, and check that the results are identical.
+    '''
+
+    # Synthetic HV DN values, typical of vegetated land
+    DN = np.random.RandomState(0).gamma(4., 500., (size, size)).clip(0, 2 ** 16 - 1).astype(np.uint16)
+
+    # Non-integer DN values, as from averaging with downsample_factor
+    DN_mean = DN.astype(np.float32) + np.float32(0.5)
+
+    print('%-10s %-12s %10s %10s'%('Precision', 'Method', 'Time (s)', 'Identical'))
+
+    for dtype in ['float32', 'float64']:
+
+        reference = _calculate(DN, slope, intercept, dtype)
+
+        for name, function, data in [('calculate', _calculate, DN), ('lookup', _lookup, DN), ('interpolate', _lookup, DN_mean)]:
+
+            times = []
+            for repeat in range(repeats):
+                start = time.time()
+                gamma0, AGB = function(data, slope, intercept, dtype)
+                times.append(time.time() - start)
+
+            identical = np.array_equal(np.ma.getdata(gamma0), np.ma.getdata(reference[0])) and np.array_equal(np.ma.getdata(AGB), np.ma.getdata(reference[1]))
+
+            print('%-10s %-12s %10.3f %10s'%(dtype, name, min(times), identical if data is DN else 'n/a'))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "Compare calibration of DN to gamma0 and AGB by lookup table and by calculating each pixel.")
+
+    parser.add_argument('-s', '--size', metavar = 'PX', type = int, default = 4500, help = "Size of the synthetic DN array in pixels. Defaults to 4500, the size of a 1x1 degree ALOS mosaic tile.")
+    parser.add_argument('-r', '--repeats', metavar = 'N', type = int, default = 3, help = "Number of repeats. The fastest is reported. Defaults to 3.")
+
+    args = parser.parse_args()
+
+    main(size = args.size, repeats = args.repeats)
@@ -0,0 +1,109 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+import scipy.ndimage as ndimage
+
+import biota.indices
+
+"""
+This is a script to compare the time and memory taken to find contiguous areas by membership testing and sorting every pixel, by relabelling the whole array with a lookup table, and by labelling in strips with a lookup table, using a synthetic forest map the size of an ALOS mosaic tile with hundreds of thousands of patches.
+"""
+
+
+def _relabelBySorting(data, value, min_pixels = 1, contiguity = 'queen'):
+    '''
+    Find contiguous areas by labelling the whole array, then removing small areas with a membership test and renumbering with np.unique(), as getContiguousAreas() did before labelling in strips.
+    '''
+
+    structure = ndimage.generate_binary_structure(2, 1 if contiguity == 'rook' else 2)
+
+    location_id, n_areas = ndimage.label((data == value) * 1, structure = structure)
+
+    label_area = np.bincount(location_id.flatten())[1:]
+    include_id = np.arange(1, n_areas + 1)[label_area >= min_pixels]
+
+    contiguous_area = np.isin(location_id, include_id).reshape(data.shape)
+
+    location_id[contiguous_area == False] = 0
+
+    location_id_unique, location_id_indices = np.unique(location_id, return_inverse = True)
+    location_id = np.arange(0, location_id_unique.shape[0], 1)[location_id_indices].reshape(data.shape)
+
+    return contiguous_area, location_id
+
+
+def _relabelWhole(data, value, min_pixels = 1, contiguity = 'queen'):
+    '''
+    Find contiguous areas by labelling the whole array, then removing small areas and renumbering with a lookup table, as labelStrips() does. This isolates the cost of relabelling from that of labelling in strips.
+    '''
+
+    structure = ndimage.generate_binary_structure(2, 1 if contiguity == 'rook' else 2)
+
+    location_id, n_areas = ndimage.label(data == value, structure = structure, output = np.int32)
+
+    include = np.bincount(location_id.ravel(), minlength = n_areas + 1) >= min_pixels
+    include[0] = False
+
+    location_id = np.where(include, np.cumsum(include), 0).astype(np.int32)[location_id]
+
+    return location_id > 0, location_id
+
+
+def _syntheticForest(size, forest_proportion = 0.3):
+    '''
+    Generate a synthetic forest/nonforest map, fragmented into many small patches.
+    '''
+
+    noise = ndimage.uniform_filter(np.random.RandomState(0).rand(size, size).astype(np.float32), size = 3)
+
+    return noise < np.percentile(noise, forest_proportion * 100)
+
+
+def main(size = 4500, min_pixels = [1, 10, 100], contiguity = 'queen', repeats = 1):
+    '''
+    Time each method of finding contiguous areas for each min_pixels, measure peak memory allocated, and check that the results are identical.
+    '''
+
+    forest = _syntheticForest(size)
+
+    n_patches = ndimage.label(forest, structure = ndimage.generate_binary_structure(2, 1 if contiguity == 'rook' else 2))[1]
+
+    print('%s x %s pixels, %s patches'%(size, size, n_patches))
+    print('%-12s %-10s %10s %10s %12s %10s'%('Method', 'min_pixels', 'Areas', 'Time (s)', 'Peak (MB)', 'Identical'))
+
+    for this_min_pixels in min_pixels:
+
+        reference = None
+
+        for name, function in [('sorting', _relabelBySorting), ('whole', _relabelWhole), ('lookup', biota.indices.getContiguousAreas)]:
+
+            times = []
+            for repeat in range(repeats):
+                tracemalloc.start()
+                start = time.time()
+                contiguous_area, location_id = function(forest, True, min_pixels = this_min_pixels, contiguity = contiguity)
+                times.append(time.time() - start)
+                peak = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+
+            if reference is None: reference = (contiguous_area, location_id)
+
+            identical = np.array_equal(contiguous_area, reference[0]) and np.array_equal(location_id, reference[1])
+
+            print('%-12s %-10s %10s %10.2f %12.0f %10s'%(name, this_min_pixels, location_id.max(), min(times), peak, identical))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "Compare methods of finding contiguous areas with biota.indices.getContiguousAreas().")
+
+    parser.add_argument('-s', '--size', metavar = 'PX', type = int, default = 4500, help = "Size of the synthetic forest map in pixels. Defaults to 4500, the size of a 1x1 degree ALOS mosaic tile.")
+    parser.add_argument('-m', '--min_pixels', metavar = 'N', type = int, nargs = '+', default = [1, 10, 100], help = "Minimum area sizes to test, in pixels. Defaults to 1, 10 and 100.")
+    parser.add_argument('-c', '--contiguity', choices = ['rook', 'queen'], default = 'queen', help = "Contiguity constraint. Defaults to 'queen'.")
+    parser.add_argument('-r', '--repeats', metavar = 'N', type = int, default = 1, help = "Number of repeats. The fastest is reported. Defaults to 1.")
+
+    args = parser.parse_args()
+
+    main(size = args.size, min_pixels = args.min_pixels, contiguity = args.contiguity, repeats = args.repeats)
@@ -0,0 +1,85 @@
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+import biota.filter
+
+"""
+This is a script to compare the runtime and memory use of speckle filters, using a synthetic image the size of an ALOS mosaic tile.
+"""
+
+
+def _syntheticGamma0(size, n_looks = 16, masked_proportion = 0.05):
+    '''
+    Generate a synthetic gamma0 image (natural units) with spatial structure and gamma distributed speckle, similar to an ALOS mosaic tile.
+    '''
+
+    from scipy import ndimage
+
+    rng = np.random.RandomState(0)
+
+    # Smooth backscatter field with multiplicative speckle
+    gamma0 = ndimage.uniform_filter(rng.gamma(2., 0.01, (size, size)).astype(np.float32), size = 25)
+    gamma0 = gamma0 * rng.gamma(n_looks, 1. / n_looks, (size, size)).astype(np.float32)
+
+    # Scattered nodata, and a large masked area such as a water body
+    mask = rng.rand(size, size) < masked_proportion
+    mask[size // 4:size // 2, size // 4:size // 2] = True
+
+    return np.ma.array(gamma0, mask = mask)
+
+
+def main(size = 4500, window_sizes = [3, 5, 7], filters = None, nodata_method = 'nearest', n_workers = 1, repeats = 1):
+    '''
+    Time each registered speckle filter at each window size, and measure peak memory allocated while filtering.
+    '''
+
+    gamma0 = _syntheticGamma0(size)
+
+    gamma0_dB = 10. * np.ma.log10(gamma0)
+
+    if filters is None: filters = sorted(biota.filter.FILTERS.keys())
+
+    print('%-14s %8s %10s %14s %12s'%('Filter', 'Window', 'Time (s)', 'Mpixels/s', 'Peak (MB)'))
+
+    for name in filters:
+
+        speckle_filter, units = biota.filter.get_filter(name)
+
+        img = gamma0_dB if units == 'decibels' else gamma0
+
+        for window_size in window_sizes:
+
+            # The refined lee filter requires a window of at least 5 x 5
+            if name == 'refined_lee' and window_size < 5:
+                print('%-14s %8s %10s'%(name, window_size, 'n/a'))
+                continue
+
+            times = []
+            for repeat in range(repeats):
+                tracemalloc.start()
+                start = time.time()
+                speckle_filter(img, window_size = window_size, nodata_method = nodata_method, n_workers = n_workers)
+                times.append(time.time() - start)
+                peak = tracemalloc.get_traced_memory()[1] / 1e6
+                tracemalloc.stop()
+
+            print('%-14s %8s %10.2f %14.1f %12.0f'%(name, window_size, min(times), (size * size) / min(times) / 1e6, peak))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "Compare runtime and memory use of biota speckle filters.")
+
+    parser.add_argument('-s', '--size', metavar = 'PX', type = int, default = 4500, help = "Size of the synthetic image in pixels. Defaults to 4500, the size of a 1x1 degree ALOS mosaic tile.")
+    parser.add_argument('-w', '--window_sizes', metavar = 'N', type = int, nargs = '+', default = [3, 5, 7], help = "Window sizes to test. Defaults to 3, 5 and 7.")
+    parser.add_argument('-f', '--filters', metavar = 'NAME', type = str, nargs = '+', default = None, help = "Filters to test. Defaults to all registered filters.")
+    parser.add_argument('-nm', '--nodata_method', choices = ['nearest', 'normalized'], default = 'nearest', help = "Treatment of masked pixels. Defaults to 'nearest'.")
+    parser.add_argument('-nw', '--n_workers', metavar = 'N', type = int, default = 1, help = "Number of threads. Defaults to 1.")
+    parser.add_argument('-r', '--repeats', metavar = 'N', type = int, default = 1, help = "Number of repeats. The fastest is reported. Defaults to 1.")
+
+    args = parser.parse_args()
+
+    main(size = args.size, window_sizes = args.window_sizes, filters = args.filters, nodata_method = args.nodata_method, n_workers = args.n_workers, repeats = args.repeats)
@@ -0,0 +1,85 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from osgeo import gdal
+
+import biota.IO
+
+"""
+This is a script to compare the write time and file size of GeoTiff output profiles, using synthetic products the size of an ALOS mosaic tile.
+"""
+
+
+def _syntheticProducts(size):
+    '''
+    Generate synthetic Gamma0, AGB and ChangeType arrays with spatial structure similar to ALOS mosaic products.
+    '''
+
+    from scipy import ndimage
+
+    rng = np.random.RandomState(0)
+
+    # Smooth AGB field with speckle-like noise
+    AGB = ndimage.uniform_filter(rng.gamma(2., 10., (size, size)).astype(np.float32), size = 25)
+    AGB = AGB * rng.gamma(16., 1. / 16., (size, size)).astype(np.float32)
+
+    gamma0 = ((AGB + 5.967) / 715.667).astype(np.float32)
+
+    change_type = np.digitize(ndimage.uniform_filter(rng.normal(size = (size, size)).astype(np.float32), size = 15), [-0.2, -0.1, -0.05, 0.05, 0.1, 0.2]).astype(np.uint8)
+
+    return {'Gamma0': (gamma0, gdal.GDT_Float32, 999999), 'AGB': (AGB, gdal.GDT_Float32, 999999), 'ChangeType': (change_type, gdal.GDT_Byte, 255)}
+
+
+def main(size = 4500, repeats = 3, compressions = ['DEFLATE', 'ZSTD']):
+    '''
+    Time GeoTiff output for each product with the default profile and the 'cog' profile.
+    '''
+
+    products = _syntheticProducts(size)
+
+    geo_t = (30., 1. / size, 0., -15., 0., -1. / size)
+    proj = 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563]],PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433]]'
+
+    profiles = [('default', None)] + [('cog', compress) for compress in compressions]
+
+    output_dir = tempfile.mkdtemp()
+
+    print('%-12s %-8s %-10s %10s %12s'%('Product', 'Profile', 'Compress', 'Time (s)', 'Size (MB)'))
+
+    try:
+        for name, (data, dtype, nodata) in sorted(products.items()):
+            for profile, compress in profiles:
+
+                # ZSTD depends on the GDAL build
+                if compress is not None and compress not in gdal.GetDriverByName('GTiff').GetMetadataItem('DMD_CREATIONOPTIONLIST'):
+                    print('%-12s %-8s %-10s %10s'%(name, profile, compress, 'n/a'))
+                    continue
+
+                times = []
+                for repeat in range(repeats):
+                    start = time.time()
+                    biota.IO.outputGeoTiff(data, name, geo_t, proj, output_dir = output_dir, dtype = dtype, nodata = nodata, profile = profile, compress = compress)
+                    times.append(time.time() - start)
+
+                file_size = os.path.getsize('%s/%s.tif'%(output_dir, name)) / 1e6
+
+                print('%-12s %-8s %-10s %10.2f %12.1f'%(name, profile, str(compress), min(times), file_size))
+
+    finally:
+        shutil.rmtree(output_dir)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "Compare write time and file size of biota GeoTiff output profiles.")
+
+    parser.add_argument('-s', '--size', metavar = 'PX', type = int, default = 4500, help = "Size of the synthetic products in pixels. Defaults to 4500, the size of a 1x1 degree ALOS mosaic tile.")
+    parser.add_argument('-r', '--repeats', metavar = 'N', type = int, default = 3, help = "Number of repeats. The fastest is reported. Defaults to 3.")
+
+    args = parser.parse_args()
+
+    main(size = args.size, repeats = args.repeats)
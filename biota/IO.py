@@ -1,31 +1,249 @@
 
+import collections
+import concurrent.futures
 import matplotlib.pyplot as plt
 import numpy as np
 import os
+import threading
 
 
 import pdb
 
-def loadArray(filepath):
+
+# Process-wide cache of open read-only GDAL datasets, keyed by (path, modification time)
+_dataset_cache = collections.OrderedDict()
+_dataset_cache_lock = threading.RLock()
+_dataset_cache_stats = {'hits': 0, 'misses': 0}
+_dataset_cache_size = 32
+
+
+def openDataset(filepath):
     """
-    Use gdal to load a geospatial image into a numpy array
+    Open a GDAL dataset read-only, reusing an already open handle where possible.
+    
+    Datasets are cached by path and modification time, so a file that changes on disk is reopened. The least recently used dataset is closed once the cache exceeds its size cap (see setCacheSize()).
+    Note that a GDAL dataset should not be read from more than one thread at a time.
+    
+    Args:
+        filepath: Path to a GDAL-readable image.
+    
+    Returns:
+        A GDAL dataset
     """
     
     from osgeo import gdal
     
-    ds = gdal.Open(filepath, 0)
+    filepath = os.path.abspath(os.path.expanduser(filepath))
+    
+    # Paths that aren't files on disk (e.g. GDAL virtual file systems) are cached without a modification time
+    try:
+        mtime = os.path.getmtime(filepath)
+    except OSError:
+        mtime = None
+    
+    key = (filepath, mtime)
+    
+    with _dataset_cache_lock:
+        
+        if key in _dataset_cache:
+            _dataset_cache_stats['hits'] += 1
+            _dataset_cache.move_to_end(key)
+            return _dataset_cache[key]
+        
+        _dataset_cache_stats['misses'] += 1
+        
+        ds = gdal.Open(filepath, 0)
+        
+        assert ds is not None, "GDAL could not open %s."%filepath
+        
+        # Drop handles to earlier versions of the same file
+        for old_key in [k for k in _dataset_cache if k[0] == filepath]:
+            del _dataset_cache[old_key]
+        
+        _dataset_cache[key] = ds
+        
+        # Close least recently used datasets beyond the size cap
+        while len(_dataset_cache) > _dataset_cache_size:
+            _dataset_cache.popitem(last = False)
+    
+    return ds
+
+
+def setCacheSize(size):
+    """
+    Set the maximum number of GDAL datasets held open by openDataset().
+    
+    Args:
+        size: Maximum number of open datasets. Set to 0 to disable caching.
+    """
+    
+    global _dataset_cache_size
+    
+    assert type(size) == int and size >= 0, "Cache size must be a positive integer."
+    
+    with _dataset_cache_lock:
+        _dataset_cache_size = size
+        while len(_dataset_cache) > _dataset_cache_size:
+            _dataset_cache.popitem(last = False)
+
+
+def getCacheStats():
+    """
+    Report the use of the GDAL dataset cache.
+    
+    Returns:
+        A dictionary with the number of cache 'hits' and 'misses', and the number of datasets currently 'open'.
+    """
+    
+    with _dataset_cache_lock:
+        return {'hits': _dataset_cache_stats['hits'], 'misses': _dataset_cache_stats['misses'], 'open': len(_dataset_cache)}
+
+
+def close_all():
+    """
+    Close all GDAL datasets held by the dataset cache, and reset its hit/miss counters.
+    """
+    
+    with _dataset_cache_lock:
+        _dataset_cache.clear()
+        _dataset_cache_stats['hits'] = 0
+        _dataset_cache_stats['misses'] = 0
+
+def loadArray(filepath, ymin = 0, ysize = None):
+    """
+    Use gdal to load a geospatial image into a numpy array
+
+    Args:
+        filepath: Path to a GDAL-readable image.
+        ymin: Optionally specify the first row to load. Defaults to 0.
+        ysize: Optionally specify the number of rows to load. Defaults to all rows from ymin.
+
+    Returns:
+        A numpy array
+    """
+    
+    ds = openDataset(filepath)
+    
+    # Load the whole image unless a strip of rows is requested
+    if ymin == 0 and ysize is None:
+        return ds.ReadAsArray()
+    
+    if ysize is None: ysize = ds.RasterYSize - ymin
+    
+    assert ymin >= 0 and ymin + ysize <= ds.RasterYSize, "Rows %s to %s are outside the image extent."%(str(ymin), str(ymin + ysize))
+    
+    return ds.ReadAsArray(0, ymin, ds.RasterXSize, ysize)
+    
+    
+def _getRawLayout(filepath):
+    """
+    Determine whether an image is stored on disk as a single flat, uncompressed array that can be memory-mapped.
+    
+    Args:
+        filepath: Path to a GDAL-readable image.
+    
+    Returns:
+        A tuple of (byte offset, numpy dtype, (rows, columns)), or None where the image can't be mapped.
+    """
+    
+    from osgeo import gdal_array
+    
+    ds = openDataset(filepath)
+    
+    if ds.RasterCount != 1: return None
+    
+    band = ds.GetRasterBand(1)
     
-    return ds.ReadAsArray()
+    # Sub-byte or signed byte layouts don't map to a numpy dtype
+    if band.GetMetadataItem('NBITS', 'IMAGE_STRUCTURE') is not None: return None
+    if band.GetMetadataItem('PIXELTYPE', 'IMAGE_STRUCTURE') is not None: return None
     
+    dtype = np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(band.DataType))
+    shape = (ds.RasterYSize, ds.RasterXSize)
+    driver = ds.GetDriver().ShortName
     
+    if driver == 'ENVI':
+        
+        # Header offset and byte order are recorded in the .hdr file
+        hdr_files = [f for f in ds.GetFileList() if f.lower().endswith('.hdr')]
+        if len(hdr_files) != 1: return None
+        
+        header = {}
+        with open(hdr_files[0], 'r') as f:
+            for line in f:
+                if '=' in line:
+                    key, value = line.split('=', 1)
+                    header[key.strip().lower()] = value.strip()
+        
+        offset = int(header.get('header offset', 0))
+        byteorder = '>' if header.get('byte order', '0') == '1' else '<'
+    
+    elif driver == 'GTiff':
+        
+        if ds.GetMetadataItem('COMPRESSION', 'IMAGE_STRUCTURE') is not None: return None
+        
+        # Striped (not tiled) images only, with strips stored contiguously
+        block_xsize, block_ysize = band.GetBlockSize()
+        if block_xsize != shape[1]: return None
+        
+        n_strips = int(np.ceil(shape[0] / float(block_ysize)))
+        offset = int(band.GetMetadataItem('BLOCK_OFFSET_0_0', 'TIFF'))
+        last_offset = int(band.GetMetadataItem('BLOCK_OFFSET_0_%s'%str(n_strips - 1), 'TIFF'))
+        
+        if last_offset != offset + ((n_strips - 1) * block_ysize * shape[1] * dtype.itemsize): return None
+        
+        # TIFF files start with 'II' (little endian) or 'MM' (big endian)
+        with open(filepath, 'rb') as f:
+            byteorder = '>' if f.read(2) == b'MM' else '<'
+    
+    else:
+        return None
+    
+    dtype = dtype.newbyteorder(byteorder)
+    
+    # Check that the file is large enough to contain the array
+    if os.path.getsize(filepath) < offset + (shape[0] * shape[1] * dtype.itemsize): return None
+    
+    return offset, dtype, shape
+
+
+def mapArray(filepath, ymin = 0, ysize = None):
+    """
+    Load a geospatial image into a numpy array without copying it into memory. Where the image is stored as a flat uncompressed array (e.g. the ALOS mosaic sl_HH, sl_HV, mask and date files), the file is memory-mapped so that only the pages that are accessed are read from disk. Other images are loaded with loadArray().
+    
+    Mapped arrays are copy-on-write, so modifying them doesn't change the file on disk.
+    
+    Args:
+        filepath: Path to a GDAL-readable image.
+        ymin: Optionally specify the first row to load. Defaults to 0.
+        ysize: Optionally specify the number of rows to load. Defaults to all rows from ymin.
+    
+    Returns:
+        A numpy array
+    """
+    
+    layout = _getRawLayout(filepath)
+    
+    # Fall back to GDAL for images that can't be mapped
+    if layout is None: return loadArray(filepath, ymin = ymin, ysize = ysize)
+    
+    offset, dtype, shape = layout
+    
+    if ysize is None: ysize = shape[0] - ymin
+    
+    assert ymin >= 0 and ymin + ysize <= shape[0], "Rows %s to %s are outside the image extent."%(str(ymin), str(ymin + ysize))
+    
+    data = np.memmap(filepath, dtype = dtype, mode = 'c', offset = offset, shape = shape)
+    
+    return data[ymin:ymin + ysize]
+
+
 def loadGeoTransform(filepath):
     """
     Use gdal to load a gdal geotransform (affine transform) tuple
     """
     
-    from osgeo import gdal
-        
-    ds = gdal.Open(filepath, 0)
+    ds = openDataset(filepath)
     
     return ds.GetGeoTransform()
 
@@ -35,9 +253,7 @@ def loadProjection(filepath):
     Use gdal to load projection info
     """
     
-    from osgeo import gdal
-    
-    ds = gdal.Open(filepath, 0)
+    ds = openDataset(filepath)
     
     return ds.GetProjection()
 
@@ -47,9 +263,7 @@ def loadSize(filepath):
     Use gdal to load raster
     """
     
-    from osgeo import gdal
-    
-    ds = gdal.Open(filepath, 0)
+    ds = openDataset(filepath)
     
     return ds.RasterYSize, ds.RasterXSize
 
@@ -70,7 +284,7 @@ def loadRaster(raster, tile, resampling = 0, dtype = 3):
     from osgeo import gdal
     
     # Open GeoTiff and get metadata
-    ds_source = gdal.Open(raster)
+    ds_source = openDataset(raster)
     proj_source = loadProjection(raster)
     
     # Create output file matching ALOS tile
@@ -87,7 +301,67 @@ def loadRaster(raster, tile, resampling = 0, dtype = 3):
     
     return resampled
 
-def outputGeoTiff(data, filename, geo_t, proj, output_dir = os.getcwd(), dtype = 6, nodata = None):
+# Internal tile size of cloud-optimized GeoTiff outputs
+COG_BLOCKSIZE = 512
+
+
+def _isFloatType(dtype):
+    """
+    Determine whether a gdal data type (gdal.GDT_*) is floating point.
+    """
+    
+    from osgeo import gdal
+    
+    return dtype in [gdal.GDT_Float32, gdal.GDT_Float64, gdal.GDT_CFloat32, gdal.GDT_CFloat64]
+
+
+def getCreationOptions(dtype = 6, profile = 'default', compress = None, num_threads = 'ALL_CPUS'):
+    """
+    Generate GDAL creation options for a GeoTiff output profile.
+    
+    Args:
+        dtype: gdal data type (gdal.GDT_*). Defaults to gdal.GDT_Float32.
+        profile: 'default' for a striped LZW GeoTiff, or 'cog' for a tiled GeoTiff with internal overviews suitable for use as a cloud-optimized GeoTiff.
+        compress: For the 'cog' profile, optionally specify a compression type ('DEFLATE', 'ZSTD' or 'LZW'). Defaults to 'DEFLATE'.
+        num_threads: For the 'cog' profile, the number of threads to use for compression. Defaults to 'ALL_CPUS'.
+    
+    Returns:
+        A list of GDAL creation options
+    """
+    
+    assert profile in ['default', 'cog'], "Output profile must be 'default' or 'cog'. You input %s."%str(profile)
+    
+    if profile == 'default': return ['COMPRESS=LZW']
+    
+    if compress is None: compress = 'DEFLATE'
+    
+    assert compress in ['DEFLATE', 'ZSTD', 'LZW'], "Compression must be 'DEFLATE', 'ZSTD' or 'LZW'. You input %s."%str(compress)
+    
+    # Floating point predictor for continuous products (e.g. Gamma0, AGB), horizontal differencing for integer products
+    predictor = 3 if _isFloatType(dtype) else 2
+    
+    return ['TILED=YES', 'BLOCKXSIZE=%s'%str(COG_BLOCKSIZE), 'BLOCKYSIZE=%s'%str(COG_BLOCKSIZE), 'COMPRESS=%s'%compress,
+            'PREDICTOR=%s'%str(predictor), 'NUM_THREADS=%s'%str(num_threads), 'BIGTIFF=IF_SAFER']
+
+
+def _buildOverviews(ds, dtype):
+    """
+    Add overviews to a GDAL dataset, halving resolution until the image fits within a single internal tile.
+    """
+    
+    levels = []
+    factor = 2
+    while max(ds.RasterXSize, ds.RasterYSize) / float(factor) > COG_BLOCKSIZE / 2.:
+        levels.append(factor)
+        factor *= 2
+    
+    # Average continuous products, but don't invent new classes for categorical products (e.g. ChangeType)
+    resampling = 'AVERAGE' if _isFloatType(dtype) else 'NEAREST'
+    
+    if len(levels) > 0: ds.BuildOverviews(resampling, levels)
+
+
+def outputGeoTiff(data, filename, geo_t, proj, output_dir = os.getcwd(), dtype = 6, nodata = None, shape = None, yoff = 0, profile = 'default', compress = None, num_threads = 'ALL_CPUS'):
     """
     Writes a GeoTiff file to disk.
     
@@ -99,6 +373,11 @@ def outputGeoTiff(data, filename, geo_t, proj, output_dir = os.getcwd(), dtype =
         output_dir: Optioanlly specify an output directory. Defaults to working directory.
         dtype: gdal data type (gdal.GDT_*). Defaults to gdal.GDT_Float32.
         nodata: The nodata value for the array
+        shape: Optionally specify the (rows, columns) of the full output image to write data as a strip of rows. Defaults to the shape of data.
+        yoff: Where writing a strip, the row of the full output image at which the strip starts. The file is created where yoff is 0, and updated for later strips. Strips must be written in order. For the 'cog' profile, strips are held in an uncompressed file (filename_partial.tif) until the final strip is written.
+        profile: 'default' for a striped LZW GeoTiff, or 'cog' for a tiled, compressed GeoTiff with internal overviews laid out as a cloud-optimized GeoTiff. See getCreationOptions().
+        compress: For the 'cog' profile, optionally specify a compression type ('DEFLATE', 'ZSTD' or 'LZW'). Defaults to 'DEFLATE'.
+        num_threads: For the 'cog' profile, the number of threads to use for compression. Defaults to 'ALL_CPUS'.
     """
     
     from osgeo import osr, gdal
@@ -106,23 +385,297 @@ def outputGeoTiff(data, filename, geo_t, proj, output_dir = os.getcwd(), dtype =
     # Get full output path
     output_path = '%s/%s.tif'%(os.path.abspath(os.path.expanduser(output_dir)), filename.rstrip('.tif'))
     
-    # Save image with georeference info
-    driver = gdal.GetDriverByName('GTiff')
-    ds = driver.Create(output_path, data.shape[1], data.shape[0], 1, dtype, options = ['COMPRESS=LZW'])
+    if shape is None: shape = data.shape
+    
+    assert yoff >= 0 and yoff + data.shape[0] <= shape[0], "Strip of rows %s to %s is outside the output image extent."%(str(yoff), str(yoff + data.shape[0]))
+    
+    options = getCreationOptions(dtype = dtype, profile = profile, compress = compress, num_threads = num_threads)
+    
+    # Fill in masked arrays
+    if np.ma.isMaskedArray(data): data = data.filled(nodata)
+    
+    # A whole cloud-optimized GeoTiff is built in memory with overviews, then copied so that overviews precede image data in the file
+    if profile == 'cog' and data.shape[0] == shape[0]:
+        
+        ds = gdal.GetDriverByName('MEM').Create('', shape[1], shape[0], 1, dtype)
+        ds.SetGeoTransform(geo_t)
+        ds.SetProjection(proj)
+        if nodata != None: ds.GetRasterBand(1).SetNoDataValue(nodata)
+        ds.GetRasterBand(1).WriteArray(data)
+        
+        _buildOverviews(ds, dtype)
+        
+        gdal.GetDriverByName('GTiff').CreateCopy(output_path, ds, options = options + ['COPY_SRC_OVERVIEWS=YES'])
+        ds = None
+        
+        return
+    
+    # A streamed cloud-optimized GeoTiff is built strip by strip in an uncompressed tiled GeoTiff, so that tiles spanning strips aren't recompressed, and copied once complete
+    write_path = output_path
+    if profile == 'cog':
+        write_path = output_path[:-len('.tif')] + '_partial.tif'
+        options = ['TILED=YES', 'BLOCKXSIZE=%s'%str(COG_BLOCKSIZE), 'BLOCKYSIZE=%s'%str(COG_BLOCKSIZE), 'BIGTIFF=IF_SAFER']
+    
+    if yoff == 0:
+        
+        # Save image with georeference info
+        driver = gdal.GetDriverByName('GTiff')
+        ds = driver.Create(write_path, shape[1], shape[0], 1, dtype, options = options)
+        ds.SetGeoTransform(geo_t)
+        ds.SetProjection(proj)
+            
+        # Set nodata
+        if nodata != None:
+            ds.GetRasterBand(1).SetNoDataValue(nodata)
+    
+    else:
+        
+        # Add a strip to an image created by a previous call
+        assert os.path.isfile(write_path), "GeoTiff %s must be created by writing its first strip (yoff = 0)."%output_path
+        ds = gdal.Open(write_path, gdal.GA_Update)
+    
+    ds.GetRasterBand(1).WriteArray(data, 0, yoff)
+    
+    # Where streaming a cloud-optimized output, add overviews once the final strip is written, and copy so that overviews precede image data
+    if profile == 'cog' and yoff + data.shape[0] == shape[0]:
+        
+        _buildOverviews(ds, dtype)
+        
+        gdal.GetDriverByName('GTiff').CreateCopy(output_path, ds, options = getCreationOptions(dtype = dtype, profile = profile, compress = compress, num_threads = num_threads) + ['COPY_SRC_OVERVIEWS=YES'])
+        ds = None
+        
+        os.remove(write_path)
+    
+    ds = None
+
+
+def outputMultiBandGeoTiff(data, filename, geo_t, proj, output_dir = os.getcwd(), dtype = 6, nodata = None, descriptions = None, interleave = 'band', profile = 'default', compress = None, num_threads = 'ALL_CPUS'):
+    """
+    Writes a list of arrays to disk as the bands of a single GeoTiff file, in one pass.
+    
+    Args:
+        data: A list of numpy arrays of the same shape, one per band.
+        filename: Specify an output file name.
+        geo_t: A GDAL geoMatrix (ds.GetGeoTransform()).
+        proj: A GDAL projection (ds.GetProjection()).
+        output_dir: Optioanlly specify an output directory. Defaults to working directory.
+        dtype: gdal data type (gdal.GDT_*) shared by all bands. Defaults to gdal.GDT_Float32.
+        nodata: The nodata value for the arrays. GeoTiff files record a single nodata value for all bands.
+        descriptions: Optionally specify a list of band descriptions (e.g. product names).
+        interleave: 'band' to store each band separately, or 'pixel' to store bands interleaved by pixel. Defaults to 'band'.
+        profile: 'default' or 'cog'. See outputGeoTiff().
+        compress: For the 'cog' profile, optionally specify a compression type ('DEFLATE', 'ZSTD' or 'LZW'). Defaults to 'DEFLATE'.
+        num_threads: For the 'cog' profile, the number of threads to use for compression. Defaults to 'ALL_CPUS'.
+    """
+    
+    from osgeo import gdal
+    
+    assert len(data) >= 1, "At least one array must be input."
+    assert interleave in ['band', 'pixel'], "Interleave must be 'band' or 'pixel'. You input %s."%str(interleave)
+    assert descriptions is None or len(descriptions) == len(data), "There must be one description per band."
+    
+    shape = data[0].shape
+    for band_data in data:
+        assert band_data.shape == shape, "All bands must have the same shape."
+    
+    # Get full output path
+    output_path = '%s/%s.tif'%(os.path.abspath(os.path.expanduser(output_dir)), filename.rstrip('.tif'))
+    
+    options = getCreationOptions(dtype = dtype, profile = profile, compress = compress, num_threads = num_threads) + ['INTERLEAVE=%s'%interleave.upper()]
+    
+    # Cloud-optimized GeoTiffs are built in memory with overviews, then copied
+    if profile == 'cog':
+        ds = gdal.GetDriverByName('MEM').Create('', shape[1], shape[0], len(data), dtype)
+    else:
+        ds = gdal.GetDriverByName('GTiff').Create(output_path, shape[1], shape[0], len(data), dtype, options = options)
+    
     ds.SetGeoTransform(geo_t)
     ds.SetProjection(proj)
+    
+    for n, band_data in enumerate(data):
+        
+        band = ds.GetRasterBand(n + 1)
         
-    # Set nodata
-    if nodata != None:
-        ds.GetRasterBand(1).SetNoDataValue(nodata)
+        if nodata != None: band.SetNoDataValue(nodata)
+        if descriptions is not None: band.SetDescription(descriptions[n])
+        
+        # Write data for masked and unmasked arrays
+        if np.ma.isMaskedArray(band_data):
+            band.WriteArray(band_data.filled(nodata))
+        else:
+            band.WriteArray(band_data)
+    
+    if profile == 'cog':
+        _buildOverviews(ds, dtype)
+        gdal.GetDriverByName('GTiff').CreateCopy(output_path, ds, options = options + ['COPY_SRC_OVERVIEWS=YES'])
+    
+    ds = None
+
+
+# Background GeoTiff writer. GDAL releases the GIL while compressing, so writes on a thread pool run alongside computation.
+_writer_pool = None
+_writer_threads = 2
+_writer_max_pending = 4
+_writer_futures = collections.OrderedDict()
+_writer_pending = set()
+_writer_lock = threading.RLock()
+
+
+def setWriterThreads(n_threads, max_pending = 4):
+    """
+    Configure the background GeoTiff writer. Outstanding writes are completed first.
+    
+    Args:
+        n_threads: Number of threads writing GeoTiffs.
+        max_pending: Maximum number of writes held in memory at once. outputGeoTiffAsync() blocks while this many are outstanding. Defaults to 4.
+    """
+    
+    global _writer_pool, _writer_threads, _writer_max_pending
+    
+    assert type(n_threads) == int and n_threads >= 1, "Number of writer threads must be an integer of at least 1."
+    assert type(max_pending) == int and max_pending >= 1, "max_pending must be an integer of at least 1."
+    
+    flush()
+    
+    with _writer_lock:
+        if _writer_pool is not None: _writer_pool.shutdown(wait = True)
+        _writer_pool = None
+        _writer_threads = n_threads
+        _writer_max_pending = max_pending
+
+
+def _writeAfter(previous, write, data, filename, geo_t, proj, kwargs):
+    """
+    Write a GeoTiff once any earlier write to the same file has finished, so that strips are written in order.
+    """
+    
+    # An earlier strip that failed leaves the file incomplete, so report its error instead
+    if previous is not None and previous.exception() is not None:
+        raise previous.exception()
+    
+    write(data, filename, geo_t, proj, **kwargs)
+
+
+def _snapshot(data, nodata):
+    """
+    Copy an array for writing in the background, filling masked values.
+    """
     
-    # Write data for masked and unmasked arrays
     if np.ma.isMaskedArray(data):
-        ds.GetRasterBand(1).WriteArray(data.filled(nodata))
+        return data.filled(nodata)
     else:
-        ds.GetRasterBand(1).WriteArray(data)
-    ds = None
+        return np.array(data, copy = True)
+
+
+def _discardPending(future):
+    """
+    Stop counting a completed write against max_pending.
+    """
+    
+    with _writer_lock:
+        _writer_pending.discard(future)
+
+
+def _submitWrite(write, data, filename, geo_t, proj, kwargs):
+    """
+    Queue a write on the background writer thread pool.
+    """
+    
+    global _writer_pool
+    
+    output_dir = kwargs.get('output_dir', os.getcwd())
+    output_path = '%s/%s.tif'%(os.path.abspath(os.path.expanduser(output_dir)), filename.rstrip('.tif'))
+    
+    # Bound the memory held by outstanding writes, including earlier strips of the same file
+    while True:
+        with _writer_lock:
+            pending = list(_writer_pending)
+            if len(pending) < _writer_max_pending: break
+        concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+    
+    with _writer_lock:
+        
+        if _writer_pool is None:
+            _writer_pool = concurrent.futures.ThreadPoolExecutor(max_workers = _writer_threads)
+        
+        # Keep the last write to each file, so that later writes wait for it and carry its errors
+        previous = _writer_futures.pop(output_path, None)
+        
+        future = _writer_pool.submit(_writeAfter, previous, write, data, filename, geo_t, proj, kwargs)
+        
+        _writer_futures[output_path] = future
+        _writer_pending.add(future)
+    
+    # Registered once the write is counted, as the callback runs straight away where the write has already finished
+    future.add_done_callback(_discardPending)
+    
+    return future
+
+
+def outputGeoTiffAsync(data, filename, geo_t, proj, **kwargs):
+    """
+    Writes a GeoTiff file to disk on a background thread. Takes the same arguments as outputGeoTiff().
+    
+    The data are copied before returning, so the input array may be modified straight away. Errors are raised by flush().
+    
+    Returns:
+        A concurrent.futures.Future for the write
+    """
+    
+    # Snapshot data, including the current mask
+    data = _snapshot(data, kwargs.get('nodata', None))
+    
+    return _submitWrite(outputGeoTiff, data, filename, geo_t, proj, kwargs)
+
+
+def outputMultiBandGeoTiffAsync(data, filename, geo_t, proj, **kwargs):
+    """
+    Writes a multi-band GeoTiff file to disk on a background thread. Takes the same arguments as outputMultiBandGeoTiff().
+    
+    The data are copied before returning, so the input arrays may be modified straight away. Errors are raised by flush().
+    
+    Returns:
+        A concurrent.futures.Future for the write
+    """
+    
+    data = [_snapshot(band_data, kwargs.get('nodata', None)) for band_data in data]
+    
+    return _submitWrite(outputMultiBandGeoTiff, data, filename, geo_t, proj, kwargs)
+
+
+def wait(timeout = None):
+    """
+    Wait for outstanding background GeoTiff writes to complete, without raising errors.
+    
+    Args:
+        timeout: Optionally specify a maximum time to wait in seconds. Defaults to waiting indefinitely.
+    
+    Returns:
+        The number of writes still outstanding
+    """
+    
+    with _writer_lock:
+        futures = list(_writer_futures.values())
+    
+    _, not_done = concurrent.futures.wait(futures, timeout = timeout)
+    
+    return len(not_done)
+
+
+def flush():
+    """
+    Wait for all outstanding background GeoTiff writes to complete, raising the first error encountered by any of them.
+    """
+    
+    wait()
+    
+    with _writer_lock:
+        futures = list(_writer_futures.values())
+        _writer_futures.clear()
     
+    for future in futures:
+        if future.exception() is not None:
+            raise future.exception()
 
 
 def buildMap(fig, ax, data, lat, lon, title ='', cbartitle = '', vmin = None, vmax = None, cmap = None, big_labels = False):
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+
+import concurrent.futures
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+
+import pdb
+
+import biota
+import biota.core
+import biota.IO
+
+"""
+These are functions to run change processing over many tiles as a batch, recording the state of each job in a SQLite journal so that an interrupted batch can be resumed.
+"""
+
+
+# Options of each job that are passed to LoadChange(), rather than LoadTile()
+CHANGE_PARAMETERS = ['change_intensity_threshold', 'change_magnitude_threshold', 'change_area_threshold', 'deforestation_threshold', 'combine_areas']
+
+# Options of each job that are passed to both LoadTile() and LoadChange()
+SHARED_PARAMETERS = ['contiguity']
+
+# Products output for output = 'all'
+CHANGE_PRODUCTS = ['AGBChange', 'ChangeType', 'RiskMap']
+
+
+def _parseValue(value):
+    """
+    Convert a value from a manifest to an int, float, bool or None where it looks like one.
+    """
+
+    if value == 'None': return None
+    if value == 'True': return True
+    if value == 'False': return False
+
+    for dtype in [int, float]:
+        try:
+            return dtype(value)
+        except ValueError:
+            pass
+
+    return value
+
+
+def _getJobID(lat, lon, year1, year2, params):
+    """
+    Generate an identifier for a job, which is the same for the same tile, years and parameters in any manifest. Whole number floats are treated as ints, so that e.g. '10' and '10.0' are the same job.
+    """
+
+    params = {key: int(value) if type(value) == float and value.is_integer() else value for key, value in params.items()}
+
+    return hashlib.sha1(json.dumps([lat, lon, year1, year2, params], sort_keys = True).encode()).hexdigest()
+
+
+def getChecksum(filename, block_size = 2 ** 20):
+    """
+    Calculate the SHA-256 checksum of a file.
+
+    Args:
+        filename: Path to a file.
+        block_size: Number of bytes to read at a time. Defaults to 1 MB.
+
+    Returns:
+        The checksum as a hexadecimal string.
+    """
+
+    checksum = hashlib.sha256()
+
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            checksum.update(block)
+
+    return checksum.hexdigest()
+
+
+def loadManifest(manifest):
+    """
+    Load a manifest of jobs from a CSV file. Each row is a job, with columns 'lat', 'lon', 'year1' and 'year2'. Any other columns are options for the job: 'output' (one or more of 'AGBChange', 'ChangeType' and 'RiskMap' separated by spaces, or 'all'), options of LoadChange() (e.g. 'change_intensity_threshold', as a proportion) and options of LoadTile() (e.g. 'forest_threshold', 'lee_filter'). 'contiguity' is passed to both. Empty cells take default values.
+
+    Args:
+        manifest: Path to a CSV file.
+
+    Returns:
+        A list of jobs, each a dictionary with keys 'job_id', 'lat', 'lon', 'year1', 'year2' and 'params'. Repeated jobs are included once.
+    """
+
+    assert os.path.isfile(os.path.expanduser(manifest)), "Specified manifest (%s) does not exist"%str(manifest)
+
+    jobs, job_ids = [], set()
+
+    with open(os.path.expanduser(manifest), newline = '') as f:
+
+        reader = csv.DictReader(f)
+
+        for column in ['lat', 'lon', 'year1', 'year2']:
+            assert column in reader.fieldnames, "Manifest must include the column '%s'."%column
+
+        for row in reader:
+
+            lat, lon, year1, year2 = [int(row.pop(column)) for column in ['lat', 'lon', 'year1', 'year2']]
+
+            params = {key.strip(): _parseValue(value.strip()) for key, value in row.items() if value is not None and value.strip() != ''}
+
+            job_id = _getJobID(lat, lon, year1, year2, params)
+
+            if job_id in job_ids: continue
+
+            job_ids.add(job_id)
+            jobs.append({'job_id': job_id, 'lat': lat, 'lon': lon, 'year1': year1, 'year2': year2, 'params': params})
+
+    return jobs
+
+
+def openJournal(journal):
+    """
+    Open a SQLite journal of job states, creating it where it doesn't exist.
+
+    Args:
+        journal: Path to a SQLite database.
+
+    Returns:
+        A sqlite3 connection.
+    """
+
+    conn = sqlite3.connect(os.path.expanduser(journal))
+
+    conn.execute('CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, lat INTEGER, lon INTEGER, year1 INTEGER, year2 INTEGER, params TEXT, state TEXT, attempts INTEGER, submitted REAL, finished REAL, error TEXT)')
+    conn.execute('CREATE TABLE IF NOT EXISTS outputs (job_id TEXT, filename TEXT, checksum TEXT, PRIMARY KEY (job_id, filename))')
+    conn.commit()
+
+    return conn
+
+
+def isComplete(conn, job_id, verify = False):
+    """
+    Determine whether a job in the journal has completed, and its outputs are still present.
+
+    Args:
+        conn: A connection to a journal, from openJournal().
+        job_id: Identifier of a job.
+        verify: Set True to also check that output files have not changed since they were written, by their checksums. Defaults to False.
+
+    Returns:
+        True where the job is complete, else False.
+    """
+
+    state = conn.execute('SELECT state FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+
+    if state is None or state[0] != 'done': return False
+
+    for filename, checksum in conn.execute('SELECT filename, checksum FROM outputs WHERE job_id = ?', (job_id,)).fetchall():
+        if not os.path.isfile(filename): return False
+        if verify and getChecksum(filename) != checksum: return False
+
+    return True
+
+
+def _getJobDir(output_dir, job_id):
+    """
+    Return the directory for the outputs of a job, which is named by the start of its job_id so that jobs for the same tile and years with different options don't overwrite each other's outputs.
+    """
+
+    return '%s/%s'%(os.path.abspath(os.path.expanduser(output_dir)), job_id[:8])
+
+
+def _runJob(data_dir, lat, lon, year1, year2, params, output_dir):
+    """
+    Process change for one job, in a worker process of runBatch().
+
+    Returns:
+        A dictionary of output filename: checksum.
+    """
+
+    params = dict(params)
+
+    output = str(params.pop('output', 'all')).split()
+    products = CHANGE_PRODUCTS if output == ['all'] else output
+
+    for product in products:
+        assert product in CHANGE_PRODUCTS, "Output must be 'all' or one or more of %s. You input %s."%(', '.join(CHANGE_PRODUCTS), product)
+
+    change_params = {key: params.pop(key) for key in list(params.keys()) if key in CHANGE_PARAMETERS}
+    change_params.update({key: params[key] for key in SHARED_PARAMETERS if key in params})
+
+    tile1 = biota.LoadTile(data_dir, lat, lon, year1, output_dir = output_dir, async_output = True, **params)
+    tile2 = biota.LoadTile(data_dir, lat, lon, year2, output_dir = output_dir, async_output = True, **params)
+
+    tile_change = biota.LoadChange(tile1, tile2, output_dir = output_dir, output_profile = tile1.output_profile, **change_params)
+
+    for product in products:
+        getattr(tile_change, 'get' + product)(output = True)
+
+    # GeoTiffs are written in the background; wait for them to finish
+    biota.IO.flush()
+
+    filenames = ['%s/%s'%(os.path.abspath(output_dir), tile_change.output_pattern%product) for product in products]
+
+    return {filename: getChecksum(filename) for filename in filenames}
+
+
+def _recordJob(conn, job, future, failed):
+    """
+    Record the result of a finished job in the journal, adding it to the dictionary failed where it raised an error.
+
+    Returns:
+        1 where the job completed, else 0.
+    """
+
+    try:
+        checksums = future.result()
+
+    except Exception as e:
+        conn.execute("UPDATE jobs SET state = 'failed', finished = ?, error = ? WHERE job_id = ?", (time.time(), str(e), job['job_id']))
+        failed[job['job_id']] = dict([(key, job[key]) for key in ['lat', 'lon', 'year1', 'year2']], error = str(e))
+
+        return 0
+
+    conn.execute('DELETE FROM outputs WHERE job_id = ?', (job['job_id'],))
+    conn.executemany('INSERT INTO outputs (job_id, filename, checksum) VALUES (?, ?, ?)', [(job['job_id'], filename, checksum) for filename, checksum in checksums.items()])
+    conn.execute("UPDATE jobs SET state = 'done', finished = ? WHERE job_id = ?", (time.time(), job['job_id']))
+
+    return 1
+
+
+def runBatch(data_dir, manifest, journal = None, output_dir = os.getcwd(), n_processes = 1, max_memory = None, verify = False, verbose = False):
+    """
+    Process change for each job in a manifest across a pool of processes. The state of each job and checksums of its outputs are recorded in a SQLite journal, so that where a batch is run again, jobs that completed are skipped, and jobs that failed or were interrupted are run again. Where the batch is interrupted (e.g. by Ctrl-C), queued jobs are cancelled, jobs that already finished are recorded, and the interruption is raised again.
+
+    Args:
+        data_dir: Directory containing ALOS mosaic data.
+        manifest: Path to a CSV file of jobs. See loadManifest().
+        journal: Path to a SQLite journal. Defaults to the manifest filename, with the extension '.journal.sqlite'.
+        output_dir: Directory for output GeoTiffs, which are written to a subdirectory for each job named by the first 8 characters of its job_id. Defaults to the current working directory.
+        n_processes: Number of jobs to run at once, each in a separate process. Defaults to 1.
+        max_memory: Optionally limit the memory (data segment) of each process to max_memory MB. Jobs that need more fail with a MemoryError. Defaults to no limit (see biota.core._limitMemory()).
+        verify: Set True to check the checksums of the outputs of completed jobs, and run again jobs with outputs that have changed. Defaults to False.
+        verbose: Print progress to terminal. Defaults to False.
+
+    Returns:
+        A dictionary summarising the batch: the number of jobs ('Jobs'), jobs skipped as already complete ('Skipped'), jobs completed ('Completed'), a dictionary of job_id: {'lat', 'lon', 'year1', 'year2', 'error'} for failed jobs ('Failed'), time taken in hours ('Hours') and tiles processed per hour ('TilesPerHour').
+    """
+
+    assert os.path.isdir(os.path.expanduser(data_dir)), "Specified data directory (%s) does not exist"%str(data_dir)
+    assert os.path.isdir(os.path.expanduser(output_dir)), "Specified output directory (%s) does not exist"%str(output_dir)
+    assert type(n_processes) == int and n_processes >= 1, "Number of processes must be a positive integer."
+    assert max_memory is None or max_memory > 0, "max_memory must be a positive number of MB."
+
+    if journal is None: journal = os.path.splitext(os.path.expanduser(manifest))[0] + '.journal.sqlite'
+
+    jobs = loadManifest(manifest)
+
+    conn = openJournal(journal)
+
+    for job in jobs:
+        conn.execute("INSERT OR IGNORE INTO jobs (job_id, lat, lon, year1, year2, params, state, attempts) VALUES (?, ?, ?, ?, ?, ?, 'pending', 0)", (job['job_id'], job['lat'], job['lon'], job['year1'], job['year2'], json.dumps(job['params'], sort_keys = True)))
+    conn.commit()
+
+    pending = [job for job in jobs if not isComplete(conn, job['job_id'], verify = verify)]
+
+    if verbose: print('%s jobs, %s already complete'%(len(jobs), len(jobs) - len(pending)))
+
+    completed, failed = 0, {}
+
+    start = time.time()
+
+    # Spawn workers, so that they don't inherit the caches, threads and open files of this process
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers = n_processes, mp_context = multiprocessing.get_context('spawn'), initializer = biota.core._limitMemory, initargs = (max_memory,))
+
+    futures, recorded = {}, set()
+
+    try:
+        for job in pending:
+
+            job_dir = _getJobDir(output_dir, job['job_id'])
+            if not os.path.isdir(job_dir): os.makedirs(job_dir)
+
+            conn.execute("UPDATE jobs SET state = 'running', attempts = attempts + 1, submitted = ?, finished = NULL, error = NULL WHERE job_id = ?", (time.time(), job['job_id']))
+            futures[executor.submit(_runJob, os.path.expanduser(data_dir), job['lat'], job['lon'], job['year1'], job['year2'], job['params'], job_dir)] = job
+        conn.commit()
+
+        for future in concurrent.futures.as_completed(futures):
+
+            job = futures[future]
+
+            completed += _recordJob(conn, job, future, failed)
+            recorded.add(future)
+
+            # Record each job as it finishes, so that the journal is up to date if the batch is interrupted
+            conn.commit()
+
+            if verbose: print('lat %s, lon %s, %s - %s: %s'%(job['lat'], job['lon'], job['year1'], job['year2'], 'failed (%s)'%failed[job['job_id']]['error'] if job['job_id'] in failed else 'done'))
+
+    except BaseException:
+        # Where interrupted, cancel queued jobs rather than waiting for them to run. Futures are cancelled here as well as by shutdown(), which cancels them in the background.
+        for future in futures: future.cancel()
+        executor.shutdown(wait = False, cancel_futures = True)
+
+        # Record jobs that finished before the interruption, and return cancelled jobs to pending so that they run on resume
+        for future, job in futures.items():
+            if future.cancelled():
+                conn.execute("UPDATE jobs SET state = 'pending' WHERE job_id = ?", (job['job_id'],))
+            elif future.done() and future not in recorded:
+                completed += _recordJob(conn, job, future, failed)
+
+        conn.commit()
+
+        raise
+
+    else:
+        executor.shutdown()
+
+    finally:
+        conn.close()
+
+    hours = (time.time() - start) / 3600.
+
+    summary = {'Jobs': len(jobs), 'Skipped': len(jobs) - len(pending), 'Completed': completed, 'Failed': failed, 'Hours': hours, 'TilesPerHour': completed / hours if hours > 0 else 0.}
+
+    printSummary(summary)
+
+    return summary
+
+
+def printSummary(summary):
+    """
+    Print a summary of a batch from runBatch().
+    """
+
+    print('Jobs: %s (%s already complete, %s completed, %s failed)'%(summary['Jobs'], summary['Skipped'], summary['Completed'], len(summary['Failed'])))
+    print('Time: %.2f hours, %.1f tiles/hour'%(summary['Hours'], summary['TilesPerHour']))
+
+    for job_id, job in summary['Failed'].items():
+        print('Failed lat %s, lon %s, %s - %s (%s): %s'%(job['lat'], job['lon'], job['year1'], job['year2'], job_id[:8], job['error']))
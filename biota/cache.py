@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+import glob
+import hashlib
+import numpy as np
+import os
+import tempfile
+
+import pdb
+
+"""
+This file contains functions to cache intermediate arrays on disk, so that products derived from ALOS tiles can be reused between runs.
+"""
+
+
+def getCacheKey(**params):
+    '''
+    Generate a key that uniquely identifies a cached array from the parameters used to produce it.
+
+    Args:
+        params: Keyword arguments describing the array (e.g. tile location, year, processing options and input file modification times).
+
+    Returns:
+        A hexadecimal string
+    '''
+
+    description = ';'.join(['%s=%s'%(k, repr(params[k])) for k in sorted(params.keys())])
+
+    return hashlib.sha1(description.encode('utf-8')).hexdigest()
+
+
+def getMaskHash(mask):
+    '''
+    Generate a short hash of a boolean mask, so that cached arrays are only reused with the mask they were produced with.
+
+    Args:
+        mask: A boolean numpy array
+
+    Returns:
+        A hexadecimal string
+    '''
+
+    mask = np.ascontiguousarray(mask, dtype = np.bool_)
+
+    return hashlib.sha1(np.packbits(mask).tobytes() + str(mask.shape).encode('utf-8')).hexdigest()
+
+
+def _getCachePath(cache_dir, key):
+    '''
+    Return the location of a cached array
+    '''
+
+    return '%s/%s.npz'%(os.path.abspath(os.path.expanduser(cache_dir)), key)
+
+
+def loadCache(cache_dir, key):
+    '''
+    Load an array from the cache.
+
+    Args:
+        cache_dir: Directory containing cached arrays.
+        key: Key from getCacheKey().
+
+    Returns:
+        A masked array, or None if the key isn't in the cache.
+    '''
+
+    cache_path = _getCachePath(cache_dir, key)
+
+    if not os.path.isfile(cache_path): return None
+
+    try:
+        with np.load(cache_path) as cached:
+            data = np.ma.array(cached['data'], mask = cached['mask'])
+    except (IOError, ValueError, KeyError):
+        # Incomplete or corrupt entry, treat as a cache miss
+        return None
+
+    # Record access time for least recently used eviction
+    os.utime(cache_path, None)
+
+    return data
+
+
+def saveCache(cache_dir, key, data, max_size = 10.):
+    '''
+    Save an array to the cache, then remove least recently used arrays until the cache is no larger than max_size.
+
+    Args:
+        cache_dir: Directory containing cached arrays.
+        key: Key from getCacheKey().
+        data: A numpy array or masked array.
+        max_size: Maximum size of the cache directory in GB. Defaults to 10 GB.
+    '''
+
+    cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+
+    # Write to a temporary file first, so that concurrent readers never see an incomplete entry
+    fd, temp_path = tempfile.mkstemp(dir = cache_dir, suffix = '.tmp')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, data = np.ma.getdata(data), mask = np.ma.getmaskarray(data))
+        os.replace(temp_path, _getCachePath(cache_dir, key))
+    except:
+        if os.path.exists(temp_path): os.remove(temp_path)
+        raise
+
+    _evictCache(cache_dir, max_size)
+
+
+def _evictCache(cache_dir, max_size):
+    '''
+    Remove least recently used arrays until the cache is no larger than max_size (GB).
+    '''
+
+    cache_files = []
+    for cache_path in glob.glob('%s/*.npz'%cache_dir):
+        try:
+            cache_files.append((os.path.getmtime(cache_path), os.path.getsize(cache_path), cache_path))
+        except OSError:
+            continue
+
+    total_size = sum([size for _, size, _ in cache_files])
+
+    for _, size, cache_path in sorted(cache_files):
+
+        if total_size <= max_size * 1e9: break
+
+        try:
+            os.remove(cache_path)
+        except OSError:
+            continue
+
+        total_size -= size
+
+
+def clearCache(cache_dir):
+    '''
+    Remove all arrays from the cache.
+
+    Args:
+        cache_dir: Directory containing cached arrays.
+    '''
+
+    for cache_path in glob.glob('%s/*.npz'%os.path.abspath(os.path.expanduser(cache_dir))):
+        os.remove(cache_path)
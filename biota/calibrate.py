@@ -14,6 +14,66 @@ import biota.mask
 import pdb
 
 
+# Calibration factors to convert DN to gamma0 in dB, by polarisation (Shimada et al. 2009)
+CALIBRATION_FACTOR = {'HH': -83., 'HV': -83.}
+
+
+def getLUT(polarisation = 'HV', units = 'natural', slope = None, intercept = None, dtype = np.float32):
+    '''
+    Build a lookup table mapping each 16-bit DN value to gamma0, or to AGB where a calibration (slope, intercept) is specified. Values are computed with the same arithmetic as LoadTile.getGamma0() and LoadTile.getAGB(), so lookups are identical to calculating each pixel.
+
+    Args:
+        polarisation: Polarisation of the DN values, 'HH' or 'HV'. Defaults to 'HV'.
+        units: Units of gamma0, 'natural' or 'decibels'. Defaults to 'natural'.
+        slope: Slope of AGB calibration. Defaults to None (output gamma0).
+        intercept: Intercept of AGB calibration. Defaults to None (output gamma0).
+        dtype: Precision of the lookup table. Defaults to np.float32.
+    Returns:
+        A numpy array with 65,536 entries, indexed by DN.
+    '''
+
+    assert polarisation == 'HH' or polarisation == 'HV', "Polarisation must be 'HH' or 'HV'. You input %s."%polarisation
+    assert units == 'natural' or units == 'decibels', "Units must be 'natural' or 'decibels'. You input %s."%units
+    assert (slope is None) == (intercept is None), "Both slope and intercept must be specified for an AGB lookup table."
+    assert slope is None or units == 'natural', "AGB lookup tables must be calibrated from gamma0 in natural units."
+
+    dtype = np.dtype(dtype).type
+
+    # A DN of 0 is outside the domain of log10. Masked arrays are used so that it's treated as in LoadTile.
+    DN = np.ma.array(np.arange(2 ** 16, dtype = dtype))
+
+    lut = dtype(10.) * np.ma.log10(DN * DN) + dtype(CALIBRATION_FACTOR[polarisation]) # units = decibels
+
+    if units == 'natural': lut = dtype(10.) ** (lut / dtype(10.))
+
+    if slope is not None: lut = dtype(slope) * lut + dtype(intercept)
+
+    return np.ma.getdata(lut)
+
+
+def applyLUT(lut, DN):
+    '''
+    Map DN values to calibrated values with a lookup table from getLUT(). Integer DN values are looked up directly. Non-integer DN values (e.g. the mean of downsampled pixels) are linearly interpolated between adjacent entries.
+
+    Args:
+        lut: Lookup table from getLUT().
+        DN: A numpy array of DN values.
+    Returns:
+        A numpy array of calibrated values, with the dtype of lut.
+    '''
+
+    DN = np.ma.getdata(DN)
+
+    if np.issubdtype(DN.dtype, np.integer):
+        return np.take(lut, DN, mode = 'clip')
+
+    # Interpolate between the entries either side of each DN value
+    DN = np.clip(DN, 0, lut.shape[0] - 1)
+    index = np.minimum(DN.astype(np.intp), lut.shape[0] - 2)
+    weight = (DN - index.astype(DN.dtype)).astype(lut.dtype, copy = False)
+
+    return np.take(lut, index) + weight * np.take(np.diff(lut), index)
+
 
 def extractGamma0(dataloc, year, shp, plot_field, agb_field, buffer_size = 0, verbose = False, units = 'natural'):
     '''
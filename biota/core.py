@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 
 import argparse
+import collections.abc
+import concurrent.futures
 import datetime as dt
 import itertools
 import math
+import multiprocessing
 import numpy as np
 import os
 from osgeo import gdal
@@ -15,6 +18,8 @@ import skimage.measure
 import matplotlib.pyplot as plt
 import pdb
 
+import biota.cache
+import biota.calibrate
 import biota.filter
 import biota.indices
 import biota.IO
@@ -27,6 +32,90 @@ These are two classes for loading individual tiles and compliling them into a ch
 
 
 
+def _exportProducts(obj, products, available, output_name = 'Products', interleave = 'band'):
+    """
+    Write products from a LoadTile() or LoadChange() object as the bands of multi-band GeoTiffs, grouping products that share a data type into one file.
+
+    Args:
+        obj: A LoadTile() or LoadChange() object.
+        products: A list of product names.
+        available: A dictionary of product name: (function that returns the product array, gdal data type).
+        output_name: Name of the output file, used to fill obj.output_pattern.
+        interleave: 'band' or 'pixel'. See biota.IO.outputMultiBandGeoTiff().
+
+    Returns:
+        A dictionary with output filenames as keys, and lists of the products in each file as values.
+    """
+
+    assert len(products) > 0, "At least one product must be specified."
+
+    for product in products:
+        assert product in available, "Product must be one of %s. You input %s."%(', '.join(sorted(available.keys())), product)
+
+    # Group products by data type, retaining their order
+    groups = []
+    for product in products:
+        dtype = available[product][1]
+        for group_dtype, group_products in groups:
+            if group_dtype == dtype:
+                group_products.append(product)
+                break
+        else:
+            groups.append((dtype, [product]))
+
+    write = biota.IO.outputMultiBandGeoTiffAsync if obj.async_output else biota.IO.outputMultiBandGeoTiff
+
+    outputs = {}
+
+    for dtype, group_products in groups:
+
+        # Name files by data type only where products are split across files
+        if len(groups) == 1:
+            filename = obj.output_pattern%output_name
+        else:
+            filename = obj.output_pattern%(output_name + gdal.GetDataTypeName(dtype))
+
+        nodata = obj.nodata_byte if dtype == gdal.GDT_Byte else obj.nodata
+
+        data = [available[product][0]() for product in group_products]
+
+        write(data, filename, obj.geo_t, obj.proj, output_dir = obj.output_dir, dtype = dtype, nodata = nodata,
+              descriptions = group_products, interleave = interleave, profile = obj.output_profile)
+
+        outputs[filename] = group_products
+
+    return outputs
+
+
+# Output code for each change type, in order of precedence (later types overwrite earlier types)
+CHANGE_CODES = {'nonforest': 0, 'deforestation': 1, 'degradation': 2, 'minorloss': 3, 'minorgain': 4, 'growth': 5, 'afforestation': 6}
+
+
+class _ChangeTypes(collections.abc.Mapping):
+    """
+    A read-only dictionary of change type: boolean masked array, where each array is only built from ChangeCode when first requested. Pixels where intensity of change is undefined are masked in all change types other than nonforest.
+    """
+
+    def __init__(self, tile_change):
+        self.tile_change = tile_change
+        self.__arrays = {}
+
+    def __getitem__(self, change_type):
+
+        if change_type not in self.__arrays:
+            mask = self.tile_change.mask if change_type == 'nonforest' else np.logical_or(self.tile_change.mask, self.tile_change.undefined)
+
+            self.__arrays[change_type] = np.ma.array(self.tile_change.ChangeCode == CHANGE_CODES[change_type], mask = mask)
+
+        return self.__arrays[change_type]
+
+    def __iter__(self):
+        return iter(CHANGE_CODES)
+
+    def __len__(self):
+        return len(CHANGE_CODES)
+
+
 class LoadTile(object):
     """
     Class to load an ALOS mosaic tile, and extract properties related to properties of forest in the tile.
@@ -42,9 +131,17 @@ class LoadTile(object):
         area_threshold: Contiguous area required to meet the definiton of forest, in units of hectares. Defaults to 0 ha.
         downsample_factor:
         lee_filter: Apply a radar speckle filter to the ALOS image. Defaults to True.
+        speckle_filter: Name of the speckle filter applied with lee_filter, one of biota.filter.FILTERS ('enhanced_lee', 'refined_lee', 'frost', 'gamma_map' or 'boxcar'). Defaults to 'enhanced_lee'.
         window_size: Size of lee_filter window. Must be an odd integer. Defaults to 5.
+        nodata_method: Treatment of masked pixels by lee_filter. Set to 'nearest' to fill masked pixels with their nearest unmasked neighbour, or 'normalized' to calculate window statistics from unmasked pixels only. Defaults to 'nearest'.
         contiguity: When applying an area_threshold, a forest area could be considered continuous when directly adjacent ("rook's move") or diagonally adjacent to another forest pixel ("queen's move"). To switch, set this parameter to either 'rook' or 'queen'. Defaults to 'queen'.
         output_dir: Directory to save output GeoTiff images. Defaults to present working directory.
+        cache_dir: Optionally specify a directory to save intermediate arrays (Gamma0, AGB and contiguous forest areas), which are reloaded by later runs with the same inputs and options. Defaults to None (no cache).
+        cache_size: Maximum size of the cache directory in GB. Least recently used arrays are removed beyond this size. Defaults to 10 GB.
+        output_profile: Format of output GeoTiff images. Set to 'default' for striped LZW GeoTiffs, or 'cog' for tiled, compressed GeoTiffs with internal overviews (cloud-optimized GeoTiffs). Defaults to 'default'.
+        precision: Working precision of backscatter and biomass arrays, 'float32' or 'float64'. Outputs are written as 32-bit floating point, so 'float32' halves memory use with no loss in output precision. Defaults to 'float32'.
+        async_output: Set True to write output GeoTiff images on a background thread, so that processing continues while they're compressed. Call biota.IO.flush() to wait for writes to complete. Defaults to False.
+        n_workers: Number of threads to apply the speckle filter with. Output is identical for any number of threads. Defaults to 1.
 
     For example, to load an ALOS tile:
         tile_2015 = biota.LoadTile('/path/to/data_dir/', -15, 30, 2015)
@@ -54,7 +151,7 @@ class LoadTile(object):
     """
 
 
-    def __init__(self, data_dir, lat, lon, year, forest_threshold = 10., area_threshold = 0., downsample_factor = 1, lee_filter = True, window_size = 5, contiguity = 'queen', sm_dir = os.getcwd(), sm_interpolation = 'average', output_dir = os.getcwd()):
+    def __init__(self, data_dir, lat, lon, year, forest_threshold = 10., area_threshold = 0., downsample_factor = 1, lee_filter = True, window_size = 5, contiguity = 'queen', sm_dir = os.getcwd(), sm_interpolation = 'average', output_dir = os.getcwd(), cache_dir = None, cache_size = 10., output_profile = 'default', precision = 'float32', async_output = False, n_workers = 1, nodata_method = 'nearest', speckle_filter = 'enhanced_lee'):
         """
         Loads data and metadata for an ALOS mosaic tile.
         """
@@ -68,8 +165,10 @@ class LoadTile(object):
         assert (year >= 2007 and year <= 2010) or (year >= 2015 and year <= dt.datetime.now().year), "Years must be in the range 2007 - 2010 and 2015 - present. Your input year was %s."%str(year)
         assert downsample_factor >= 1 and type(downsample_factor) == int, "Downsampling factor must be an integer greater than 1."
         assert type(lee_filter) == bool, "Option lee_filter must be set to 'True' or 'False'."
+        assert speckle_filter in biota.filter.FILTERS, "Option speckle_filter must be one of %s."%', '.join(sorted(biota.filter.FILTERS.keys()))
         assert type(window_size) == int, "Option window_size must be an integer."
         assert window_size % 2 == 1, "Option window_size must be an odd integer."
+        assert nodata_method in ['nearest', 'normalized'], "Option nodata_method must be 'nearest' or 'normalized'."
         assert contiguity in ['rook', 'queen'], "Contiguity constraint must be 'rook' or 'queen'."
         assert os.path.isdir(os.path.expanduser(data_dir)), "Specified data directory (%s) does not exist"%str(data_dir)
         assert os.path.isdir(os.path.expanduser(sm_dir)), "Specified soil moisture directory (%s) does not exist"%str(sm_dir)
@@ -77,17 +176,30 @@ class LoadTile(object):
         assert os.path.isdir(os.path.expanduser(output_dir)), "Specified output directory (%s) does not exist"%str(output_dir)
         assert type(forest_threshold) == float or type(forest_threshold) == int, "Forest threshold must be numeric."
         assert type(area_threshold) == float or type(area_threshold) == int, "Area threshold must be numeric."
+        assert cache_dir is None or os.path.isdir(os.path.expanduser(cache_dir)), "Specified cache directory (%s) does not exist"%str(cache_dir)
+        assert output_profile in ['default', 'cog'], "Output profile must be 'default' or 'cog'."
+        assert precision in ['float32', 'float64'], "Precision must be 'float32' or 'float64'."
+        assert type(async_output) == bool, "Option async_output must be set to 'True' or 'False'."
+        assert type(n_workers) == int and n_workers >= 1, "Number of workers must be a positive integer."
 
         self.lat = lat
         self.lon = lon
         self.year = year
         self.downsample_factor = downsample_factor
         self.lee_filter = lee_filter
+        self.speckle_filter = speckle_filter
         self.window_size = window_size
+        self.nodata_method = nodata_method
         self.contiguity = contiguity
+        self.n_workers = n_workers
+        self.precision = precision
+        self.dtype = np.dtype(precision)
         self.forest_threshold = forest_threshold
         self.area_threshold = area_threshold
 
+        # Lookup tables from DN to gamma0 or AGB, built as required (see __getLUT())
+        self.__luts = {}
+
         # Deterine hemispheres
         self.hem_NS = 'S' if lat < 0 else 'N'
         self.hem_EW = 'W' if lon < 0 else 'E'
@@ -110,6 +222,15 @@ class LoadTile(object):
         # Set up locations for file output
         self.output_pattern = self.__getOutputPattern()
         self.output_dir = os.path.expanduser(output_dir.rstrip('/'))
+        self.output_profile = output_profile
+        self.async_output = async_output
+
+        # Set up location for cached arrays
+        self.cache_dir = None if cache_dir is None else os.path.expanduser(cache_dir.rstrip('/'))
+        self.cache_size = cache_size
+
+        # Description of the multitemporal speckle filter, where gamma0 is from filterMultitemporal()
+        self.multitemporal = None
 
         # Get Raster size
         self.ySize, self.xSize = self.__getSize(self.HH_path)
@@ -391,12 +512,29 @@ class LoadTile(object):
         # Update number of looks
         self.nLooks = self.nLooks * (self.downsample_factor ** 2)
 
-    def __getMask(self, masked_px_count = False, output = False, show = False):
+    def __getNativeRows(self, ymin = 0, ysize = None):
         """
-        Loads the mask into a numpy array.
+        Converts a strip of rows of the tile to the equivalent rows of the native resolution ALOS image, accounting for downsampling.
         """
 
-        mask = biota.IO.loadArray(self.mask_path) != 255
+        # Whole tile
+        if ymin == 0 and ysize is None: return 0, None
+
+        native_ySize = biota.IO.loadSize(self.HH_path)[0]
+
+        ymin_native = ymin * self.downsample_factor
+        ymax_native = native_ySize if ysize is None else min((ymin + ysize) * self.downsample_factor, native_ySize)
+
+        return ymin_native, ymax_native - ymin_native
+
+    def __getMask(self, masked_px_count = False, output = False, show = False, ymin = 0, ysize = None):
+        """
+        Loads the mask into a numpy array. Optionally specify a strip of rows to load (ymin, ysize).
+        """
+
+        ymin_native, ysize_native = self.__getNativeRows(ymin = ymin, ysize = ysize)
+
+        mask = biota.IO.mapArray(self.mask_path, ymin = ymin_native, ysize = ysize_native) != 255
 
         # If resampling, this removes the mask from any pixel with >= 75 % data availability.
         if self.downsample_factor != 1 and not masked_px_count:
@@ -423,6 +561,9 @@ class LoadTile(object):
         # Add the new raster masks to the existing mask
         self.mask = np.logical_or(self.mask, mask)
 
+        # Filtered backscatter depends on the mask
+        self.release('Gamma0')
+
         if output: self.__outputGeoTiff(self.mask * 1, 'Mask', dtype = gdal.GDT_Byte)
 
         if show: self.__showArray(self.mask * 1, title = 'Mask', cmap = 'coolwarm')
@@ -434,17 +575,53 @@ class LoadTile(object):
 
         self.mask = self.__getMask()
 
+        # Filtered backscatter depends on the mask
+        self.release('Gamma0')
+
+    def release(self, product):
+        """
+        Frees memory held by a product, which is recalculated (or reloaded from the cache) when next requested.
+
+        Args:
+            product: One of 'Gamma0' (filtered backscatter for both polarisations), 'AGB', 'WoodyCover', 'ForestPatches', 'SM', 'DOY', 'YearArray' or 'date'.
+        """
+
+        assert product in ['Gamma0', 'AGB', 'WoodyCover', 'ForestPatches', 'SM', 'DOY', 'YearArray', 'date'], "Product %s cannot be released."%str(product)
+
+        if hasattr(self, product): delattr(self, product)
+
+        # Gamma0 reverts to the tile's own speckle filter
+        if product == 'Gamma0': self.multitemporal = None
+
     def getDN(self, polarisation = 'HV', output = False, show = False):
         """
         Loads DN (raw) values into a numpy array.
         """
 
+        DN = self.__getDN(polarisation = polarisation)
+
+        if output: self.__outputGeoTiff(DN.data, 'DN', dtype = gdal.GDT_Int32)
+
+        if show: self.__showArray(DN.data, title = 'DN', cbartitle = 'Digital Number', cmap = 'Spectral_r')
+
+        return DN
+
+    def __getDN(self, polarisation = 'HV', ymin = 0, ysize = None):
+        """
+        Loads DN (raw) values into a masked array. Optionally specify a strip of rows to load (ymin, ysize).
+        """
+
         assert polarisation == 'HH' or polarisation == 'HV', "polarisation must be either 'HH' or 'HV'."
 
+        ymin_native, ysize_native = self.__getNativeRows(ymin = ymin, ysize = ysize)
+
         if polarisation == 'HV':
-            DN = biota.IO.loadArray(self.HV_path)
+            DN = biota.IO.mapArray(self.HV_path, ymin = ymin_native, ysize = ysize_native)
         else:
-            DN = biota.IO.loadArray(self.HH_path)
+            DN = biota.IO.mapArray(self.HH_path, ymin = ymin_native, ysize = ysize_native)
+
+        # Get the mask for the rows being loaded
+        mask = self.mask[ymin:] if ysize is None else self.mask[ymin:ymin + ysize]
 
         # Rebin DN with mean. This is acceptable as the DN values are on a linear scale.
         if self.downsample_factor != 1:
@@ -456,18 +633,14 @@ class LoadTile(object):
             block_sum = skimage.measure.block_reduce(np.ones_like(DN), (self.downsample_factor, self.downsample_factor), np.sum)
 
             # And the sum of masked pixels
-            mask_sum = self.__getMask(masked_px_count = True)
+            mask_sum = self.__getMask(masked_px_count = True, ymin = ymin, ysize = ysize)
 
             # Divide the sum of DNs by the sum of unmasked pixels to get the mean DN value
             DN = np.zeros_like(DN_sum)
 
-            DN[self.mask == False] = (DN_sum.astype(np.float)[self.mask == False] / (block_sum - mask_sum)[self.mask == False]).astype(np.int)
-
-        if output: self.__outputGeoTiff(DN, 'DN', dtype = gdal.GDT_Int32)
+            DN[mask == False] = (DN_sum.astype(np.float64)[mask == False] / (block_sum - mask_sum)[mask == False]).astype(np.int64)
 
-        if show: self.__showArray(DN, title = 'DN', cbartitle = 'Digital Number', cmap = 'Spectral_r')
-
-        return np.ma.array(DN, mask = self.mask)
+        return np.ma.array(DN, mask = mask)
 
     def __getDay(self):
         '''
@@ -597,24 +770,10 @@ class LoadTile(object):
     def getGamma0(self, polarisation = 'HV', units = 'natural', output = False, show = False):
         """
         Calibrates data to gamma0 (baskscatter) in decibels or natural units.
+        Filtered gamma0 is held in memory in decibels for each polarisation, so later calls in either units don't repeat filtering. Free it with release('Gamma0').
         """
 
-        assert units == 'natural' or units == 'decibels', "Units must be 'natural' or 'decibels'. You input %s."%units
-        assert polarisation == 'HH' or polarisation == 'HV', "Polarisation must be 'HH' or 'HV'. You input %s."%polarisation
-
-        # Calibrate DN to units of dB
-        gamma0 = 10 * np.ma.log10(self.getDN(polarisation = polarisation).astype(np.float) ** 2) - 83. # units = decibels
-        # Apply filter based on dB values
-        if self.lee_filter:
-            gamma0 = biota.filter.enhanced_lee_filter(gamma0, n_looks = self.nLooks, window_size = self.window_size)
-
-
-        # Convert to natural units where specified
-        if units == 'natural': gamma0 = 10 ** (gamma0 / 10.)
-
-        # Keep masked values tidy
-        gamma0.data[self.mask] = self.nodata
-        gamma0.mask = self.mask
+        gamma0 = self.__getGamma0(polarisation = polarisation, units = units)
 
         if output: self.__outputGeoTiff(gamma0, 'Gamma0')
 
@@ -629,29 +788,255 @@ class LoadTile(object):
 
         return gamma0
 
+    def __getGamma0(self, polarisation = 'HV', units = 'natural', ymin = 0, ysize = None):
+        """
+        Calibrates data to gamma0 for the whole tile, or for a strip of rows (ymin, ysize). Strips are loaded with a halo of rows so that the speckle filter sees the same neighbourhood as it would for the whole tile.
+        """
+
+        assert units == 'natural' or units == 'decibels', "Units must be 'natural' or 'decibels'. You input %s."%units
+        assert polarisation == 'HH' or polarisation == 'HV', "Polarisation must be 'HH' or 'HV'. You input %s."%polarisation
+
+        # Without the speckle filter, DN values map directly to gamma0
+        if not self.lee_filter:
+            return self.__lookupDN(self.__getLUT(polarisation = polarisation, units = units), polarisation = polarisation, ymin = ymin, ysize = ysize)
+
+        # Determine rows to load, including the halo
+        if ysize is None:
+            ymin_load, ysize_load = ymin, None
+        else:
+            halo = self.__getHalo()
+            ymin_load = max(ymin - halo, 0)
+            ysize_load = min(ymin + ysize + halo, self.mask.shape[0]) - ymin_load
+
+        # Whole tiles are held in memory in dB for each polarisation, and can be reloaded from the cache
+        if not hasattr(self, 'Gamma0'): self.Gamma0 = {}
+
+        gamma0 = None
+
+        if ysize is None:
+            if polarisation not in self.Gamma0:
+                gamma0 = self.__loadCache('Gamma0', polarisation = polarisation)
+                if gamma0 is not None: self.Gamma0[polarisation] = gamma0
+            else:
+                gamma0 = self.Gamma0[polarisation]
+
+        # Strips are taken from the whole tile where it's already in memory
+        elif polarisation in self.Gamma0:
+            gamma0 = self.Gamma0[polarisation][ymin:ymin + ysize]
+
+        if gamma0 is None:
+
+            DN = self.__getDN(polarisation = polarisation, ymin = ymin_load, ysize = ysize_load).astype(self.dtype)
+
+            # Calibrate DN to units of dB. Constants are cast to the working precision, as masked array arithmetic would otherwise promote to float64.
+            gamma0 = self.dtype.type(10.) * np.ma.log10(DN * DN) + self.dtype.type(biota.calibrate.CALIBRATION_FACTOR[polarisation]) # units = decibels
+
+            # Apply speckle filter
+            if self.lee_filter:
+                speckle_filter, filter_units = biota.filter.get_filter(self.speckle_filter)
+
+                # Filters for multiplicative speckle are applied to gamma0 in natural units
+                if filter_units == 'natural': gamma0 = self.dtype.type(10.) ** (gamma0 / self.dtype.type(10.))
+
+                gamma0 = speckle_filter(gamma0, n_looks = self.nLooks, window_size = self.window_size, nodata_method = self.nodata_method, n_workers = self.n_workers)
+
+                if filter_units == 'natural': gamma0 = self.dtype.type(10.) * np.ma.log10(gamma0)
+
+            # Remove the halo
+            if ysize is not None:
+                gamma0 = gamma0[ymin - ymin_load:ymin - ymin_load + ysize]
+            else:
+                self.Gamma0[polarisation] = gamma0
+                self.__saveCache('Gamma0', gamma0, polarisation = polarisation)
+
+        # Convert to natural units where specified. Otherwise copy, so that the array held in memory isn't modified.
+        if units == 'natural':
+            gamma0 = self.dtype.type(10.) ** (gamma0 / self.dtype.type(10.))
+        else:
+            gamma0 = gamma0.copy()
+
+        # Keep masked values tidy
+        mask = self.mask[ymin:] if ysize is None else self.mask[ymin:ymin + ysize]
+        gamma0.data[mask] = self.nodata
+        gamma0.mask = mask
+
+        return gamma0
+
+    def __getLUT(self, polarisation = 'HV', units = 'natural', slope = None, intercept = None):
+        """
+        Returns a lookup table from DN to gamma0 or AGB at working precision. Tables are built once per polarisation, units and calibration.
+        """
+
+        key = (polarisation, units, slope, intercept)
+
+        if key not in self.__luts:
+            self.__luts[key] = biota.calibrate.getLUT(polarisation = polarisation, units = units, slope = slope, intercept = intercept, dtype = self.dtype)
+
+        return self.__luts[key]
+
+    def __lookupDN(self, lut, polarisation = 'HV', ymin = 0, ysize = None):
+        """
+        Maps DN values to gamma0 or AGB with a lookup table, for the whole tile or a strip of rows (ymin, ysize).
+        """
+
+        DN = self.__getDN(polarisation = polarisation, ymin = ymin, ysize = ysize)
+
+        data = biota.calibrate.applyLUT(lut, DN.data)
+
+        # Keep masked values tidy
+        data[DN.mask] = self.nodata
+
+        return np.ma.array(data, mask = DN.mask)
+
+    def __getCacheKey(self, product, **params):
+        """
+        Generates a key for a cached array from the tile, its processing options, the modification times of its input files and the current mask.
+        """
+
+        input_mtimes = tuple([os.path.getmtime(path) for path in [self.HH_path, self.HV_path, self.mask_path]])
+
+        # Products of the multitemporal filter are cached separately from those of the tile's own speckle filter
+        if self.multitemporal is not None: params['multitemporal'] = self.multitemporal
+
+        return biota.cache.getCacheKey(product = product, lat = self.lat, lon = self.lon, year = self.year, downsample_factor = self.downsample_factor,
+                                       lee_filter = self.lee_filter, speckle_filter = self.speckle_filter, window_size = self.window_size, nodata_method = self.nodata_method, nLooks = self.nLooks, precision = self.precision, input_mtimes = input_mtimes,
+                                       mask = biota.cache.getMaskHash(self.mask), **params)
+
+    def __loadCache(self, product, **params):
+        """
+        Loads a product from the cache, returning None where it's not present or no cache_dir is in use.
+        """
+
+        if self.cache_dir is None: return None
+
+        return biota.cache.loadCache(self.cache_dir, self.__getCacheKey(product, **params))
+
+    def __saveCache(self, product, data, **params):
+        """
+        Saves a product to the cache, where a cache_dir is in use.
+        """
+
+        if self.cache_dir is None: return
+
+        biota.cache.saveCache(self.cache_dir, self.__getCacheKey(product, **params), data, max_size = self.cache_size)
+
+    def __getHalo(self):
+        """
+        Number of rows to load either side of a strip to reproduce whole tile processing.
+        """
+
+        if not self.lee_filter: return 0
+
+        return biota.filter.get_halo(self.window_size, nodata_method = self.nodata_method)
+
+    def __getStripSize(self, max_memory):
+        """
+        Determines the number of rows to process at once to keep peak memory use below max_memory (MB).
+        """
+
+        # Approximate peak bytes used per pixel when calibrating and filtering an image (~20 arrays at working precision), scaled by the number of native pixels loaded per output pixel
+        bytes_per_pixel = 20 * self.dtype.itemsize * (self.downsample_factor ** 2)
+
+        strip_size = int((max_memory * 1e6) / (bytes_per_pixel * self.xSize)) - (2 * self.__getHalo())
+
+        assert strip_size >= 1, "max_memory of %s MB is too small to process this tile in strips."%str(max_memory)
+
+        # Align strips to the internal tiles of cloud-optimized GeoTiff outputs, so that tiles aren't rewritten
+        if self.output_profile == 'cog' and strip_size > biota.IO.COG_BLOCKSIZE:
+            strip_size -= strip_size % biota.IO.COG_BLOCKSIZE
+
+        return min(strip_size, self.mask.shape[0])
+
+    def streamOutput(self, products = ['Gamma0', 'AGB', 'WoodyCover'], polarisation = 'HV', units = 'natural', slope = 715.667, intercept = -5.967, max_memory = 1024.):
+        """
+        Processes the tile in strips of rows, writing each product to GeoTiff strip by strip. This keeps peak memory use to approximately max_memory, with results identical to getGamma0(), getAGB() and getWoodyCover(output = True) to within floating point rounding.
+
+        Args:
+            products: A list of products to output, from 'Gamma0', 'AGB' and 'WoodyCover'.
+            polarisation: Polarisation of Gamma0 output. Defaults to 'HV'.
+            units: Units of Gamma0 output. Defaults to 'natural'.
+            slope: Slope of AGB calibration, as in getAGB().
+            intercept: Intercept of AGB calibration, as in getAGB().
+            max_memory: Approximate memory budget in MB. Defaults to 1024 MB.
+
+        Returns:
+            The number of rows processed in each strip.
+        """
+
+        for product in products:
+            assert product in ['Gamma0', 'AGB', 'WoodyCover'], "Products for streamed output must be 'Gamma0', 'AGB' or 'WoodyCover'. You input %s."%product
+
+        # Contiguous areas can span strips, so can't be identified strip by strip
+        assert 'WoodyCover' not in products or self.area_threshold == 0, "WoodyCover can only be streamed where area_threshold is 0."
+
+        ySize, xSize = self.mask.shape
+
+        strip_size = self.__getStripSize(max_memory)
+
+        for ymin in range(0, ySize, strip_size):
+
+            ysize = min(strip_size, ySize - ymin)
+
+            if 'Gamma0' in products:
+                gamma0 = self.__getGamma0(polarisation = polarisation, units = units, ymin = ymin, ysize = ysize)
+                self.__outputGeoTiff(gamma0, 'Gamma0', shape = (ySize, xSize), yoff = ymin)
+
+            if 'AGB' in products or 'WoodyCover' in products:
+
+                # Without the speckle filter, DN values map directly to AGB
+                if not self.lee_filter:
+                    AGB = self.__lookupDN(self.__getLUT(polarisation = 'HV', slope = slope, intercept = intercept), polarisation = 'HV', ymin = ymin, ysize = ysize)
+
+                else:
+                    # Reuse Gamma0 where it's already been calibrated appropriately
+                    if 'Gamma0' not in products or polarisation != 'HV' or units != 'natural':
+                        gamma0 = self.__getGamma0(polarisation = 'HV', units = 'natural', ymin = ymin, ysize = ysize)
+
+                    AGB = self.dtype.type(slope) * gamma0 + self.dtype.type(intercept)
+                    AGB.mask = gamma0.mask
+
+                if 'AGB' in products: self.__outputGeoTiff(AGB, 'AGB', shape = (ySize, xSize), yoff = ymin)
+
+                if 'WoodyCover' in products:
+                    WoodyCover = AGB >= float(self.forest_threshold)
+                    WoodyCover.mask = AGB.mask
+                    self.__outputGeoTiff(WoodyCover.astype(np.uint8), 'WoodyCover', dtype = gdal.GDT_Byte, shape = (ySize, xSize), yoff = ymin)
+
+        return strip_size
+
     def getAGB(self, slope = 715.667, intercept = -5.967, output = False, show = False):
         """
         Calibrates data to aboveground biomass (AGB).
         Placeholder equation to calibrate backscatter (gamma0) to AGB (tC/ha).
         """
 
-        # Don't rerun processing if already present in memory
+        # Don't rerun processing if already present in memory or the cache
+        if not hasattr(self, 'AGB'):
+            AGB = self.__loadCache('AGB', slope = slope, intercept = intercept)
+            if AGB is not None: self.AGB = AGB
+
         if not hasattr(self, 'AGB'):
 
+            if self.satellite not in ['ALOS-1', 'ALOS-2']:
+                raise ValueError("Unknown satellite named '%s'. self.satellite must be 'ALOS-1' or 'ALOS-2'."%self.satellite)
+
+            # Without the speckle filter, DN values map directly to AGB
+            elif not self.lee_filter:
+                AGB = self.__lookupDN(self.__getLUT(polarisation = 'HV', slope = slope, intercept = intercept), polarisation = 'HV')
+
             # ALOS-1
-            if self.satellite == 'ALOS-1':
-                AGB = slope * self.getGamma0(units = 'natural', polarisation = 'HV') + intercept
+            elif self.satellite == 'ALOS-1':
+                AGB = self.dtype.type(slope) * self.getGamma0(units = 'natural', polarisation = 'HV') + self.dtype.type(intercept)
 
             # ALOS-2 (to calculate)
             elif self.satellite == 'ALOS-2':
-                AGB = slope * self.getGamma0(units = 'natural', polarisation = 'HV') + intercept
-
-            else:
-                raise ValueError("Unknown satellite named '%s'. self.satellite must be 'ALOS-1' or 'ALOS-2'."%self.satellite)
+                AGB = self.dtype.type(slope) * self.getGamma0(units = 'natural', polarisation = 'HV') + self.dtype.type(intercept)
 
             # Save output to class
             self.AGB = AGB
 
+            self.__saveCache('AGB', AGB, slope = slope, intercept = intercept)
+
         # Keep masked values tidy
         #self.AGB.data[self.mask] = self.nodata
         self.AGB.mask = self.mask
@@ -675,11 +1060,20 @@ class LoadTile(object):
 
             if self.area_threshold > 0:
 
-                # Calculate number of pixels in min_area (assuming input is given in hecatres)
-                min_pixels = int(round(self.area_threshold / (self.yRes * self.xRes * 0.0001)))
+                # Contiguous areas are cached against the forest/nonforest pixels they were derived from
+                cache_params = {'forest': biota.cache.getMaskHash(WoodyCover.data), 'area_threshold': self.area_threshold, 'contiguity': self.contiguity}
+
+                contiguous_area = self.__loadCache('ContiguousArea', **cache_params)
+
+                if contiguous_area is None:
+
+                    # Calculate number of pixels in min_area (assuming input is given in hecatres)
+                    min_pixels = int(round(self.area_threshold / (self.yRes * self.xRes * 0.0001)))
 
-                # Remove pixels that aren't part of a forest block of size at least min_pixels
-                contiguous_area, _ = biota.indices.getContiguousAreas(WoodyCover, True, min_pixels = min_pixels, contiguity = self.contiguity)
+                    # Remove pixels that aren't part of a forest block of size at least min_pixels
+                    contiguous_area, _ = biota.indices.getContiguousAreas(WoodyCover, True, min_pixels = min_pixels, contiguity = self.contiguity)
+
+                    self.__saveCache('ContiguousArea', contiguous_area, **cache_params)
 
                 WoodyCover.data[contiguous_area == False] = False
 
@@ -730,9 +1124,31 @@ class LoadTile(object):
 
         return self.ForestPatches
 
-    def __outputGeoTiff(self, data, output_name, dtype = 6):
+    def exportProducts(self, products = ['Gamma0', 'AGB', 'WoodyCover'], polarisation = 'HV', units = 'natural', output_name = 'Products', interleave = 'band'):
         """
-        Output a GeoTiff file.
+        Write a set of products in a single pass, as the bands of one GeoTiff file. Products that can't share a data type are written to one file per data type (e.g. 'ProductsFloat32' and 'ProductsByte').
+
+        Args:
+            products: A list of products, from 'Gamma0', 'AGB', 'WoodyCover' and 'ForestPatches'. Defaults to 'Gamma0', 'AGB' and 'WoodyCover'.
+            polarisation: Polarisation of Gamma0. Defaults to 'HV'.
+            units: Units of Gamma0. Defaults to 'natural'.
+            output_name: Name to give output files. Defaults to 'Products'.
+            interleave: Set to 'band' to store bands separately, or 'pixel' to interleave bands by pixel. Defaults to 'band'.
+
+        Returns:
+            A dictionary with output filenames as keys, and lists of the products in each file as values.
+        """
+
+        available = {'Gamma0': (lambda: self.getGamma0(polarisation = polarisation, units = units), gdal.GDT_Float32),
+                     'AGB': (lambda: self.getAGB(), gdal.GDT_Float32),
+                     'WoodyCover': (lambda: self.getWoodyCover().astype(np.uint8), gdal.GDT_Byte),
+                     'ForestPatches': (lambda: self.getForestPatches(), gdal.GDT_Int32)}
+
+        return _exportProducts(self, products, available, output_name = output_name, interleave = interleave)
+
+    def __outputGeoTiff(self, data, output_name, dtype = 6, shape = None, yoff = 0):
+        """
+        Output a GeoTiff file. Optionally specify the shape of the full image and a row offset to write a strip of rows.
         """
 
         # Generate a standardised filename
@@ -741,8 +1157,10 @@ class LoadTile(object):
         # Generate a nodata value appropriate for datatype
         nodata = self.__getNodata(dtype = dtype)
 
-        # Write to disk
-        biota.IO.outputGeoTiff(data, filename, self.geo_t, self.proj, output_dir = self.output_dir, dtype = dtype, nodata = nodata)
+        # Write to disk, optionally in the background
+        write = biota.IO.outputGeoTiffAsync if self.async_output else biota.IO.outputGeoTiff
+
+        write(data, filename, self.geo_t, self.proj, output_dir = self.output_dir, dtype = dtype, nodata = nodata, shape = shape, yoff = yoff, profile = self.output_profile)
 
     def __showArray(self, data, title = '', cbartitle = '', vmin = None, vmax = None, cmap = None):
         """
@@ -757,12 +1175,13 @@ class LoadChange(object):
     Input is two mosaic tiles from LoadTile, will output maps and change statistics.
     """
 
-    def __init__(self, tile_t1, tile_t2, change_intensity_threshold = 0.2, change_magnitude_threshold = 0., change_area_threshold = 0, deforestation_threshold = None, contiguity = 'queen', combine_areas = True, output_dir = os.getcwd()):
+    def __init__(self, tile_t1, tile_t2, change_intensity_threshold = 0.2, change_magnitude_threshold = 0., change_area_threshold = 0, deforestation_threshold = None, contiguity = 'queen', combine_areas = True, output_dir = os.getcwd(), output_profile = 'default', async_output = None):
         '''
         Initialise
         '''
 
         assert contiguity in ['rook', 'queen'], "Contiguity constraint must be 'rook' or 'queen'."
+        assert output_profile in ['default', 'cog'], "Output profile must be 'default' or 'cog'."
 
         self.tile_t1 = tile_t1
         self.tile_t2 = tile_t2
@@ -802,6 +1221,10 @@ class LoadChange(object):
 
         self.output_dir = output_dir
         self.output_pattern = self.__getOutputPattern()
+        self.output_profile = output_profile
+
+        # Write outputs in the background if the input tiles do
+        self.async_output = tile_t1.async_output if async_output is None else async_output
 
         # Nodata currently hardwired to 99
         self.nodata = tile_t1.nodata
@@ -819,12 +1242,14 @@ class LoadChange(object):
         assert self.tile_t1.year <= self.tile_t2.year, "Input tile_t2 must be from a later year than tile_t1."
         assert self.tile_t1.year != self.tile_t2.year, "Input tile_t1 cannot be from the same year as tile_t2."
         assert self.tile_t1.lee_filter == self.tile_t2.lee_filter, "Only one of the input tiles has been filtered. Both tiles should have the same pre-processing parameters."
+        assert self.tile_t1.lee_filter == False or self.tile_t1.speckle_filter == self.tile_t2.speckle_filter, "'speckle_filter' must be identical for both input tiles."
         assert self.tile_t1.proj == self.tile_t2.proj, "Input tiles do not have the same projection."
         assert self.tile_t1.xSize == self.tile_t2.xSize and self.tile_t1.ySize == self.tile_t2.ySize, "Input tiles do not have the same resolution."
         assert self.tile_t1.geo_t == self.tile_t2.geo_t, "Input tiles do not have the same geo_transform."
         assert self.tile_t1.forest_threshold == self.tile_t2.forest_threshold, "'forest_threshold' must be identical for both input tiles."
         assert self.tile_t1.area_threshold == self.tile_t2.area_threshold, "'area_threshold' must be identical for both input tiles."
         assert self.tile_t1.downsample_factor == self.tile_t2.downsample_factor, "'downsample_facor' must be identical for both input tiles."
+        assert self.tile_t1.precision == self.tile_t2.precision, "'precision' must be identical for both input tiles."
 
 
     def __combineMasks(self):
@@ -865,6 +1290,9 @@ class LoadChange(object):
         # Add the new raster masks to the existing mask
         self.mask = np.logical_or(self.mask, mask)
 
+        # Histograms of AGB only include unmasked pixels
+        if hasattr(self, 'JointHistogram'): del self.JointHistogram
+
         if output: self.__outputGeoTiff(self.mask * 1, 'Mask', dtype = gdal.GDT_Byte)
 
         if show: self.__showArray(self.mask * 1, title = 'Mask', cmap = 'coolwarm')
@@ -876,6 +1304,8 @@ class LoadChange(object):
 
         self.mask = self.__combineMasks()
 
+        if hasattr(self, 'JointHistogram'): del self.JointHistogram
+
 
     def getSMChange(self, output = False, show = False):
         """
@@ -931,90 +1361,143 @@ class LoadChange(object):
 
         return self.AGB_change
 
-
-    def getChangeType(self, output = False, show = False):
+    def __classifyChange(self, block_size = 512):
         '''
-        Returns pixels that meet change detection thresholds for country.
+        Classify each pixel into a change type in a single pass over AGB and woody cover at t1 and t2, processing blocks of rows to limit memory use.
 
         Args:
-            forest_threshold = threshold above which a pixel is forest
-            intensity_threshold = threshold of proportional change with which to accept a change as real
-            area_threshold
+            block_size: Number of rows to classify at a time. Defaults to 512.
+
+        Returns:
+            A uint8 array of change codes (see CHANGE_CODES), with nodata_byte where no change type applies, and a boolean array of pixels where intensity of change is undefined (e.g. where AGB_t1 is 0).
         '''
 
-        # Only run processing if not already done
-        if not hasattr(self, 'ChangeType'):
+        AGB_t1, AGB_t2 = np.ma.getdata(self.tile_t1.getAGB()), np.ma.getdata(self.tile_t2.getAGB())
+        WC_t1, WC_t2 = np.ma.getdata(self.tile_t1.getWoodyCover()), np.ma.getdata(self.tile_t2.getWoodyCover())
 
-            # Pixels that move from forest to nonforest (F_NF) or vice versa (NF_F)
-            F_NF = np.logical_and(self.tile_t1.getWoodyCover(), self.tile_t2.getWoodyCover() == False)
-            NF_F = np.logical_and(self.tile_t1.getWoodyCover() == False, self.tile_t2.getWoodyCover())
+        # Thresholds are compared as 0-d arrays, as masked array comparisons do
+        intensity_threshold, magnitude_threshold = np.asarray(self.change_intensity_threshold), np.asarray(self.change_magnitude_threshold)
+        deforestation_threshold = np.asarray(self.deforestation_threshold)
 
-            # Pixels that remain forest (F_F) or nonforest (NF_NF)
-            F_F = np.logical_and(self.tile_t1.getWoodyCover(), self.tile_t2.getWoodyCover())
-            NF_NF = np.logical_and(self.tile_t1.getWoodyCover() == False, self.tile_t2.getWoodyCover() == False)
+        blocks = [slice(ymin, min(ymin + block_size, self.ySize)) for ymin in range(0, self.ySize, block_size)]
 
-            # Get pixels of change greater than intensity threshold
-            CHANGE_INTENSITY = np.logical_or((self.getAGBChange() / self.tile_t1.getAGB()) >= self.change_intensity_threshold, (self.getAGBChange() / self.tile_t1.getAGB()) < (- self.change_intensity_threshold))
+        # Pixels that meet the intensity and magnitude thresholds, and pixels where intensity of change is undefined (e.g. where AGB_t1 is 0)
+        CHANGE = np.zeros((self.ySize, self.xSize), dtype = bool)
+        UNDEFINED = np.zeros((self.ySize, self.xSize), dtype = bool)
 
-            # Get pixels of change greater than magnitude threshold
-            CHANGE_MAGNITUDE = np.logical_or(self.getAGBChange() >= self.change_magnitude_threshold, self.getAGBChange() < (- self.change_magnitude_threshold))
+        for rows in blocks:
 
-            CHANGE = np.logical_and(CHANGE_INTENSITY, CHANGE_MAGNITUDE)
-            NOCHANGE = CHANGE == False
+            AGB_change, intensity, UNDEFINED[rows] = self.__getChangeIntensity(rows)
 
-            # Trajectory (changes can be positive or negative)
-            DECREASE = self.tile_t2.getAGB() < self.tile_t1.getAGB()
-            INCREASE = self.tile_t2.getAGB() >= self.tile_t1.getAGB()
+            CHANGE[rows] = np.logical_and(np.logical_or(intensity >= intensity_threshold, intensity < (- intensity_threshold)),
+                                          np.logical_or(AGB_change >= magnitude_threshold, AGB_change < (- magnitude_threshold)))
 
-            # Get a minimum pixel extent. Loss/Gain events much have a spatial extent greater than min_pixels, and not occur in nonforest.
-            if self.change_area_threshold > 0:
+        # Get a minimum pixel extent. Loss/Gain events much have a spatial extent greater than min_pixels, and not occur in nonforest.
+        if self.change_area_threshold > 0:
 
-                min_pixels = int(round(self.change_area_threshold / (self.yRes * self.xRes * 0.0001)))
+            min_pixels = int(round(self.change_area_threshold / (self.yRes * self.xRes * 0.0001)))
 
-                # Get areas of change that meet minimum area requirement (use 'change' pixels for area measurement)
-                if self.combine_areas:
-                    CHANGE_INCREASE, _ = biota.indices.getContiguousAreas(CHANGE & INCREASE & (NF_F | F_F), True, min_pixels = min_pixels, contiguity = self.contiguity)
-                    CHANGE_DECREASE, _ = biota.indices.getContiguousAreas(CHANGE & DECREASE & (F_NF | F_F), True, min_pixels = min_pixels, contiguity = self.contiguity)
-                    CHANGE = np.logical_or(CHANGE_INCREASE, CHANGE_DECREASE)
-                    NOCHANGE = CHANGE == False
-                else:
-                    CHANGE_DEF, _ = biota.indices.getContiguousAreas(CHANGE & DECREASE & F_NF, True, min_pixels = min_pixels, contiguity = self.contiguity)
-                    CHANGE_DEG, _ = biota.indices.getContiguousAreas(CHANGE & DECREASE & F_F, True, min_pixels = min_pixels, contiguity = self.contiguity)
-                    CHANGE_GRO, _ = biota.indices.getContiguousAreas(CHANGE & INCREASE & F_F, True, min_pixels = min_pixels, contiguity = self.contiguity)
-                    CHANGE_AFF, _ = biota.indices.getContiguousAreas(CHANGE & INCREASE & NF_F, True, min_pixels = min_pixels, contiguity = self.contiguity)
-                    CHANGE = np.logical_or(np.logical_or(CHANGE_DEF, CHANGE_DEG), np.logical_or(CHANGE_GRO, CHANGE_AFF))
-                    NOCHANGE = CHANGE == False
+            # Masked pixels and undefined intensities never form part of a change area
+            valid = np.logical_or(self.mask, UNDEFINED) == False
+
+            if self.combine_areas:
+                groups = {'increase': ('INCREASE', ['NF_F', 'F_F']), 'decrease': ('DECREASE', ['F_NF', 'F_F'])}
+            else:
+                groups = {'deforestation': ('DECREASE', ['F_NF']), 'degradation': ('DECREASE', ['F_F']), 'growth': ('INCREASE', ['F_F']), 'afforestation': ('INCREASE', ['NF_F'])}
+
+            candidates = {group: np.zeros((self.ySize, self.xSize), dtype = bool) for group in groups}
+
+            for rows in blocks:
+                trajectory = {'DECREASE': AGB_t2[rows] < AGB_t1[rows], 'INCREASE': AGB_t2[rows] >= AGB_t1[rows]}
+                transition = self.__getForestTransitions(WC_t1[rows], WC_t2[rows])
+                for group, (direction, transitions) in groups.items():
+                    candidates[group][rows] = CHANGE[rows] & valid[rows] & trajectory[direction] & np.logical_or.reduce([transition[t] for t in transitions])
+
+            # Get areas of change that meet minimum area requirement (use 'change' pixels for area measurement)
+            CHANGE = np.zeros((self.ySize, self.xSize), dtype = bool)
+            for group in groups:
+                CHANGE |= biota.indices.getContiguousAreas(candidates.pop(group), True, min_pixels = min_pixels, contiguity = self.contiguity)[0]
+
+        change_code = np.zeros((self.ySize, self.xSize), dtype = np.uint8)
+
+        for rows in blocks:
+
+            F_NF, NF_F, F_F, NF_NF = [self.__getForestTransitions(WC_t1[rows], WC_t2[rows])[t] for t in ['F_NF', 'NF_F', 'F_F', 'NF_NF']]
+
+            # Undefined intensities are neither change nor no change
+            CHANGE_block, NOCHANGE = CHANGE[rows], (CHANGE[rows] | UNDEFINED[rows]) == False
+
+            # Trajectory (changes can be positive or negative)
+            DECREASE = AGB_t2[rows] < AGB_t1[rows]
+            INCREASE = AGB_t2[rows] >= AGB_t1[rows]
 
             # Deforestation can be dramatic; allow a separate treshold to specify an end-biomass for deforestation
-            DEFORESTED = self.tile_t2.getAGB() < self.deforestation_threshold
+            DEFORESTED = AGB_t2[rows] < deforestation_threshold
+
+            change_code[rows] = self.__getChangeCode(F_NF, NF_F, F_F, NF_NF, CHANGE_block, NOCHANGE, DECREASE, INCREASE, DEFORESTED)
+
+        return change_code, UNDEFINED
+
+    def __getChangeCode(self, F_NF, NF_F, F_F, NF_NF, CHANGE, NOCHANGE, DECREASE, INCREASE, DEFORESTED):
+        '''
+        Get the change code (see CHANGE_CODES) that applies to each element of a set of boolean arrays describing forest transition, change and its trajectory.
+        '''
+
+        # Conditions in reverse order of precedence, as the first that applies sets the code
+        return np.select([NF_F & CHANGE,
+                          F_F & CHANGE & INCREASE,
+                          (F_F | NF_F) & NOCHANGE & INCREASE,
+                          (F_F | F_NF) & NOCHANGE & DECREASE,
+                          (F_F & CHANGE & DECREASE) | (F_NF & CHANGE & (DEFORESTED == False)),
+                          F_NF & CHANGE & DEFORESTED,
+                          NF_NF],
+                         [CHANGE_CODES[ct] for ct in ['afforestation', 'growth', 'minorgain', 'minorloss', 'degradation', 'deforestation', 'nonforest']],
+                         default = self.nodata_byte)
+
+    def __getChangeIntensity(self, rows):
+        '''
+        Get change in AGB, proportional change in AGB (intensity), and pixels where intensity is undefined (e.g. where AGB_t1 is 0) for a block of rows. These don't depend on change thresholds, so are read from self.change_intensity where sweep() has already calculated them.
+        '''
+
+        if hasattr(self, 'change_intensity'):
+            return [array[rows] for array in self.change_intensity]
+
+        AGB_t1, AGB_t2 = np.ma.getdata(self.tile_t1.getAGB())[rows], np.ma.getdata(self.tile_t2.getAGB())[rows]
 
-            change_type = {}
+        AGB_change = AGB_t2 - AGB_t1
 
-            # These are all the possible definitions. Note: they *must* add up to one.
-            change_type['deforestation'] = F_NF & CHANGE & DEFORESTED
-            change_type['degradation'] = (F_F & CHANGE & DECREASE) | (F_NF & CHANGE & (DEFORESTED == False))
-            change_type['minorloss'] = (F_F | F_NF) & NOCHANGE & DECREASE
+        # Identify undefined intensities as masked array division does, which leaves AGB_change in their place
+        with np.errstate(all = 'ignore'):
+            intensity = AGB_change / AGB_t1
+            undefined = np.logical_or(np.abs(AGB_change) * np.finfo(float).tiny >= np.abs(AGB_t1), np.isfinite(intensity) == False)
+            intensity[undefined] = AGB_change[undefined]
 
-            change_type['afforestation'] = NF_F & CHANGE
-            change_type['growth'] = F_F & CHANGE & INCREASE
-            change_type['minorgain'] = (F_F | NF_F) & NOCHANGE & INCREASE
+        return AGB_change, intensity, undefined
+
+    def __getForestTransitions(self, WC_t1, WC_t2):
+        '''
+        Get pixels that move from forest to nonforest (F_NF) or vice versa (NF_F), and pixels that remain forest (F_F) or nonforest (NF_NF).
+        '''
+
+        return {'F_NF': WC_t1 & (WC_t2 == False), 'NF_F': (WC_t1 == False) & WC_t2, 'F_F': WC_t1 & WC_t2, 'NF_NF': (WC_t1 == False) & (WC_t2 == False)}
+
+    def getChangeType(self, output = False, show = False):
+        '''
+        Returns pixels that meet change detection thresholds for country.
 
-            change_type['nonforest'] = NF_NF
+        Args:
+            forest_threshold = threshold above which a pixel is forest
+            intensity_threshold = threshold of proportional change with which to accept a change as real
+            area_threshold
+        '''
 
-            # Also produce a code for output
-            change_code = np.zeros((self.ySize, self.xSize), dtype = np.int8) + self.nodata_byte
+        # Only run processing if not already done
+        if not hasattr(self, 'ChangeType'):
 
-            change_code[change_type['nonforest'].data] = 0
-            change_code[change_type['deforestation'].data] = 1
-            change_code[change_type['degradation'].data] = 2
-            change_code[change_type['minorloss'].data] = 3
-            change_code[change_type['minorgain'].data] = 4
-            change_code[change_type['growth'].data] = 5
-            change_code[change_type['afforestation'].data] = 6
+            self.ChangeCode, self.undefined = self.__classifyChange()
 
-            # Save to class
-            self.ChangeType = change_type
-            self.ChangeCode = change_code
+            # Boolean arrays for each change type are only built when requested
+            self.ChangeType = _ChangeTypes(self)
 
         # TO FIX (include mask)
         #for ct in ['nonforest', 'deforestation', 'degradation', 'minorloss', 'minorgain', 'growth', 'afforestation']:
@@ -1032,45 +1515,67 @@ class LoadChange(object):
 
         return self.ChangeType
 
-    def getRiskMap(self, output = False, show = False, buffer_size = 50.):
+    def __getDeforestation(self):
         '''
-        Fuction to return 'low' 'medium' and 'high' risks of deforestation, based on buffers around change locations.
-
-        Authors: Samuel Bowers (University of Edinburgh) and Muri Soares (Fundo Nacional de Desenvolvimento Sustentavel)
+        Get pixels of deforestation, and pixels that would be deforestation without a deforestation_threshold, from a single classification of change type.
         '''
 
-        # Get change type for each pixel
-        change_type = self.getChangeType()
+        self.getChangeType()
 
-        # Extract 'deforestation' and 'degradation' pixels
-        deforestation = change_type['deforestation'].astype(np.int8)
+        deforestation = self.ChangeCode == CHANGE_CODES['deforestation']
 
-        # Repeat change detection, but with no minimum change area threshold. Only process if deforestation_threshold exists
+        # Only the deforestation rule depends on deforestation_threshold. Without it, forest loss ends below the forest threshold, whether classified as deforestation or degradation.
         if self.deforestation_threshold != self.tile_t1.forest_threshold:
-            change_type_noDF = LoadChange(self.tile_t1, self.tile_t2, change_intensity_threshold = self.change_intensity_threshold, \
-                    change_magnitude_threshold = self.change_magnitude_threshold, change_area_threshold = self.change_area_threshold, \
-                    deforestation_threshold = None, contiguity = self.contiguity, output_dir = self.output_dir).getChangeType()
-            deforestation_noDF = change_type_noDF['deforestation'].astype(np.int8)
+            F_NF = self.__getForestTransitions(np.ma.getdata(self.tile_t1.getWoodyCover()), np.ma.getdata(self.tile_t2.getWoodyCover()))['F_NF']
+            deforestation_noDF = np.isin(self.ChangeCode, [CHANGE_CODES['deforestation'], CHANGE_CODES['degradation']]) & F_NF & (np.ma.getdata(self.tile_t2.getAGB()) < np.asarray(self.tile_t1.forest_threshold))
         else:
-            deforestation_noDF = change_type['deforestation'].astype(np.int8)
+            deforestation_noDF = deforestation
+
+        return deforestation, deforestation_noDF
 
-        # Set up output image
-        risk_map = np.zeros_like(deforestation).astype(np.int8)
+    def getRiskMaps(self, buffer_sizes = [50.], output = False):
+        '''
+        Get deforestation risk maps (see getRiskMap()) for several buffer sizes at once. Change type is classified once, and all buffers are taken from a single distance transform.
+
+        Args:
+            buffer_sizes: A list of buffer sizes (m) around deforestation pixels that define 'low' risk. Defaults to [50.].
+            output: Set True to output a GeoTiff of each risk map, named with its buffer size (e.g. 'RiskMap50m').
+
+        Returns:
+            A dictionary of buffer size: risk map.
+        '''
+
+        deforestation, deforestation_noDF = self.__getDeforestation()
 
         # High risk of change
-        risk_map[deforestation == 1] = 1
+        risk_map = deforestation.astype(np.int8)
 
         # Medium risk of change (no deforestation_threshold)
-        risk_map[np.logical_and(risk_map == 0, deforestation_noDF == 1)] = 2
+        risk_map[np.logical_and(risk_map == 0, deforestation_noDF)] = 2
+
+        # Low risk of change, from the distance to deforestation
+        distance = biota.mask.getBufferDistance(np.logical_or(deforestation, deforestation_noDF), xRes = self.xRes, yRes = self.yRes)
+
+        risk_maps = {}
 
-        # Low risk of change
-        low_dilate = scipy.ndimage.morphology.binary_dilation((np.logical_or(deforestation == 1, deforestation_noDF == 1)).astype(np.int8), iterations = int(round(buffer_size / ((self.tile_t1.xRes + self.tile_t1.yRes) / 2.), 0))) # 50 m buffer
+        for buffer_size in buffer_sizes:
 
-        risk_map[np.logical_and(risk_map == 0, low_dilate)] = 3
+            buffer = distance <= buffer_size
 
-        self.risk_map = np.ma.array(risk_map, mask = self.mask)
+            risk_maps[buffer_size] = np.ma.array(np.where(np.logical_and(risk_map == 0, buffer), np.int8(3), risk_map), mask = self.mask)
 
-        self.risk_map.mask = self.mask
+            if output: self.__outputGeoTiff(risk_maps[buffer_size], 'RiskMap%gm'%buffer_size)
+
+        return risk_maps
+
+    def getRiskMap(self, output = False, show = False, buffer_size = 50.):
+        '''
+        Fuction to return 'low' 'medium' and 'high' risks of deforestation, based on buffers around change locations.
+
+        Authors: Samuel Bowers (University of Edinburgh) and Muri Soares (Fundo Nacional de Desenvolvimento Sustentavel)
+        '''
+
+        self.risk_map = self.getRiskMaps(buffer_sizes = [buffer_size])[buffer_size]
 
         if output: self.__outputGeoTiff(self.risk_map,'RiskMap')
 
@@ -1078,12 +1583,17 @@ class LoadChange(object):
 
         return self.risk_map
 
-    def __sumChange(self, change_type, scale = 1):
+    def __sumChange(self, weights = None):
         '''
-        Function for scaling then summing and (optionally) scaling change statistics.
+        Function for counting (or summing weights of) unmasked pixels of each change type from ChangeCode. Pixels where intensity of change is undefined are only included in nonforest.
         '''
 
-        return {k: np.sum(v * scale) for k, v in list(change_type.items())}
+        valid = self.mask == False
+        defined = np.logical_and(valid, self.undefined == False)
+
+        totals, totals_valid = [np.bincount(self.ChangeCode[pixels], weights = None if weights is None else weights[pixels], minlength = 256) for pixels in [defined, valid]]
+
+        return {change_type: totals_valid[code] if change_type == 'nonforest' else totals[code] for change_type, code in CHANGE_CODES.items()}
 
     def getAreaSum(self, proportion = False, output = False):
         '''
@@ -1091,16 +1601,16 @@ class LoadChange(object):
         '''
 
         # Classify change type
-        change_type = self.getChangeType()
+        self.getChangeType()
 
         # Get area change in units of ha/pixel
-        change_hectares = (self.mask == False) * (self.xRes * self.yRes * 0.0001)
+        pixel_hectares = self.xRes * self.yRes * 0.0001
 
-        totals = self.__sumChange(change_type, scale = change_hectares)
+        totals = {change: count * pixel_hectares for change, count in self.__sumChange().items()}
 
         if proportion:
             for change in totals:
-                totals[change] = totals[change] / change_hectares.sum()
+                totals[change] = totals[change] / ((self.mask == False).sum() * pixel_hectares)
 
         if output: print('TODO')
 
@@ -1115,12 +1625,12 @@ class LoadChange(object):
         '''
 
         # Classify change type
-        change_type = self.getChangeType()
+        self.getChangeType()
 
         # Get AGB change in units of tC/pixel
-        change_AGB = self.getAGBChange() * (self.xRes * self.yRes * 0.0001)
+        change_AGB = np.ma.getdata(self.getAGBChange()) * (self.xRes * self.yRes * 0.0001)
 
-        totals = self.__sumChange(change_type, scale = change_AGB)
+        totals = self.__sumChange(weights = change_AGB)
 
         if proportion:
             for change_type in totals:
@@ -1131,6 +1641,221 @@ class LoadChange(object):
         return totals
 
 
+    def sweep(self, param_grid, n_workers = 1):
+        """
+        Calculate change statistics for every combination of a set of change thresholds, for sensitivity analysis. AGB, woody cover and change intensity are calculated once and shared by all combinations.
+
+        Args:
+            param_grid: A dictionary of parameter name: list of values to test. Parameters can be any of 'change_intensity_threshold', 'change_magnitude_threshold', 'change_area_threshold', 'deforestation_threshold' and 'combine_areas'. Those not included keep the values of this LoadChange() object.
+            n_workers: Number of threads to evaluate combinations with. Defaults to 1.
+
+        Returns:
+            A list with a dictionary for each combination, containing the value of each parameter in param_grid, and the outputs of getAreaSum() ('AreaSum') and getAGBSum() ('AGBSum').
+
+        For example, to test three intensity thresholds with and without a 1 ha minimum change area:
+            results = tile_change.sweep({'change_intensity_threshold': [0.1, 0.2, 0.3], 'change_area_threshold': [0, 1]})
+        """
+
+        params = ['change_intensity_threshold', 'change_magnitude_threshold', 'change_area_threshold', 'deforestation_threshold', 'combine_areas']
+
+        for param in param_grid:
+            assert param in params, "Parameters in param_grid must be one of %s. You input %s."%(', '.join(params), param)
+        assert type(n_workers) == int and n_workers >= 1, "Number of workers must be a positive integer."
+
+        # Arrays that don't depend on change thresholds
+        for tile in [self.tile_t1, self.tile_t2]:
+            tile.getWoodyCover()
+
+        change_intensity = self.__getChangeIntensity(slice(None))
+
+        names = list(param_grid.keys())
+        combinations = [dict(zip(names, values)) for values in itertools.product(*[param_grid[name] for name in names])]
+
+        def _evaluate(combination):
+
+            kwargs = {param: getattr(self, param) for param in params}
+            kwargs.update(combination)
+
+            tile_change = LoadChange(self.tile_t1, self.tile_t2, contiguity = self.contiguity, output_dir = self.output_dir, output_profile = self.output_profile, async_output = self.async_output, **kwargs)
+            tile_change.mask = self.mask
+            tile_change.change_intensity = change_intensity
+
+            result = dict(combination)
+            result['AreaSum'] = tile_change.getAreaSum()
+            result['AGBSum'] = tile_change.getAGBSum()
+
+            return result
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers = n_workers) as executor:
+            results = list(executor.map(_evaluate, combinations))
+
+        return results
+
+    def getJointHistogram(self, bins = 100, agb_range = None, block_size = 512):
+        """
+        Build a 2D histogram of AGB at t1 and t2 over unmasked pixels, for estimating change statistics with estimateChangeSum(). Pixels are counted separately for each combination of woody cover at t1 and t2, and weighted by AGB change.
+
+        Args:
+            bins: Number of bins, or a sequence of bin edges (tC/ha), applied to both AGB_t1 and AGB_t2. Defaults to 100.
+            agb_range: A tuple of (min, max) AGB to divide into bins. AGB outside this range is counted in open-ended bins at either end. Defaults to the range of unmasked AGB.
+            block_size: Number of rows to bin at a time. Defaults to 512.
+
+        Returns:
+            A dictionary with bin 'edges', and 'count', 'AGBChange' and 'AbsAGBChange' arrays of shape (woody cover t1, woody cover t2, AGB_t1 bin, AGB_t2 bin), and the number of unmasked pixels with non-finite AGB ('invalid').
+        """
+
+        params = (bins if np.ndim(bins) == 0 else tuple(bins), agb_range)
+
+        # Don't rebuild with the same binning
+        if hasattr(self, 'JointHistogram') and self.JointHistogram['params'] == params: return self.JointHistogram
+
+        AGB_t1, AGB_t2 = np.ma.getdata(self.tile_t1.getAGB()), np.ma.getdata(self.tile_t2.getAGB())
+        WC_t1, WC_t2 = np.ma.getdata(self.tile_t1.getWoodyCover()), np.ma.getdata(self.tile_t2.getWoodyCover())
+
+        valid = np.logical_and(self.mask == False, np.logical_and(np.isfinite(AGB_t1), np.isfinite(AGB_t2)))
+
+        if np.ndim(bins) == 0:
+            if agb_range is None: agb_range = (min(AGB_t1[valid].min(), AGB_t2[valid].min()), max(AGB_t1[valid].max(), AGB_t2[valid].max())) if valid.any() else (0., 1.)
+            edges = np.linspace(agb_range[0], agb_range[1], int(bins) + 1)
+        else:
+            edges = np.asarray(bins, dtype = np.float64)
+
+        assert edges.ndim == 1 and edges.shape[0] >= 2 and np.all(np.diff(edges) > 0), "Bin edges must be monotonically increasing."
+
+        # Bin 0 and bin n + 1 are open ended, for AGB outside of the edges
+        n = edges.shape[0] + 1
+
+        def _getBin(AGB):
+            index = np.searchsorted(edges, AGB, side = 'right')
+            index[AGB == edges[-1]] = n - 2
+            return index
+
+        count, AGB_change, abs_AGB_change = [np.zeros(4 * n * n, dtype = np.float64) for i in range(3)]
+
+        for ymin in range(0, self.ySize, block_size):
+
+            rows = slice(ymin, min(ymin + block_size, self.ySize))
+            valid_block = valid[rows]
+
+            a1, a2 = AGB_t1[rows][valid_block], AGB_t2[rows][valid_block]
+
+            index = (((WC_t1[rows][valid_block] * 2 + WC_t2[rows][valid_block]) * n + _getBin(a1)) * n) + _getBin(a2)
+
+            count += np.bincount(index, minlength = 4 * n * n)
+            AGB_change += np.bincount(index, weights = a2 - a1, minlength = 4 * n * n)
+            abs_AGB_change += np.bincount(index, weights = np.abs(a2 - a1), minlength = 4 * n * n)
+
+        self.JointHistogram = {'params': params, 'edges': edges, 'count': count.reshape(2, 2, n, n), 'AGBChange': AGB_change.reshape(2, 2, n, n),
+                               'AbsAGBChange': abs_AGB_change.reshape(2, 2, n, n), 'invalid': int((self.mask == False).sum() - valid.sum())}
+
+        return self.JointHistogram
+
+    def estimateChangeSum(self, change_intensity_threshold = None, change_magnitude_threshold = None, deforestation_threshold = None, forest_threshold = None):
+        """
+        Estimate the area (ha) and AGB change (tC) of each change type from the joint histogram of AGB at t1 and t2 (see getJointHistogram()), without reclassifying the tile. Estimates correspond to getAreaSum() and getAGBSum() with a change_area_threshold of 0.
+
+        Each histogram bin is classified at its centre. Bins where any of the change conditions differ between the corners of the bin may contain pixels of more than one change type, so the difference between estimated and exact totals for any change type is no greater than the area and absolute AGB change of these bins. Pixels with non-finite AGB are only included in the area error bound.
+
+        Args:
+            change_intensity_threshold: Defaults to the value of this LoadChange() object.
+            change_magnitude_threshold: Defaults to the value of this LoadChange() object.
+            deforestation_threshold: Defaults to the value of this LoadChange() object.
+            forest_threshold: Threshold of AGB that separates forest from nonforest. Defaults to woody cover of the input tiles. Can only be set where the input tiles have no area_threshold.
+
+        Returns:
+            A dictionary with estimates of getAreaSum() ('AreaSum') and getAGBSum() ('AGBSum'), and their error bounds ('AreaError', in ha, and 'AGBError', in tC).
+        """
+
+        if change_intensity_threshold is None: change_intensity_threshold = self.change_intensity_threshold
+        if change_magnitude_threshold is None: change_magnitude_threshold = self.change_magnitude_threshold
+        if deforestation_threshold is None: deforestation_threshold = self.deforestation_threshold
+
+        assert forest_threshold is None or self.tile_t1.area_threshold == 0, "forest_threshold can only be set where input tiles have an area_threshold of 0."
+
+        # Use the existing histogram, whatever its binning
+        histogram = self.JointHistogram if hasattr(self, 'JointHistogram') else self.getJointHistogram()
+
+        bounds = np.concatenate([[-np.inf], histogram['edges'], [np.inf]])
+        n = bounds.shape[0] - 1
+
+        # Enlarge bins slightly, so that bins that touch a threshold within floating point rounding are treated as ambiguous
+        tolerance = 1e-6 * np.abs(histogram['edges']).max()
+        lower, upper = bounds[:-1] - tolerance, bounds[1:] + tolerance
+
+        def _getConditions(a1, a2):
+            with np.errstate(all = 'ignore'):
+                AGB_change, intensity = a2 - a1, (a2 - a1) / a1
+            conditions = {'CHANGE': np.logical_and(np.logical_or(intensity >= change_intensity_threshold, intensity < (- change_intensity_threshold)),
+                                                   np.logical_or(AGB_change >= change_magnitude_threshold, AGB_change < (- change_magnitude_threshold))),
+                          'DECREASE': a2 < a1, 'INCREASE': a2 >= a1, 'DEFORESTED': a2 < deforestation_threshold}
+            if forest_threshold is not None:
+                conditions['F_t1'], conditions['F_t2'] = np.broadcast_arrays(a1 >= forest_threshold, a2 >= forest_threshold)
+            return conditions
+
+        # Conditions at each corner of each bin, with AGB_t1 on axis 0 and AGB_t2 on axis 1
+        corners = [_getConditions(a1[:, None], a2[None, :]) for a1 in [lower, upper] for a2 in [lower, upper]]
+
+        # Intensity changes sign where AGB_t1 is 0, and open-ended bins have no corners
+        ambiguous = (lower[:, None] <= 0) & (upper[:, None] >= 0) | np.isinf(bounds[:-1] + bounds[1:])[:, None] | np.isinf(bounds[:-1] + bounds[1:])[None, :]
+        for condition in corners[0]:
+            ambiguous |= np.any([corner[condition] != corners[0][condition] for corner in corners[1:]], axis = 0)
+
+        # Classify each bin at its centre, or its finite edge
+        centre = np.where(np.isinf(bounds[:-1]), bounds[1:], np.where(np.isinf(bounds[1:]), bounds[:-1], (bounds[:-1] + bounds[1:]) / 2.))
+        conditions = _getConditions(centre[:, None], centre[None, :])
+
+        pixel_hectares = self.xRes * self.yRes * 0.0001
+
+        AreaSum, AGBSum = {change_type: 0. for change_type in CHANGE_CODES}, {change_type: 0. for change_type in CHANGE_CODES}
+
+        for WC_t1, WC_t2 in itertools.product([False, True], repeat = 2):
+
+            if forest_threshold is None:
+                F_t1, F_t2 = np.full((n, n), WC_t1), np.full((n, n), WC_t2)
+            else:
+                F_t1, F_t2 = conditions['F_t1'], conditions['F_t2']
+
+            transition = self.__getForestTransitions(F_t1, F_t2)
+
+            change_code = self.__getChangeCode(transition['F_NF'], transition['NF_F'], transition['F_F'], transition['NF_NF'], conditions['CHANGE'], conditions['CHANGE'] == False,
+                                               conditions['DECREASE'], conditions['INCREASE'], conditions['DEFORESTED'])
+
+            count = np.bincount(change_code.ravel(), weights = histogram['count'][int(WC_t1), int(WC_t2)].ravel(), minlength = 256)
+            AGB_change = np.bincount(change_code.ravel(), weights = histogram['AGBChange'][int(WC_t1), int(WC_t2)].ravel(), minlength = 256)
+
+            for change_type, code in CHANGE_CODES.items():
+                AreaSum[change_type] += count[code] * pixel_hectares
+                AGBSum[change_type] += AGB_change[code] * pixel_hectares
+
+        AreaError = (histogram['count'].sum(axis = (0, 1))[ambiguous].sum() + histogram['invalid']) * pixel_hectares
+        AGBError = histogram['AbsAGBChange'].sum(axis = (0, 1))[ambiguous].sum() * pixel_hectares
+
+        return {'AreaSum': AreaSum, 'AGBSum': AGBSum, 'AreaError': AreaError, 'AGBError': AGBError}
+
+    def exportProducts(self, products = ['AGBChange', 'ChangeType', 'RiskMap'], output_name = 'Products', interleave = 'band'):
+        """
+        Write a set of change products in a single pass, as the bands of one GeoTiff file. Products that can't share a data type are written to one file per data type (e.g. 'ProductsFloat32' and 'ProductsByte').
+
+        Args:
+            products: A list of products, from 'AGBChange', 'Gamma0Change', 'ChangeType' and 'RiskMap'. Defaults to 'AGBChange', 'ChangeType' and 'RiskMap'.
+            output_name: Name to give output files. Defaults to 'Products'.
+            interleave: Set to 'band' to store bands separately, or 'pixel' to interleave bands by pixel. Defaults to 'band'.
+
+        Returns:
+            A dictionary with output filenames as keys, and lists of the products in each file as values.
+        """
+
+        def _getChangeCode():
+            self.getChangeType()
+            return self.ChangeCode
+
+        available = {'AGBChange': (lambda: self.getAGBChange(), gdal.GDT_Float32),
+                     'Gamma0Change': (lambda: self.getGamma0Change(), gdal.GDT_Float32),
+                     'ChangeType': (_getChangeCode, gdal.GDT_Byte),
+                     'RiskMap': (lambda: self.getRiskMap().astype(np.uint8), gdal.GDT_Byte)}
+
+        return _exportProducts(self, products, available, output_name = output_name, interleave = interleave)
+
     def __outputGeoTiff(self, data, output_name, dtype = 6):
         """
         Output a GeoTiff file.
@@ -1141,11 +1866,274 @@ class LoadChange(object):
 
         nodata = self.__getNodata(dtype = dtype)
 
-        # Write to disk
-        biota.IO.outputGeoTiff(data, filename, self.geo_t, self.proj, output_dir = self.output_dir, dtype = dtype, nodata = nodata)
+        # Write to disk, optionally in the background
+        write = biota.IO.outputGeoTiffAsync if self.async_output else biota.IO.outputGeoTiff
+
+        write(data, filename, self.geo_t, self.proj, output_dir = self.output_dir, dtype = dtype, nodata = nodata, profile = self.output_profile)
 
     def __showArray(self, data, title = '', cbartitle = '', vmin = None, vmax = None, cmap = None):
         '''
         '''
 
         biota.IO.showFigure(data, self.lat, self.lon, title = title, cbartitle = cbartitle, vmin = vmin, vmax = vmax, cmap = cmap)
+
+
+def _limitMemory(max_memory):
+    """
+    Limit the data segment of a worker process to max_memory MB, so that a tile that needs more fails with a MemoryError rather than exhausting memory shared with other workers.
+
+    RLIMIT_DATA (which on Linux includes anonymous memory maps, where numpy arrays are allocated) is limited rather than RLIMIT_AS, which also counts memory that is reserved but never used, such as thread stacks and file maps. An allocation that exceeds the limit in C code (e.g. GDAL) rather than numpy may abort the worker instead of raising a MemoryError, in which case the tiles the pool had not finished are recorded as failed with a BrokenProcessPool error.
+    """
+
+    import resource
+
+    if max_memory is not None:
+        limit = int(max_memory * 1e6)
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+
+
+def _processRegionTile(data_dir, lat, lon, year, products, tile_kwargs, forest_dir = None):
+    """
+    Load one tile of a region and output its products, in a worker process of LoadRegion.process(). Where forest_dir is specified, the tile's forest/nonforest pixels are saved there for biota.indices.labelRegion().
+
+    Returns:
+        A dictionary of product: output filename, and a dictionary of the tile's area (ha), forest area (ha) and total AGB (tC).
+    """
+
+    tile = LoadTile(data_dir, lat, lon, year, **tile_kwargs)
+
+    outputs = {}
+    for product in products:
+        getattr(tile, 'get' + product)(output = True)
+        outputs[product] = '%s/%s'%(os.path.abspath(tile.output_dir), tile.output_pattern%product)
+
+    valid = tile.mask == False
+    pixel_hectares = tile.xRes * tile.yRes * 0.0001
+
+    stats = {'Area': valid.sum() * pixel_hectares,
+             'ForestArea': np.logical_and(np.ma.getdata(tile.getWoodyCover()), valid).sum() * pixel_hectares,
+             'AGB': np.ma.getdata(tile.getAGB())[valid].sum(dtype = np.float64) * pixel_hectares}
+
+    if forest_dir is not None: biota.indices.saveForest(tile, forest_dir)
+
+    # GeoTiffs may be written in the background; wait for them to finish
+    biota.IO.flush()
+
+    return outputs, stats
+
+
+class LoadRegion(object):
+    """
+    Processes each of the ALOS mosaic tiles that cover a region, and mosaics their outputs.
+
+    Args:
+        data_dir: Directory containing ALOS mosaic data.
+        region: Path to a shapefile (in any projection), or a bounding box as (lonmin, latmin, lonmax, latmax) in WGS84 degrees.
+        years: A year, or a list of years.
+        field: Optionally, a field of the shapefile to select shapes with. Must be specified with value.
+        value: Optionally, the value of field that selects shapes.
+        n_processes: Number of tiles to process at once, each in a separate process. Defaults to 1.
+        max_memory: Optionally limit the memory (data segment) of each process to max_memory MB. Tiles that need more fail with a MemoryError. Defaults to no limit.
+        output_dir: Directory for output GeoTiffs and mosaics. Defaults to the current working directory.
+        **kwargs: Options passed to LoadTile() for each tile (e.g. forest_threshold, area_threshold, lee_filter, cache_dir).
+
+    For example, to output AGB and woody cover for tiles covering a shapefile in 2007 and 2010, with four processes of up to 4 GB each:
+        region = biota.LoadRegion('/path/to/data_dir/', '/path/to/region.shp', [2007, 2010], n_processes = 4, max_memory = 4000.)
+        mosaics = region.process(products = ['AGB', 'WoodyCover'])
+
+    Worker processes are started with 'spawn', so that they don't inherit the caches, threads and open files of the calling process. Scripts that call process() must do so under if __name__ == '__main__':.
+    """
+
+    def __init__(self, data_dir, region, years, field = None, value = None, n_processes = 1, max_memory = None, output_dir = os.getcwd(), **kwargs):
+        '''
+        Initialise
+        '''
+
+        if type(years) != list: years = [years]
+
+        assert os.path.isdir(os.path.expanduser(data_dir)), "Specified data directory (%s) does not exist"%str(data_dir)
+        assert os.path.isdir(os.path.expanduser(output_dir)), "Specified output directory (%s) does not exist"%str(output_dir)
+        assert type(region) == str or len(region) == 4, "Region must be a shapefile or a bounding box of (lonmin, latmin, lonmax, latmax)."
+        assert type(region) == str or (region[0] <= region[2] and region[1] <= region[3]), "Bounding box must be specified as (lonmin, latmin, lonmax, latmax)."
+        assert type(region) != str or os.path.isfile(os.path.expanduser(region)), "Specified shapefile (%s) does not exist"%str(region)
+        assert len(years) > 0 and all([type(year) == int for year in years]), "Years must be integers."
+        assert type(n_processes) == int and n_processes >= 1, "Number of processes must be a positive integer."
+        assert max_memory is None or max_memory > 0, "max_memory must be a positive number of MB."
+        assert 'output_dir' not in kwargs, "output_dir is set for all tiles by LoadRegion."
+
+        self.data_dir = os.path.expanduser(data_dir.rstrip('/'))
+        self.years = years
+        self.n_processes = n_processes
+        self.max_memory = max_memory
+        self.output_dir = os.path.expanduser(output_dir.rstrip('/'))
+
+        self.tile_kwargs = dict(kwargs, output_dir = self.output_dir)
+
+        # Identify the tiles that cover the region
+        if type(region) == str:
+            self.tiles = biota.mask.getTilesInShapefile(os.path.expanduser(region), field = field, value = value)
+        else:
+            self.tiles = sorted(biota.mask._getTilesInBBox(*region))
+
+    def process(self, products = ['AGB', 'WoodyCover'], output_name = 'Region'):
+        """
+        Processes each tile of the region, outputting products as GeoTiffs for each tile, and a VRT mosaic of each product for each year. Tiles that can't be processed (e.g. those without data, over the sea) are skipped, and recorded in self.failed.
+
+        Statistics for each year are recorded in self.stats: the number of tiles processed ('Tiles'), mapped area in ha ('Area'), forest area in ha ('ForestArea'), total AGB in tC ('AGB') and mean AGB in tC/ha ('AGBDensity'). Statistics for each tile are recorded in self.tile_stats.
+
+        Args:
+            products: A list of products, from 'Gamma0', 'AGB', 'WoodyCover' and 'ForestPatches'. Defaults to 'AGB' and 'WoodyCover'. ForestPatches are numbered across the whole region (see biota.indices.labelRegion()).
+            output_name: Name to give the VRT mosaics. Defaults to 'Region'.
+
+        Returns:
+            A dictionary of year: {product: VRT mosaic filename}.
+        """
+
+        import shutil
+        import tempfile
+
+        for product in products:
+            assert product in ['Gamma0', 'AGB', 'WoodyCover', 'ForestPatches'], "Products must be 'Gamma0', 'AGB', 'WoodyCover' or 'ForestPatches'. You input %s."%str(product)
+
+        # Forest patches can span tiles, so are labelled once all tiles are processed
+        tile_products = [product for product in products if product != 'ForestPatches']
+
+        filenames = {year: {product: [] for product in products} for year in self.years}
+
+        self.failed, self.tile_stats = {}, {}
+
+        # Workers save forest pixels for labelling patches, so that AGB isn't calculated again
+        forest_dir = tempfile.mkdtemp(dir = self.output_dir) if 'ForestPatches' in products else None
+
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers = self.n_processes, mp_context = multiprocessing.get_context('spawn'), initializer = _limitMemory, initargs = (self.max_memory,)) as executor:
+
+                futures = {executor.submit(_processRegionTile, self.data_dir, lat, lon, year, tile_products, self.tile_kwargs, forest_dir): (lat, lon, year) for year in self.years for lat, lon in self.tiles}
+
+                for future in concurrent.futures.as_completed(futures):
+
+                    try:
+                        outputs, stats = future.result()
+                    except Exception as e:
+                        self.failed[futures[future]] = str(e)
+                        continue
+
+                    self.tile_stats[futures[future]] = stats
+
+                    for product in tile_products:
+                        filenames[futures[future][2]][product].append(outputs[product])
+
+            if 'ForestPatches' in products:
+
+                for year in self.years:
+
+                    locations = [(lat, lon) for lat, lon, tile_year in sorted(self.tile_stats) if tile_year == year]
+
+                    if len(locations) == 0: continue
+
+                    temp_dir = tempfile.mkdtemp(dir = self.output_dir)
+
+                    try:
+                        # Labelled tiles are written to temp_dir rather than the tiles' output_dir
+                        patches = biota.indices.labelRegion(self.data_dir, locations, year, output_dir = temp_dir, forest_dir = forest_dir, **{k: v for k, v in self.tile_kwargs.items() if k != 'output_dir'})
+
+                        # Load one tile at a time, for its mask and georeferencing
+                        for lat, lon in locations:
+
+                            tile = LoadTile(self.data_dir, lat, lon, year, **self.tile_kwargs)
+
+                            # Patch IDs across a region can exceed the nodata value of a single tile
+                            biota.IO.outputGeoTiff(np.ma.array(np.load(patches[(lat, lon)]), mask = tile.mask), tile.output_pattern%'ForestPatches', tile.geo_t, tile.proj, output_dir = self.output_dir, dtype = gdal.GDT_Int32, nodata = -1, profile = tile.output_profile)
+
+                            filenames[year]['ForestPatches'].append('%s/%s'%(os.path.abspath(self.output_dir), tile.output_pattern%'ForestPatches'))
+
+                            del tile
+
+                    finally:
+                        shutil.rmtree(temp_dir)
+
+        finally:
+            if forest_dir is not None: shutil.rmtree(forest_dir)
+
+        # Mosaic each product
+        mosaics = {}
+        for year in self.years:
+            mosaics[year] = {}
+            for product in products:
+                if len(filenames[year][product]) == 0: continue
+                mosaics[year][product] = '%s/%s_%s_%s.vrt'%(os.path.abspath(self.output_dir), product, str(year), output_name)
+                vrt = gdal.BuildVRT(mosaics[year][product], sorted(filenames[year][product]))
+                vrt = None
+
+        # Sum statistics over the region
+        self.stats = {}
+        for year in self.years:
+            tile_stats = [stats for (lat, lon, tile_year), stats in self.tile_stats.items() if tile_year == year]
+            self.stats[year] = {'Tiles': len(tile_stats)}
+            for stat in ['Area', 'ForestArea', 'AGB']:
+                self.stats[year][stat] = float(sum([stats[stat] for stats in tile_stats]))
+            self.stats[year]['AGBDensity'] = self.stats[year]['AGB'] / self.stats[year]['Area'] if self.stats[year]['Area'] > 0 else np.nan
+
+        return mosaics
+
+
+def filterMultitemporal(tiles, polarisation = 'HV', units = 'natural', window_size = None, n_workers = None):
+    """
+    Applies the multitemporal speckle filter of Quegan et al. (2000) to tiles from the same location in different years, in place of each tile's own speckle filter. All years are filtered together, which reduces speckle more than filtering each year on its own, at a smaller window size.
+
+    Filtered gamma0 is held in memory by each tile, so that getGamma0(), getAGB() and products derived from them use it. Products already calculated by the tiles are released. While filtered gamma0 is held, the tiles' cached products are keyed on the multitemporal filter and its inputs (see tile.multitemporal), so that they aren't confused with those of the spatial filter. Releasing 'Gamma0' from a tile reverts it to its own speckle filter.
+
+    Args:
+        tiles: A list of LoadTile objects from the same location in different years, each with lee_filter = True.
+        polarisation: Polarisation to filter, 'HH' or 'HV'. Defaults to 'HV'.
+        units: Units of returned gamma0, 'natural' or 'decibels'. Defaults to 'natural'.
+        window_size: Size of the filter window. Must be an odd integer. Defaults to the window_size of the tiles.
+        n_workers: Number of threads to filter with. Defaults to the n_workers of the first tile.
+
+    Returns:
+        A list of filtered gamma0 masked arrays, one for each tile
+    """
+
+    assert len(tiles) >= 2, "The multitemporal filter requires at least two tiles."
+    assert polarisation == 'HH' or polarisation == 'HV', "Polarisation must be 'HH' or 'HV'. You input %s."%polarisation
+    assert len(set([tile.year for tile in tiles])) == len(tiles), "Each tile must be from a different year."
+
+    for tile in tiles:
+        assert tile.lat == tiles[0].lat and tile.lon == tiles[0].lon, "Input tiles must be from the same location."
+        assert tile.mask.shape == tiles[0].mask.shape and tile.geo_t == tiles[0].geo_t, "Input tiles must have the same size and geo_transform."
+        assert tile.precision == tiles[0].precision, "'precision' must be identical for all input tiles."
+        assert tile.lee_filter, "Input tiles must be loaded with lee_filter = True."
+
+    if window_size is None: window_size = tiles[0].window_size
+    if n_workers is None: n_workers = tiles[0].n_workers
+
+    dtype = tiles[0].dtype
+
+    # Calibrate DN to gamma0 in natural units, the input to the multitemporal filter
+    lut = biota.calibrate.getLUT(polarisation = polarisation, units = 'natural', dtype = dtype)
+
+    stack = []
+    for tile in tiles:
+        DN = tile.getDN(polarisation = polarisation)
+        stack.append(np.ma.array(biota.calibrate.applyLUT(lut, DN.data), mask = DN.mask))
+
+    stack = biota.filter.multitemporal_filter(stack, window_size = window_size, nodata_method = tiles[0].nodata_method, n_workers = n_workers)
+
+    # The filter, and the inputs and masks of every tile it was applied to
+    multitemporal = (polarisation, window_size, tiles[0].nodata_method, tuple([(tile.year, os.path.getmtime(tile.HV_path if polarisation == 'HV' else tile.HH_path), biota.cache.getMaskHash(tile.mask)) for tile in tiles]))
+
+    gamma0 = []
+    for tile, tile_gamma0 in zip(tiles, stack):
+
+        # Products derived from the spatially filtered gamma0 are out of date
+        for product in ['Gamma0', 'AGB', 'WoodyCover', 'ForestPatches']:
+            tile.release(product)
+
+        tile.multitemporal = multitemporal
+
+        # Hold filtered gamma0 in decibels, as getGamma0() does
+        tile.Gamma0 = {polarisation: dtype.type(10.) * np.ma.log10(tile_gamma0)}
+
+        gamma0.append(tile.getGamma0(polarisation = polarisation, units = units))
+
+    return gamma0
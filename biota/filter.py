@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import itertools
 import math
 import numpy as np
 import signal
@@ -11,89 +12,519 @@ import pdb
 This file contains scripts to filter ALOS data.
 """
 
-def enhanced_lee_filter(img, window_size = 5, n_looks = 16):
+
+# Registered speckle filters, as name: (function, units of gamma0 the filter is applied to)
+FILTERS = {}
+
+
+def register_filter(name, function, units = 'natural'):
+    '''
+    Registers a speckle filter, so that it can be selected by name (e.g. LoadTile(speckle_filter = name)).
+
+    Args:
+        name: Name of the filter.
+        function: A function that filters a masked array, with arguments (img, window_size, n_looks, nodata_method, n_workers, block_size).
+        units: Units of gamma0 that the filter should be applied to, 'natural' or 'decibels'. Defaults to 'natural', as filters for multiplicative speckle noise assume backscatter intensity.
+    '''
+
+    assert units in ['natural', 'decibels'], "Units must be 'natural' or 'decibels'. You input the value: %s"%str(units)
+
+    FILTERS[name] = (function, units)
+
+
+def get_filter(name):
+    '''
+    Returns a registered speckle filter.
+
+    Args:
+        name: Name of the filter, one of FILTERS.
+    Returns:
+        The filter function, and the units of gamma0 it should be applied to
+    '''
+
+    assert name in FILTERS, "Unknown speckle filter '%s'. Registered filters are: %s"%(str(name), ', '.join(sorted(FILTERS.keys())))
+
+    return FILTERS[name]
+
+
+def get_halo(window_size, nodata_method = 'nearest'):
+    '''
+    Number of rows either side of a block of an image that must be included to filter it as part of the whole image.
+    The speckle filter uses pixels within window_size // 2 of each pixel. With nodata_method 'nearest', masked pixels in that window are filled from their nearest unmasked neighbour, which may be a further sqrt(2) * (window_size // 2) pixels away.
+
+    Args:
+        window_size: Window size of the speckle filter.
+        nodata_method: Treatment of masked pixels by the speckle filter, 'nearest' or 'normalized'. Defaults to 'nearest'.
+    Returns:
+        An integer number of rows
+    '''
+
+    border = window_size // 2
+
+    if nodata_method == 'normalized': return border
+
+    return border + int(math.ceil(border * math.sqrt(2))) + 1
+
+
+def _window_mean(img, window_size = 3, footprint = None):
+    '''
+    Calculates the mean of a moving window. Square windows are calculated with a running sum along each axis in turn, so the cost doesn't depend on window size. Optionally specify a footprint, a boolean array that selects pixels from the window.
+    Sums are accumulated at double precision, and returned at the precision of img. The 'reflect' boundary of scipy.ndimage repeats the edge pixel, equivalent to boundary = 'symm' in scipy.signal.convolve2d.
+    '''
+
+    if footprint is not None:
+        return ndimage.correlate(img, (footprint / footprint.sum()).astype(img.dtype), mode = 'reflect')
+
+    img_mean = ndimage.uniform_filter1d(img, window_size, axis = -1, mode = 'reflect')
+
+    return ndimage.uniform_filter1d(img_mean, window_size, axis = -2, mode = 'reflect')
+
+
+def _window_statistics(data, mask, window_size = 3, nodata_method = 'nearest', footprint = None, variance = True):
+    '''
+    Calculates the mean and variance of a moving window. This is shared by all speckle filters.
+    Based on https://stackoverflow.com/questions/18419871/improving-code-efficiency-standard-deviation-on-sliding-windows
+    and http://nickc1.github.io/python,/matlab/2016/05/17/Standard-Deviation-(Filters)-in-Matlab-and-Python.html
+
+    Args:
+        data: A numpy array, with masked pixels filled (nodata_method 'nearest') or set to 0 (nodata_method 'normalized').
+        mask: A boolean array, True where data are masked.
+        window_size: Size of the moving window.
+        nodata_method: 'nearest' or 'normalized'. With 'normalized', window sums are divided by the number of unmasked pixels (normalized convolution).
+        footprint: Optionally specify a boolean array to select pixels from the window.
+        variance: Set False to calculate the mean only.
+    Returns:
+        The window mean, and the window variance where requested
+    '''
+
+    img_mean = _window_mean(data, window_size = window_size, footprint = footprint)
+
+    if nodata_method == 'normalized':
+        count = _window_mean((mask == False).astype(data.dtype), window_size = window_size, footprint = footprint)
+
+        # Windows without an unmasked pixel are masked in the output
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            img_mean = img_mean / count
+
+    if not variance: return img_mean
+
+    img_sq_mean = _window_mean(data * data, window_size = window_size, footprint = footprint)
+
+    if nodata_method == 'normalized':
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            img_sq_mean /= count
+
+    img_variance = img_sq_mean - img_mean * img_mean
+    img_variance[img_variance < 0] += 0.01 # Prevents divide by zero errors.
+
+    return img_mean, img_variance
+
+
+def _check_window_size(window_size, minimum = 3):
+    '''
+    Checks that a window size is an odd integer of at least minimum. This is called by _filter_blocks() for every filter, and before any setup that depends on the window size.
+    '''
+
+    assert isinstance(window_size, (int, np.integer)), "Window size must be an integer. You input the value: %s"%str(window_size)
+    assert (window_size % 2) == 1, "Window size must be an odd number. You input the value: %s"%str(window_size)
+    assert window_size >= minimum, "Window size must be at least %s. You input the value: %s"%(str(minimum), str(window_size))
+
+
+def _filter_blocks(img, filter_block, window_size = 5, nodata_method = 'nearest', n_workers = 1, block_size = 256):
+    '''
+    Applies a speckle filter to a masked array in blocks of rows, each with a halo of rows from get_halo(). Blocks are the same however many workers are used, so output is identical for any value of n_workers.
+
+    Args:
+        img: A masked array, or a stack of masked arrays with shape (dates, rows, columns)
+        filter_block: A function that filters a block, with arguments (data, mask), where data is a numpy array prepared according to nodata_method and mask is True where data are masked.
+        window_size: Window size of the speckle filter.
+        nodata_method: Treatment of masked pixels. Set to 'nearest' to fill masked pixels with their nearest unmasked neighbour before filtering, or 'normalized' to set masked pixels to 0 for normalized convolution.
+        n_workers: Number of threads to filter blocks with. Numeric kernels release the GIL, so blocks are filtered in parallel.
+        block_size: Number of rows in each block.
+    Returns:
+        A filtered masked array
+    '''
+
+    _check_window_size(window_size)
+    assert nodata_method in ['nearest', 'normalized'], "nodata_method must be 'nearest' or 'normalized'. You input the value: %s"%str(nodata_method)
+    assert type(n_workers) == int and n_workers >= 1, "Number of workers must be a positive integer. You input the value: %s"%str(n_workers)
+    assert type(block_size) == int and block_size >= 1, "Block size must be a positive integer. You input the value: %s"%str(block_size)
+
+    # Inner function to filter a block of rows (ymin to ymax), writing the result into img_filtered
+    def _filter_block(ymin, ymax):
+
+        # Load the block with its halo
+        ymin_halo, ymax_halo = max(ymin - halo, 0), min(ymax + halo, ySize)
+
+        block_mask = mask[..., ymin_halo:ymax_halo, :]
+
+        if nodata_method == 'nearest':
+            # Interpolate across nodata areas. No standard Python filters understand nodata values; this is a simplification
+            data = np.empty(block_mask.shape, dtype = img.dtype)
+            for date in np.ndindex(block_mask.shape[:-2]):
+                indices = ndimage.distance_transform_edt(block_mask[date], return_distances = False, return_indices = True)
+                data[date] = img.data[date][ymin_halo:ymax_halo][tuple(indices)]
+        else:
+            # Normalized convolution, where masked pixels are set to 0
+            data = np.where(block_mask, 0, img.data[..., ymin_halo:ymax_halo, :])
+
+        block_filtered = filter_block(data, block_mask)
+
+        # Remove the halo
+        block_filtered = block_filtered[..., ymin - ymin_halo:ymax - ymin_halo, :]
+        block_mask = np.logical_or(np.isnan(block_filtered), block_mask[..., ymin - ymin_halo:ymax - ymin_halo, :])
+
+        block_filtered[block_mask] = 0.
+
+        img_filtered[..., ymin:ymax, :] = block_filtered
+        img_filtered_mask[..., ymin:ymax, :] = block_mask
+
+    mask = np.ma.getmaskarray(img)
+    halo = get_halo(window_size, nodata_method = nodata_method)
+
+    img_filtered = np.empty_like(img.data)
+    img_filtered_mask = np.empty_like(mask)
+
+    ySize = img.shape[-2]
+
+    blocks = [(ymin, min(ymin + block_size, ySize)) for ymin in range(0, ySize, block_size)]
+
+    if n_workers == 1 or len(blocks) == 1:
+        for ymin, ymax in blocks:
+            _filter_block(ymin, ymax)
+
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers = min(n_workers, len(blocks))) as executor:
+            # Iterate over results to raise any exceptions
+            for result in executor.map(lambda block: _filter_block(*block), blocks):
+                pass
+
+    return np.ma.array(img_filtered, mask = img_filtered_mask)
+
+
+def enhanced_lee_filter(img, window_size = 5, n_looks = 16, nodata_method = 'nearest', n_workers = 1, block_size = 256):
     '''
     Filters a masked array with the enhanced lee filter.
 
     Based on formulation here: http://www.pcigeomatics.com/geomatica-help/concepts/orthoengine_c/Chapter_825.html
 
+    The filter is computed at the precision of img (e.g. float32 or float64). The image is filtered in blocks of rows, each with a halo of rows from get_halo(). Blocks are the same however many workers are used, so output is identical for any value of n_workers.
+
     Args:
         img: A masked array
         window_size: Must be an odd number. Defaults to 7, which appears to give the best results.
         n_looks: Equivalent number of looks. Defaults to 16, equivalent to native ENL of ALOS mosaic data.
+        nodata_method: Treatment of masked pixels. Set to 'nearest' to fill masked pixels with their nearest unmasked neighbour before filtering, or 'normalized' to calculate window statistics from unmasked pixels only (normalized convolution), which is faster, uses less memory and prevents filled values influencing pixels near the mask edge. Defaults to 'nearest'.
+        n_workers: Number of threads to filter blocks with. Numeric kernels release the GIL, so blocks are filtered in parallel. Defaults to 1.
+        block_size: Number of rows in each block. Defaults to 256.
     Returns:
         A masked array with a filtered verison of img
     '''
 
-    assert type(window_size == int), "Window size must be an integer. You input the value: %s"%str(window_size)
-    assert (window_size % 2) == 1, "Window size must be an odd number. You input the value: %s"%str(window_size)
-    assert window_size >= 3, "Window size must be at least 3. You input the value: %s"%str(window_size)
-
-    # Inner function to calculate mean with a moving window and a masked array
-    def _window_mean(img, window_size = 3):
-        '''
-        Based on https://stackoverflow.com/questions/18419871/improving-code-efficiency-standard-deviation-on-sliding-windows
-        '''
-        
-        from scipy import signal
-        
-        c1 = signal.convolve2d(img, np.ones((window_size, window_size)) / (window_size ** 2), boundary = 'symm')
-
-        border = math.floor(window_size / 2)
-        
-        return c1[border:-border, border:-border]
-
-    # Inner function to calculate standard deviation with a moving window and a masked array
-    def _window_stdev(img, window_size = 3):
-        '''
-        Based on https://stackoverflow.com/questions/18419871/improving-code-efficiency-standard-deviation-on-sliding-windows
-        and http://nickc1.github.io/python,/matlab/2016/05/17/Standard-Deviation-(Filters)-in-Matlab-and-Python.html
-        '''
-
-        from scipy import signal
-
-        c1 = signal.convolve2d(img, np.ones((window_size, window_size)) / (window_size ** 2), boundary = 'symm')
-        c2 = signal.convolve2d(img*img, np.ones((window_size, window_size)) / (window_size ** 2), boundary = 'symm')
-
-        border = math.floor(window_size / 2)
-
-        variance = c2 - c1 * c1
-        variance[variance < 0] += 0.01 # Prevents divide by zero errors.
-
-        return np.sqrt(variance)[border:-border, border:-border]
-    
-    
-    
     # Damping factor, set to 1 which is adequate for most SAR images
     k = 1
     cu = (1./n_looks) ** 0.5
     cmax =  (1 + (2./n_looks)) ** 0.5
 
-    # Interpolate across nodata areas. No standard Python filters understand nodata values; this is a simplification
+    # Inner function to filter a block of data
+    def _filter_block(data, mask):
+
+        img_mean, img_variance = _window_statistics(data, mask, window_size = window_size, nodata_method = nodata_method)
+
+        img_std = np.sqrt(img_variance)
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            ci = img_std / img_mean
+        ci[np.isfinite(ci) == False] = 0.
+
+        W = np.zeros_like(ci)
+
+        # There are three conditions in the enhanced lee filter
+        W[ci <= cu] = 1.
+        W[ci >= cmax] = 0.
+
+        sel = np.logical_and(ci > cu, ci < cmax)
+
+        W[sel] = np.exp((-k * (ci[sel] - cu)) / (cmax - ci[sel]))
+
+        return (img_mean * W) + (data * (1. - W))
+
+    return _filter_blocks(img, _filter_block, window_size = window_size, nodata_method = nodata_method, n_workers = n_workers, block_size = block_size)
+
+
+def refined_lee_filter(img, window_size = 7, n_looks = 16, nodata_method = 'nearest', n_workers = 1, block_size = 256):
+    '''
+    Filters a masked array with the refined lee filter (Lee, 1981). The Lee filter is applied with statistics from the half of each window on the more homogeneous side of the strongest edge, which preserves edges better than the Lee filter.
+
+    Edges are detected from the means of 3 x 3 subwindows at the corners, edges and centre of the window, in four orientations (horizontal, vertical and two diagonals). Windows are then split along the edge into eight directional half windows, each including the pixels on the edge.
+
+    Args:
+        img: A masked array
+        window_size: Must be an odd number of at least 5. Defaults to 7, the window size of the original formulation.
+        n_looks: Equivalent number of looks. Defaults to 16, equivalent to native ENL of ALOS mosaic data.
+        nodata_method: Treatment of masked pixels, 'nearest' or 'normalized', as in enhanced_lee_filter(). Defaults to 'nearest'.
+        n_workers: Number of threads to filter blocks with. Defaults to 1.
+        block_size: Number of rows in each block. Defaults to 256.
+    Returns:
+        A masked array with a filtered verison of img
+    '''
+
+    _check_window_size(window_size, minimum = 5)
+
+    cu2 = 1. / n_looks
+
+    border = window_size // 2
+    offset = border - 1
+
+    # Directional half windows, in pairs either side of each edge orientation. y increases downwards.
+    y, x = np.mgrid[-border:border + 1, -border:border + 1]
+
+    footprints = [x <= 0, x >= 0,           # Left, right of a vertical edge
+                  y <= 0, y >= 0,           # Above, below a horizontal edge
+                  x >= y, x <= y,           # Upper right, lower left of a diagonal edge
+                  x + y <= 0, x + y >= 0]   # Upper left, lower right of an anti-diagonal edge
+
+    # Inner function to filter a block of data
+    def _filter_block(data, mask):
+
+        # Means of 3 x 3 subwindows, sampled at the corners, edges and centre of the window
+        sub_mean = np.pad(_window_statistics(data, mask, window_size = 3, nodata_method = nodata_method, variance = False), offset, mode = 'symmetric')
+
+        ny, nx = data.shape
+
+        S = [[sub_mean[offset * i:offset * i + ny, offset * j:offset * j + nx] for j in range(3)] for i in range(3)]
+
+        # Strength of edges in each orientation
+        gradients = np.stack([np.abs((S[0][2] + S[1][2] + S[2][2]) - (S[0][0] + S[1][0] + S[2][0])),
+                              np.abs((S[2][0] + S[2][1] + S[2][2]) - (S[0][0] + S[0][1] + S[0][2])),
+                              np.abs((S[0][1] + S[0][2] + S[1][2]) - (S[1][0] + S[2][0] + S[2][1])),
+                              np.abs((S[0][0] + S[0][1] + S[1][0]) - (S[1][2] + S[2][1] + S[2][2]))])
+
+        orientation = np.argmax(gradients, axis = 0).astype(np.uint8)
+
+        del gradients
+
+        # Select the side of the edge with a subwindow mean closest to the centre
+        centre = S[1][1]
+
+        direction = orientation * 2
+        direction[orientation == 0] += (np.abs(S[1][2] - centre) < np.abs(S[1][0] - centre))[orientation == 0]
+        direction[orientation == 1] += (np.abs(S[2][1] - centre) < np.abs(S[0][1] - centre))[orientation == 1]
+        direction[orientation == 2] += (np.abs(S[2][0] - centre) < np.abs(S[0][2] - centre))[orientation == 2]
+        direction[orientation == 3] += (np.abs(S[2][2] - centre) < np.abs(S[0][0] - centre))[orientation == 3]
+
+        del S, sub_mean
+
+        img_filtered = np.empty_like(data)
+
+        # Apply the Lee filter with statistics from the selected half window
+        for d, footprint in enumerate(footprints):
+
+            sel = direction == d
+
+            if not sel.any(): continue
+
+            img_mean, img_variance = _window_statistics(data, mask, window_size = window_size, nodata_method = nodata_method, footprint = footprint)
+            img_mean, img_variance = img_mean[sel], img_variance[sel]
+
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                b = ((img_variance - img_mean * img_mean * cu2) / (1. + cu2)) / img_variance
+
+            b[np.isfinite(b) == False] = 0.
+            b = np.clip(b, 0., 1.)
+
+            img_filtered[sel] = img_mean + b * (data[sel] - img_mean)
+
+        return img_filtered
+
+    return _filter_blocks(img, _filter_block, window_size = window_size, nodata_method = nodata_method, n_workers = n_workers, block_size = block_size)
+
+
+def frost_filter(img, window_size = 5, n_looks = 16, nodata_method = 'nearest', n_workers = 1, block_size = 256, damping = 1.):
+    '''
+    Filters a masked array with the Frost filter (Frost et al., 1982). Each pixel is replaced by a weighted mean of its window, with weights that decay exponentially with distance from the centre. Weights decay faster in heterogeneous windows, in proportion to the squared coefficient of variation.
+
+    Args:
+        img: A masked array
+        window_size: Must be an odd number. Defaults to 5.
+        n_looks: Not used by the Frost filter, included for consistency with other filters.
+        nodata_method: Treatment of masked pixels, 'nearest' or 'normalized', as in enhanced_lee_filter(). Defaults to 'nearest'.
+        n_workers: Number of threads to filter blocks with. Defaults to 1.
+        block_size: Number of rows in each block. Defaults to 256.
+        damping: Damping factor. Defaults to 1.
+    Returns:
+        A masked array with a filtered verison of img
+    '''
+
+    _check_window_size(window_size)
+
+    border = window_size // 2
+
+    # Unique distances from the centre of the window, and the offsets at each distance
+    offsets = {}
+    for y, x in itertools.product(range(-border, border + 1), repeat = 2):
+        offsets.setdefault(math.hypot(y, x), []).append((y, x))
+
+    # Inner function to filter a block of data
+    def _filter_block(data, mask):
+
+        img_mean, img_variance = _window_statistics(data, mask, window_size = window_size, nodata_method = nodata_method)
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            A = damping * img_variance / (img_mean * img_mean)
+        A[np.isfinite(A) == False] = 0.
+
+        del img_mean, img_variance
+
+        ny, nx = data.shape
+
+        data_padded = np.pad(data, border, mode = 'symmetric')
+        if nodata_method == 'normalized': valid_padded = np.pad(mask == False, border, mode = 'symmetric')
+
+        weighted_sum = np.zeros_like(data)
+        weight_sum = np.zeros_like(data)
+
+        for distance in sorted(offsets.keys()):
+
+            weight = np.exp(-A * distance)
+
+            for y, x in offsets[distance]:
+
+                window = (slice(border + y, border + y + ny), slice(border + x, border + x + nx))
+
+                # Masked pixels don't contribute to the weighted mean
+                this_weight = weight * valid_padded[window] if nodata_method == 'normalized' else weight
+
+                weighted_sum += this_weight * data_padded[window]
+                weight_sum += this_weight
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            return weighted_sum / weight_sum
+
+    return _filter_blocks(img, _filter_block, window_size = window_size, nodata_method = nodata_method, n_workers = n_workers, block_size = block_size)
+
+
+def gamma_map_filter(img, window_size = 5, n_looks = 16, nodata_method = 'nearest', n_workers = 1, block_size = 256):
+    '''
+    Filters a masked array with the Gamma maximum a posteriori (Gamma-MAP) filter (Lopes et al., 1990), which assumes gamma distributed backscatter and speckle.
+
+    Homogeneous windows (coefficient of variation below that of speckle) are replaced by their mean, and windows containing point targets (coefficient of variation above sqrt(1 + 2 / n_looks)) are unfiltered.
+
+    Args:
+        img: A masked array
+        window_size: Must be an odd number. Defaults to 5.
+        n_looks: Equivalent number of looks. Defaults to 16, equivalent to native ENL of ALOS mosaic data.
+        nodata_method: Treatment of masked pixels, 'nearest' or 'normalized', as in enhanced_lee_filter(). Defaults to 'nearest'.
+        n_workers: Number of threads to filter blocks with. Defaults to 1.
+        block_size: Number of rows in each block. Defaults to 256.
+    Returns:
+        A masked array with a filtered verison of img
+    '''
+
+    cu2 = 1. / n_looks
+    cmax2 = 1. + (2. / n_looks)
+
+    # Inner function to filter a block of data
+    def _filter_block(data, mask):
+
+        img_mean, img_variance = _window_statistics(data, mask, window_size = window_size, nodata_method = nodata_method)
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            ci2 = img_variance / (img_mean * img_mean)
+        ci2[np.isfinite(ci2) == False] = 0.
+
+        # There are three conditions in the Gamma-MAP filter
+        img_filtered = data.copy()
+        img_filtered[ci2 <= cu2] = img_mean[ci2 <= cu2]
+
+        sel = np.logical_and(ci2 > cu2, ci2 < cmax2)
+
+        mean, intensity = img_mean[sel], data[sel]
+
+        alpha = (1. + cu2) / (ci2[sel] - cu2)
+        b = alpha - n_looks - 1.
+
+        with np.errstate(invalid = 'ignore'):
+            img_filtered[sel] = (b * mean + np.sqrt((mean * mean * b * b) + (4. * alpha * n_looks * mean * intensity))) / (2. * alpha)
+
+        return img_filtered
+
+    return _filter_blocks(img, _filter_block, window_size = window_size, nodata_method = nodata_method, n_workers = n_workers, block_size = block_size)
+
+
+def boxcar_filter(img, window_size = 5, n_looks = 16, nodata_method = 'nearest', n_workers = 1, block_size = 256):
+    '''
+    Filters a masked array with a boxcar (moving window mean) filter.
+
+    Args:
+        img: A masked array
+        window_size: Must be an odd number. Defaults to 5.
+        n_looks: Not used by the boxcar filter, included for consistency with other filters.
+        nodata_method: Treatment of masked pixels, 'nearest' or 'normalized', as in enhanced_lee_filter(). Defaults to 'nearest'.
+        n_workers: Number of threads to filter blocks with. Defaults to 1.
+        block_size: Number of rows in each block. Defaults to 256.
+    Returns:
+        A masked array with a filtered verison of img
+    '''
+
+    # Inner function to filter a block of data
+    def _filter_block(data, mask):
+
+        return _window_statistics(data, mask, window_size = window_size, nodata_method = nodata_method, variance = False)
+
+    return _filter_blocks(img, _filter_block, window_size = window_size, nodata_method = nodata_method, n_workers = n_workers, block_size = block_size)
+
+
+def multitemporal_filter(stack, window_size = 5, nodata_method = 'nearest', n_workers = 1, block_size = 256):
+    '''
+    Filters a stack of co-registered images from different dates with the multitemporal filter of Quegan et al. (2000). Each image is scaled by the mean ratio of every date to its local mean:
+
+        J_k = E[I_k] / N * sum(I_i / E[I_i])
+
+    where E[I] is the mean of a moving window. Speckle is reduced by the number of dates as well as by the window, so a smaller window preserves more spatial resolution than filtering each date on its own. Window means for all dates are calculated in one pass over the stack.
+
+    Images should be backscatter intensity (gamma0 in natural units). Dates that are masked at a pixel don't contribute to the sum for that pixel.
+
+    Args:
+        stack: A list of masked arrays of the same shape, or a masked array with shape (dates, rows, columns).
+        window_size: Must be an odd number. Defaults to 5.
+        nodata_method: Treatment of masked pixels, 'nearest' or 'normalized', as in enhanced_lee_filter(). Defaults to 'nearest'.
+        n_workers: Number of threads to filter blocks with. Defaults to 1.
+        block_size: Number of rows in each block. Defaults to 256.
+    Returns:
+        A masked array with shape (dates, rows, columns) containing a filtered version of each image
+    '''
+
+    if type(stack) == list: stack = np.ma.stack(stack)
 
-    indices = ndimage.distance_transform_edt(img.mask, return_distances = False, return_indices = True)
-    data = img.data[tuple(indices)]
+    assert stack.ndim == 3, "Stack must have three dimensions (dates, rows, columns)."
 
-    img_mean = _window_mean(data, window_size = window_size)
-    img_std = _window_stdev(data, window_size = window_size)
+    # Inner function to filter a block of data
+    def _filter_block(data, mask):
 
-    ci = img_std / img_mean
-    ci[np.isfinite(ci) == False] = 0.
+        img_mean = _window_statistics(data, mask, window_size = window_size, nodata_method = nodata_method, variance = False)
 
-    W = np.zeros_like(ci)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            ratio = data / img_mean
 
-    # There are three conditions in the enhanced lee filter
-    W[ci <= cu] = 1.
-    W[ci >= cmax] = 0.
+        # Sum ratios over unmasked dates
+        ratio[np.logical_or(mask, np.isfinite(ratio) == False)] = 0.
 
-    sel = np.logical_and(ci > cu, ci < cmax)
+        n_dates = (mask == False).sum(axis = 0)
 
-    W[sel] = np.exp((-k * (ci[sel] - cu)) / (cmax - ci[sel]))
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            mean_ratio = (ratio.sum(axis = 0) / n_dates).astype(data.dtype)
 
-    img_filtered = (img_mean * W) + (data * (1. - W))
+        return img_mean * mean_ratio
 
-    img_filtered = np.ma.array(img_filtered, mask = np.logical_or(np.isnan(img_filtered), img.mask))
+    return _filter_blocks(stack, _filter_block, window_size = window_size, nodata_method = nodata_method, n_workers = n_workers, block_size = block_size)
 
-    img_filtered.data[img_filtered.mask] = 0.
 
-    return img_filtered
+# The enhanced lee filter is applied to gamma0 in decibels, as it has been since it was introduced
+register_filter('enhanced_lee', enhanced_lee_filter, units = 'decibels')
+register_filter('refined_lee', refined_lee_filter)
+register_filter('frost', frost_filter)
+register_filter('gamma_map', gamma_map_filter)
+register_filter('boxcar', boxcar_filter)
@@ -2,6 +2,7 @@
 
 import matplotlib.pyplot as plt
 import numpy as np
+import os
 import scipy.ndimage as ndimage
 from scipy.ndimage.measurements import label
 
@@ -9,59 +10,284 @@ import pdb
 
 import biota.IO
 
-def getContiguousAreas(data, value, min_pixels = 1, contiguity = 'queen'):
+def _unionFind(n, pairs):
     '''
-    Get pixels that come from the same contigous area.
+    Merge labels that belong to the same area, with a vectorised union-find.
 
     Args:
-        data: A numpy array
-        value: Pixel value to include in contiguous_area (e.g. True for forest)
-        min_area: What minimum area should be included (number of pixels)
-        contuguity: Set to rook (4-way) or queen (8-way) connectivity constraint. Defaults to 'queen'.
+        n: Number of labels.
+        pairs: An array of shape (n_pairs, 2), of pairs of labels that belong to the same area.
 
     Returns:
-        A binary array of pixels that meet the conditions
+        An array giving the root of each label, which is the lowest label of its area.
     '''
 
-    assert contiguity in ['rook', 'queen'], "Contiguity must be either 'rook' or 'queen'. Input recieved was <%s>."%str(contiguity)
+    parent = np.arange(n, dtype = np.int64)
+
+    while True:
+
+        root_a, root_b = parent[pairs[:, 0]], parent[pairs[:, 1]]
+
+        unmerged = root_a != root_b
+        if not unmerged.any(): break
+
+        # Link the higher root of each pair to the lower
+        np.minimum.at(parent, np.maximum(root_a, root_b)[unmerged], np.minimum(root_a, root_b)[unmerged])
+
+        # Compress paths, so that each label points directly to its root
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent): break
+            parent = grandparent
+
+    return parent
+
+
+def _getTouchingPairs(edge_a, edge_b, structure):
+    '''
+    Get pairs of labels that touch across a boundary between two adjacent lines of pixels (e.g. the last row of one strip and the first row of the next).
+
+    Args:
+        edge_a: A 1d array of labels along one side of the boundary, with 0 for unlabelled pixels.
+        edge_b: A 1d array of labels along the other side of the boundary.
+        structure: Connectivity structure, from ndimage.generate_binary_structure().
+
+    Returns:
+        An array of shape (n_pairs, 2) of unique pairs of touching labels.
+    '''
+
+    pairs = []
 
-    # Extract area that meets condition
-    binary_array = (data == value) * 1
+    for offset in [-1, 0, 1]:
+        if not structure[0, 1 + offset]: continue
+        a, b = edge_a[max(offset, 0):len(edge_a) + min(offset, 0)], edge_b[max(-offset, 0):len(edge_b) + min(-offset, 0)]
+        touching = np.logical_and(a > 0, b > 0)
+        pairs.append(np.stack([a[touching], b[touching]], axis = 1))
+
+    return np.unique(np.concatenate(pairs), axis = 0).astype(np.int64)
+
+
+def labelStrips(data, value, min_pixels = 1, contiguity = 'queen', strip_size = 1024):
+    '''
+    Label contiguous areas, processing strips of rows. Areas that cross strip boundaries are merged with union-find, so the working memory is set by strip_size rather than the size of the array.
+
+    Args:
+        data: A numpy array
+        value: Pixel value to include in contiguous areas (e.g. True for forest). Masked pixels are never included.
+        min_pixels: What minimum area should be included (number of pixels)
+        contiguity: Set to rook (4-way) or queen (8-way) connectivity constraint. Defaults to 'queen'.
+        strip_size: Number of rows to label at a time. Defaults to 1024.
 
-    # If masked, we use this flag to save the mask for later.
-    masked = np.ma.isMaskedArray(binary_array)
+    Returns:
+        An int32 array of area IDs, numbered from 1 in order of each area's first pixel, with 0 where no area meets min_pixels.
+    '''
 
-    # Set masked areas to non-contiguous value
-    if masked:
-        mask = np.ma.getmaskarray(binary_array)
-        binary_array = binary_array.filled(0)
+    assert contiguity in ['rook', 'queen'], "Contiguity must be either 'rook' or 'queen'. Input recieved was <%s>."%str(contiguity)
+    assert type(strip_size) == int and strip_size >= 1, "strip_size must be a positive integer."
 
-    # Label contigous areas with a number
     if contiguity == 'rook':
         structure = ndimage.generate_binary_structure(2,1) # 4-way connectivity
     elif contiguity == 'queen':
         structure = ndimage.generate_binary_structure(2,2) # 8-way connectivity
 
-    location_id, n_areas = label(binary_array, structure = structure)
+    location_id = np.zeros(data.shape, dtype = np.int32)
 
-    # Get count of each value in array
-    label_area = np.bincount(location_id.flatten())[1:]
+    sizes, pairs, n_labels = [np.zeros(1, dtype = np.int64)], [np.zeros((0, 2), dtype = np.int64)], 0
 
-    # Find those IDs that meet minimum area requirements
-    include_id = np.arange(1, n_areas + 1)[label_area >= min_pixels]
+    for ymin in range(0, data.shape[0], strip_size):
 
-    # Get a binary array of location_id pixels that meet the minimum area requirement
-    contiguous_area = np.in1d(location_id, include_id).reshape(data.shape).astype(np.bool)
+        rows = slice(ymin, min(ymin + strip_size, data.shape[0]))
+
+        # Extract area that meets condition, excluding masked pixels
+        binary_array = np.ma.filled(data[rows] == value, False)
+
+        strip_id, n_areas = label(binary_array, structure = structure, output = np.int32)
+
+        # Give each label in the strip a unique ID
+        strip_id[strip_id > 0] += n_labels
+        location_id[rows] = strip_id
+
+        sizes.append(np.bincount(strip_id.ravel(), minlength = n_labels + n_areas + 1)[n_labels + 1:])
+
+        # Find labels that touch across the boundary with the previous strip
+        if ymin > 0: pairs.append(_getTouchingPairs(location_id[ymin - 1], strip_id[0], structure))
+
+        n_labels += n_areas
+
+    root = _unionFind(n_labels + 1, np.concatenate(pairs))
+
+    # Count the size of each area, and find those IDs that meet minimum area requirements
+    area_size = np.bincount(root, weights = np.concatenate(sizes), minlength = n_labels + 1)
+    include = np.logical_and(root == np.arange(n_labels + 1), area_size >= min_pixels)
+    include[0] = False
+
+    # Re-number areas 1 to n in order of their lowest label, which is the order of their first pixel
+    relabel = np.where(include[root], np.cumsum(include)[root], 0).astype(np.int32)
+
+    for ymin in range(0, data.shape[0], strip_size):
+        rows = slice(ymin, min(ymin + strip_size, data.shape[0]))
+        location_id[rows] = relabel[location_id[rows]]
+
+    return location_id
+
+
+def _getForestPath(forest_dir, tile):
+    '''
+    Return the location of a tile's forest/nonforest pixels saved by saveForest().
+    '''
+
+    return '%s/%s'%(os.path.abspath(os.path.expanduser(forest_dir)), (tile.output_pattern%'Forest').replace('.tif', '.npy'))
+
+
+def saveForest(tile, forest_dir):
+    '''
+    Save a tile's forest/nonforest pixels (AGB >= forest_threshold, before any area_threshold is applied), bit packed, so that labelRegion() can label the tile without calculating its AGB again.
+
+    Args:
+        tile: A LoadTile() object.
+        forest_dir: Directory to save forest pixels to.
+
+    Returns:
+        The path to the saved array.
+    '''
 
-    # Return an array giving values to each area
-    location_id[contiguous_area == False] = 0
+    filename = _getForestPath(forest_dir, tile)
 
-    # Re-number location_ids 1 to n, given that some unique value shave now been removed
-    location_id_unique, location_id_indices = np.unique(location_id, return_inverse = True)
-    location_id = np.arange(0, location_id_unique.shape[0], 1)[location_id_indices].reshape(data.shape)
+    np.save(filename, np.packbits(np.ma.getdata(tile.getAGB()) >= float(tile.forest_threshold)))
+
+    return filename
+
+
+def labelRegion(data_dir, locations, year, output_dir = None, strip_size = 1024, forest_dir = None, **kwargs):
+    '''
+    Label forest patches seamlessly across a region of adjoining tiles. Each tile is loaded, labelled and released in turn, with its labels stored on disk, then patches that touch along shared tile edges are merged through a global equivalence table. Only one tile and the edges of each tile are held in memory at a time.
+
+    Args:
+        data_dir: Directory containing ALOS mosaic data.
+        locations: A list of (lat, lon) of the tiles in the region.
+        year: Year of the tiles.
+        output_dir: Directory to write labelled tiles to. Defaults to a new temporary directory.
+        strip_size: Number of rows to label at a time (see labelStrips()). Defaults to 1024.
+        forest_dir: Optionally, a directory of forest/nonforest pixels for each tile from saveForest(), which are used rather than calculating AGB again. Defaults to calculating AGB for each tile.
+        **kwargs: Options passed to LoadTile() for each tile, other than output_dir (e.g. forest_threshold, area_threshold, contiguity, lee_filter).
+
+    Returns:
+        A dictionary of (lat, lon): path to a .npy file of int32 patch IDs for each tile, numbered consistently across the region (tile by tile from north-west to south-east), with 0 outside of forest patches that meet area_threshold (ha). Load with np.load(path, mmap_mode = 'r') to avoid reading whole tiles into memory.
+    '''
+
+    import shutil
+    import tempfile
+
+    import biota.core
+
+    locations = [(int(lat), int(lon)) for lat, lon in locations]
+
+    assert len(locations) > 0, "At least one tile must be specified."
+    assert len(set(locations)) == len(locations), "Each tile must have a unique location."
+    assert forest_dir is None or os.path.isdir(os.path.expanduser(forest_dir)), "Specified forest directory (%s) does not exist"%str(forest_dir)
+
+    # Label tiles from north to south and west to east, so that patches are numbered in that order
+    locations = sorted(locations, key = lambda location: (-location[0], location[1]))
+
+    if output_dir is None: output_dir = tempfile.mkdtemp()
+    temp_dir = tempfile.mkdtemp(dir = output_dir)
+
+    sizes, edges, output_patterns, n_labels = [np.zeros(1)], {}, {}, 0
+
+    try:
+        for lat, lon in locations:
+
+            tile = biota.core.LoadTile(data_dir, lat, lon, year, **kwargs)
+
+            if len(output_patterns) == 0: ySize, xSize, area_threshold, contiguity = tile.ySize, tile.xSize, tile.area_threshold, tile.contiguity
+
+            assert tile.xSize == xSize and tile.ySize == ySize, "Tiles must have the same size."
+
+            # Forest, before any area_threshold is applied to the tile alone
+            if forest_dir is None:
+                forest = np.ma.getdata(tile.getAGB()) >= float(tile.forest_threshold)
+            else:
+                forest = np.unpackbits(np.load(_getForestPath(forest_dir, tile)), count = ySize * xSize).reshape((ySize, xSize)).astype(np.bool_)
+
+            location_id = labelStrips(np.ma.array(forest, mask = tile.mask), True, contiguity = contiguity, strip_size = strip_size)
+
+            n_areas = int(location_id.max())
+
+            # Give each label in the region a unique ID, and record area in ha
+            location_id[location_id > 0] += n_labels
+            sizes.append(np.bincount(location_id.ravel(), minlength = n_labels + n_areas + 1)[n_labels + 1:] * (tile.xRes * tile.yRes * 0.0001))
+
+            edges[(lat, lon)] = {'top': location_id[0].copy(), 'bottom': location_id[-1].copy(), 'left': location_id[:, 0].copy(), 'right': location_id[:, -1].copy()}
+            output_patterns[(lat, lon)] = tile.output_pattern
+
+            np.save('%s/%s_%s.npy'%(temp_dir, str(lat), str(lon)), location_id)
+
+            n_labels += n_areas
+
+            del tile, forest, location_id
+
+        structure = ndimage.generate_binary_structure(2, 1 if contiguity == 'rook' else 2)
+
+        # Find labels that touch across edges with tiles to the east and south, and diagonally for queen's move contiguity
+        pairs = [np.zeros((0, 2), dtype = np.int64)]
+
+        for (lat, lon), edge in edges.items():
+
+            if (lat, lon + 1) in edges: pairs.append(_getTouchingPairs(edge['right'], edges[(lat, lon + 1)]['left'], structure))
+            if (lat - 1, lon) in edges: pairs.append(_getTouchingPairs(edge['bottom'], edges[(lat - 1, lon)]['top'], structure))
+
+            if structure[0, 0]:
+                for neighbour, corner_a, corner_b in [((lat - 1, lon + 1), edge['bottom'][-1], 'top_left'), ((lat - 1, lon - 1), edge['bottom'][0], 'top_right')]:
+                    if neighbour not in edges: continue
+                    corner_b = edges[neighbour]['top'][0] if corner_b == 'top_left' else edges[neighbour]['top'][-1]
+                    if corner_a > 0 and corner_b > 0: pairs.append(np.array([[corner_a, corner_b]], dtype = np.int64))
+
+        root = _unionFind(n_labels + 1, np.concatenate(pairs))
+
+        # Sum area of each patch across tiles, and find those that meet the area threshold
+        area = np.bincount(root, weights = np.concatenate(sizes), minlength = n_labels + 1)
+        include = np.logical_and(root == np.arange(n_labels + 1), area >= area_threshold)
+        include[0] = False
+
+        relabel = np.where(include[root], np.cumsum(include)[root], 0).astype(np.int32)
+
+        outputs = {}
+
+        for lat, lon in locations:
+            filename = '%s/%s'%(output_dir, (output_patterns[(lat, lon)]%'ForestPatches').replace('.tif', '.npy'))
+            np.save(filename, relabel[np.load('%s/%s_%s.npy'%(temp_dir, str(lat), str(lon)))])
+            outputs[(lat, lon)] = filename
+
+    finally:
+        shutil.rmtree(temp_dir)
+
+    return outputs
+
+
+def getContiguousAreas(data, value, min_pixels = 1, contiguity = 'queen', strip_size = 1024):
+    '''
+    Get pixels that come from the same contigous area.
+
+    Args:
+        data: A numpy array
+        value: Pixel value to include in contiguous_area (e.g. True for forest)
+        min_area: What minimum area should be included (number of pixels)
+        contuguity: Set to rook (4-way) or queen (8-way) connectivity constraint. Defaults to 'queen'.
+        strip_size: Number of rows to label at a time (see labelStrips()). Defaults to 1024.
+
+    Returns:
+        A binary array of pixels that meet the conditions, and an int32 array giving an ID to each area
+    '''
+
+    # Label contigous areas with a number, setting masked areas to non-contiguous value
+    location_id = labelStrips(data, value, min_pixels = min_pixels, contiguity = contiguity, strip_size = strip_size)
+
+    # Get a binary array of location_id pixels that meet the minimum area requirement
+    contiguous_area = location_id > 0
 
     # Put mask back in if input was a masked array
-    if masked:
+    if np.ma.isMaskedArray(data):
+        mask = np.ma.getmaskarray(data)
         contiguous_area = np.ma.array(contiguous_area, mask = mask)
         location_id = np.ma.array(location_id, mask = mask)
 
@@ -11,6 +11,58 @@ import biota.IO
 import pdb
 
 
+def getBufferDistance(mask, xRes = 1., yRes = 1., location_id = False):
+    """
+    Get the distance from each pixel to the nearest masked location, with a single Euclidean distance transform.
+
+    Args:
+        mask: A numpy array, with 'True' (or values > 0) representing locations to measure distance from.
+        xRes: Size of a pixel in the x direction. Defaults to 1, measuring distance in pixels.
+        yRes: Size of a pixel in the y direction. Defaults to 1, measuring distance in pixels.
+        location_id: Set True to also return the value of mask at the nearest location to each pixel, for arrays of location IDs. Defaults to False.
+
+    Returns:
+        An array of distances, in units of xRes and yRes. Where location_id is True, also an array of the nearest location ID to each pixel.
+    """
+
+    locations = mask > 0
+
+    # Without any locations every pixel is infinitely distant
+    if not locations.any():
+        distance = np.full(mask.shape, np.inf)
+        return (distance, np.zeros_like(mask)) if location_id else distance
+
+    if location_id == False:
+        return ndimage.distance_transform_edt(locations == False, sampling = (yRes, xRes))
+
+    distance, indices = ndimage.distance_transform_edt(locations == False, sampling = (yRes, xRes), return_indices = True)
+
+    return distance, mask[indices[0], indices[1]]
+
+
+def bufferMask(mask, buffer_size, xRes = 1., yRes = 1., location_id = False):
+    """
+    Add a buffer around masked locations. Buffers are circular, and cost the same to calculate whatever their size and the number of location IDs.
+
+    Args:
+        mask: A numpy array, with 'True' (or values > 0) representing locations to add a buffer.
+        buffer_size: Size of the buffer to add around each location, in units of xRes and yRes.
+        xRes: Size of a pixel in the x direction. Defaults to 1, giving buffer_size in pixels.
+        yRes: Size of a pixel in the y direction. Defaults to 1, giving buffer_size in pixels.
+        location_id: Set True to fill buffers with the value of the nearest location, for arrays of location IDs. Defaults to False.
+
+    Returns:
+        A boolean array of buffered locations, or where location_id is True an array of location IDs.
+    """
+
+    if location_id == False:
+        return getBufferDistance(mask, xRes = xRes, yRes = yRes) <= buffer_size
+
+    distance, nearest_id = getBufferDistance(mask, xRes = xRes, yRes = yRes, location_id = True)
+
+    return np.where(distance <= buffer_size, nearest_id, 0).astype(mask.dtype)
+
+
 def dilateMask(mask, buffer_px, location_id = False):
     """
     Dilate a boolean (True/False) numpy array by a specified number of pixels.
@@ -23,15 +75,7 @@ def dilateMask(mask, buffer_px, location_id = False):
         The mask array with dilated 'True' locations.
     """
 
-    if location_id == False:
-        mask_dilated = ndimage.morphology.binary_dilation(mask, iterations = buffer_px)
-
-    else:
-        mask_dilated = np.zeros_like(mask)
-        for i in np.unique(mask[mask > 0]):
-            mask_dilated[ndimage.morphology.binary_dilation(mask == i, iterations = buffer_px)] = i
-
-    return mask_dilated
+    return bufferMask(mask, buffer_px, location_id = location_id)
 
 
 def _coordinateTransformer(shp):
@@ -194,11 +238,8 @@ def maskArray(tile, array, classes = [], buffer_size = 0.):
 
     if buffer_size > 0.:
 
-        # Determine the size of the buffer in pixels
-        buffer_px = int(buffer_size / ((tile.xRes + tile.yRes) / 2.))
-
         # Dilate the mask
-        mask = dilateMask(mask, buffer_px)
+        mask = bufferMask(mask, buffer_size, xRes = tile.xRes, yRes = tile.yRes)
 
     return mask
 
@@ -257,11 +298,11 @@ def maskShapefile(tile, shp, buffer_size = 0., field = None, value = None, locat
     shp = os.path.expanduser(shp)
     assert os.path.exists(shp), "Shapefile %s does not exist in the file system."%shp
 
-    # Determine the size of the buffer in degrees
-    buffer_size_degrees = buffer_size / (((tile.xRes * tile.xSize) + (tile.yRes * tile.ySize)) / 2.)
+    # Determine size of buffer to place around lines/polygons, in pixels. Away from the equator pixels are narrower east-west than north-south, so the buffer spans the most pixels along the shorter side.
+    buffer_px = int(math.ceil(buffer_size / min(tile.xRes, tile.yRes)))
 
-    # Determine size of buffer to place around lines/polygons
-    buffer_px = int(round(buffer_size_degrees / tile.geo_t[1]))
+    # Determine the size of the buffer in degrees
+    buffer_size_degrees = buffer_px * tile.geo_t[1]
 
     # Create output image. Add a buffer around the image array equal to the maxiumum dilation size. This means that features just outside ALOS tile extent can contribute to dilated mask.
     rasterPoly = Image.new("I", (tile.xSize + (buffer_px * 2), tile.ySize + (buffer_px * 2)), 0)
@@ -353,9 +394,9 @@ def maskShapefile(tile, shp, buffer_size = 0., field = None, value = None, locat
     mask = gdalnumeric.fromstring(rasterPoly.tobytes(),dtype=np.uint32)
     mask.shape = rasterPoly.im.size[1], rasterPoly.im.size[0]
 
-    # If any buffer pixels are slected, dilate the masked area by buffer_px pixels
-    if buffer_px > 0:
-        mask = dilateMask(mask, buffer_px, location_id = location_id)
+    # If a buffer is specified, add a buffer of buffer_size around the masked area
+    if buffer_size > 0:
+        mask = bufferMask(mask, buffer_size, xRes = tile.xRes, yRes = tile.yRes, location_id = location_id)
 
     # Get rid of image buffer
     mask = mask[buffer_px:mask.shape[0]-buffer_px, buffer_px:mask.shape[1]-buffer_px]
@@ -367,6 +408,23 @@ def maskShapefile(tile, shp, buffer_size = 0., field = None, value = None, locat
     return mask
 
 
+def _getTilesInBBox(lonmin, latmin, lonmax, latmax):
+    """
+    Identify the ALOS tiles that cover a bounding box.
+
+    Args:
+        lonmin, latmin, lonmax, latmax: Bounding box in WGS84 degrees.
+
+    Returns:
+        A list of (lat, lon) of the upper-left corner of each ALOS tile that covers the bounding box
+    """
+
+    latrange = list(range(int(math.ceil(latmin)), int(math.ceil(latmax)+1), 1))
+    lonrange = list(range(int(math.floor(lonmin)), int(math.floor(lonmax)+1), 1))
+
+    return list(itertools.product(latrange,lonrange))
+
+
 def getTilesInShapefile(shp, field = None, value = None):
     """
     Identify all the ALOS tiles that fall within a shapefile.
@@ -409,13 +467,8 @@ def getTilesInShapefile(shp, field = None, value = None):
         lonmin, latmin, z = coordTransform.TransformPoint(sxmin, symin)
         lonmax, latmax, z = coordTransform.TransformPoint(sxmax, symax)
 
-        # Get the tiles that cover the area of the shapefile
-        latrange = list(range(int(math.ceil(latmin)), int(math.ceil(latmax)+1), 1))
-        lonrange = list(range(int(math.floor(lonmin)), int(math.floor(lonmax)+1), 1))
-        tiles = list(itertools.product(latrange,lonrange))
-
-        # Add them to tiles_to_include if not already tere
-        [tiles_to_include.add(t) for t in tiles]
+        # Get the tiles that cover the area of the shapefile, and add them to tiles_to_include if not already there
+        [tiles_to_include.add(t) for t in _getTilesInBBox(lonmin, latmin, lonmax, latmax)]
 
     return sorted(list(tiles_to_include))
 
@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+
+import pdb
+
+import biota.batch
+
+"""
+This is the script that runs the command line to process change for a batch of tiles from a manifest, resuming where a previous run of the same batch stopped.
+"""
+
+
+def main(dir, manifest,
+        journal = None,
+        output_dir = os.getcwd(),
+        n_processes = 1,
+        max_memory = None,
+        verify = False,
+        verbose = False):
+    '''
+    Run each job in a manifest that hasn't already completed, and print a summary of the batch
+    '''
+
+    return biota.batch.runBatch(dir, manifest, journal = journal, output_dir = output_dir, n_processes = n_processes, max_memory = max_memory, verify = verify, verbose = verbose)
+
+
+
+
+if __name__ == '__main__':
+
+    # Set up command line parser
+    parser = argparse.ArgumentParser(description = "Process ALOS-1/2 mosaic data to output biomass and woody cover change for a batch of tiles listed in a manifest. Completed jobs are recorded in a journal, and skipped where the batch is run again.")
+
+    parser._action_groups.pop()
+    required = parser.add_argument_group('Required arguments')
+    optional = parser.add_argument_group('Optional arguments')
+
+    # Required arguments
+    required.add_argument('-dir', '--data_directory', metavar = 'DIR', type = str, help = "Path to directory containing ALOS mosaic data.")
+    required.add_argument('-m', '--manifest', metavar = 'CSV', type = str, help = "Path to a CSV file of jobs, with columns 'lat', 'lon', 'year1' and 'year2', and optionally columns of options for each job (e.g. 'output', 'forest_threshold', 'change_intensity_threshold' as a proportion).")
+
+    # Optional arguments
+    optional.add_argument('-j', '--journal', metavar = 'FILE', type = str, default = None, help = "Path to the SQLite journal of job states. Defaults to the manifest filename with the extension '.journal.sqlite'.")
+    optional.add_argument('-od', '--output_dir', metavar = 'DIR', type = str, default = os.getcwd(), help = "Optionally specify an output directory. Outputs of each job are written to a subdirectory named by its job ID. Defaults to the present working directory.")
+    optional.add_argument('-np', '--n_processes', metavar = 'N', type = int, default = 1, help = "Number of jobs to run at once. Defaults to 1.")
+    optional.add_argument('-mm', '--max_memory', metavar = 'MB', type = float, default = None, help = "Optionally limit the memory of each process. Jobs that need more fail. Defaults to no limit.")
+    optional.add_argument('-vf', '--verify', action = 'store_true', default = False, help = "Check the checksums of outputs of completed jobs, and run again jobs with outputs that have changed. Defaults to False.")
+    optional.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "Print progress to terminal. Defaults to False.")
+
+    # Get arguments from command line
+    args = parser.parse_args()
+
+    # Run through entire batch. The journal is up to date if interrupted, so the batch can be resumed.
+    try:
+        summary = main(args.data_directory, args.manifest,
+        journal = args.journal,
+        output_dir = args.output_dir,
+        n_processes = args.n_processes,
+        max_memory = args.max_memory,
+        verify = args.verify,
+        verbose = args.verbose)
+
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+    # Exit with an error where any job failed, so that the batch can be retried by scripts
+    if len(summary['Failed']) > 0: sys.exit(1)
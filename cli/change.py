@@ -5,6 +5,7 @@ import sys
 import pdb
 
 import biota
+import biota.IO
 
 """
 This is the script that runs the command line to extract and plot property variations between two years.
@@ -22,6 +23,9 @@ def main(dir, lat, lon, year1, year2,
         change_intensity_threshold = 0,
         deforestation_threshold = None,
         output_dir = os.getcwd(),
+        cache_dir = None,
+        output_profile = 'default',
+        n_workers = 1,
 		verbose = False):
     '''
     Comment this meaningfully
@@ -32,13 +36,13 @@ def main(dir, lat, lon, year1, year2,
 	    
         # Load the tiles
         if verbose: print ('Loading tile:', year1)
-        tile1 = biota.LoadTile(dir, lat, lon, year1, lee_filter = lee_filter, downsample_factor = downsample_factor, forest_threshold = forest_threshold, area_threshold = area_threshold, output_dir = output_dir)
+        tile1 = biota.LoadTile(dir, lat, lon, year1, lee_filter = lee_filter, downsample_factor = downsample_factor, forest_threshold = forest_threshold, area_threshold = area_threshold, output_dir = output_dir, cache_dir = cache_dir, output_profile = output_profile, async_output = True, n_workers = n_workers)
 		
         if verbose: print ('Loading tile:', year2)
-        tile2 = biota.LoadTile(dir, lat, lon, year2, lee_filter = lee_filter, downsample_factor = downsample_factor, forest_threshold = forest_threshold, area_threshold = area_threshold, output_dir = output_dir)
+        tile2 = biota.LoadTile(dir, lat, lon, year2, lee_filter = lee_filter, downsample_factor = downsample_factor, forest_threshold = forest_threshold, area_threshold = area_threshold, output_dir = output_dir, cache_dir = cache_dir, output_profile = output_profile, async_output = True, n_workers = n_workers)
         
 		# Load a change object
-        tile_change = biota.LoadChange(tile1, tile2, change_area_threshold = change_area_threshold, change_magnitude_threshold = change_magnitude_threshold, change_intensity_threshold = change_intensity_threshold, deforestation_threshold = deforestation_threshold, output_dir = output_dir)
+        tile_change = biota.LoadChange(tile1, tile2, change_area_threshold = change_area_threshold, change_magnitude_threshold = change_magnitude_threshold, change_intensity_threshold = change_intensity_threshold, deforestation_threshold = deforestation_threshold, output_dir = output_dir, output_profile = output_profile)
 
         # Here come the choices
         if output == 'AGBChange' or output == 'all':
@@ -50,6 +54,10 @@ def main(dir, lat, lon, year1, year2,
         if output == 'RiskMap' or output == 'all':
             if verbose: print ("Calculating Deforestation Risk Map...")
             RiskMap = tile_change.getRiskMap(output = True)
+        
+        # GeoTiffs are written in the background; wait for them to finish
+        biota.IO.flush()
+        
         if verbose: print ("Done!")
     
     except KeyboardInterrupt:
@@ -84,6 +92,9 @@ if __name__ == '__main__':
     optional.add_argument('-nf', '--nofilter', action = 'store_false', default = True, help = "Use this flag if you don't want to apply a speckle filter.")
     optional.add_argument('-ds', '--downsample_factor', metavar = 'N', action = 'store', type = int, default = 1, help = "Apply downsampling to inputs by specifying an integer factor to downsample by. Defaults to no downsampling.")
     optional.add_argument('-od', '--output_dir', metavar = 'DIR', type = str, default = os.getcwd(), help = "Optionally specify an output directory. Defaults to the present working directory.")
+    optional.add_argument('-cd', '--cache_dir', metavar = 'DIR', type = str, default = None, help = "Optionally specify a directory to cache intermediate arrays, which are reused by later runs with the same inputs and options. Defaults to no cache.")
+    optional.add_argument('-cog', '--cog', action = 'store_true', default = False, help = "Output tiled, compressed GeoTiffs with internal overviews (cloud-optimized GeoTiffs). Defaults to striped LZW GeoTiffs.")
+    optional.add_argument('-nw', '--n_workers', metavar = 'N', type = int, default = 1, help = "Number of threads to apply the speckle filter with. Defaults to 1.")
     optional.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "Print progress to terminal. Defaults to False.")
     
     # Arguments specific to a type of output
@@ -115,6 +126,9 @@ if __name__ == '__main__':
         change_intensity_threshold = change_intensity_threshold,
         deforestation_threshold = args.deforestation_threshold,
         output_dir = args.output_dir,
+        cache_dir = args.cache_dir,
+        output_profile = 'cog' if args.cog else 'default',
+        n_workers = args.n_workers,
         verbose = args.verbose)
     
     except KeyboardInterrupt:
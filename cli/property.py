@@ -12,6 +12,7 @@ import pdb
 
 import biota
 import biota.download
+import biota.IO
 
 """
 This is the script that runs the command line to extract and plot properties for one year.
@@ -29,6 +30,9 @@ def main(dir, lat, lon, years,
         forest_threshold = 10,
         area_threshold = 0,
         output_dir = os.getcwd(),
+        cache_dir = None,
+        output_profile = 'default',
+        n_workers = 1,
 		verbose = False):
     '''
     Load an ALOS tile with biota, and generate specified output
@@ -42,7 +46,7 @@ def main(dir, lat, lon, years,
         # Process  tile, provided it exists, else continue. Exit with KeyboardInterrupt.
         try:
             # Load the tile
-            tile = biota.LoadTile(dir, lat, lon, year, lee_filter = lee_filter, downsample_factor = downsample_factor, forest_threshold = forest_threshold, area_threshold = area_threshold, output_dir = output_dir)
+            tile = biota.LoadTile(dir, lat, lon, year, lee_filter = lee_filter, downsample_factor = downsample_factor, forest_threshold = forest_threshold, area_threshold = area_threshold, output_dir = output_dir, cache_dir = cache_dir, output_profile = output_profile, async_output = True, n_workers = n_workers)
 
             # Here come the choices
             if output == 'Gamma0' or output == 'all':
@@ -55,6 +59,9 @@ def main(dir, lat, lon, years,
                 if verbose: print ("Calculating Woody Cover...")
                 WoodyCover = tile.getWoodyCover(output = True)
             
+            # GeoTiffs are written in the background; wait for them to finish
+            biota.IO.flush()
+            
             if verbose: print ("Done!")
 
         except KeyboardInterrupt:
@@ -88,6 +95,9 @@ if __name__ == '__main__':
     optional.add_argument('-nf', '--nofilter', action = 'store_true', default = True, help = "Use this flag if you don't want to apply a speckle filter.")
     optional.add_argument('-ds', '--downsample_factor', metavar = 'N', action = 'store', type = int, default = 1, help = "Apply downsampling to inputs by specifying an integer factor to downsample by. Defaults to no downsampling.")
     optional.add_argument('-od', '--output_dir', metavar = 'DIR', type = str, default = os.getcwd(), help = "Optionally specify an output directory. Defaults to the present working directory.")
+    optional.add_argument('-cd', '--cache_dir', metavar = 'DIR', type = str, default = None, help = "Optionally specify a directory to cache intermediate arrays, which are reused by later runs with the same inputs and options. Defaults to no cache.")
+    optional.add_argument('-cog', '--cog', action = 'store_true', default = False, help = "Output tiled, compressed GeoTiffs with internal overviews (cloud-optimized GeoTiffs). Defaults to striped LZW GeoTiffs.")
+    optional.add_argument('-nw', '--n_workers', metavar = 'N', type = int, default = 1, help = "Number of threads to apply the speckle filter with. Defaults to 1.")
     optional.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "Print progress to terminal. Defaults to False.")
 
     # Arguments specific to a type of output
@@ -111,6 +121,9 @@ if __name__ == '__main__':
         forest_threshold = args.forest_threshold,
         area_threshold = args.area_threshold,
         output_dir = args.output_dir,
+        cache_dir = args.cache_dir,
+        output_profile = 'cog' if args.cog else 'default',
+        n_workers = args.n_workers,
 		verbose = args.verbose)
     except KeyboardInterrupt:
         sys.exit(0)
@@ -0,0 +1,87 @@
+import numpy as np
+import os
+import pytest
+from scipy import ndimage
+
+"""
+Shared fixtures for the biota tests. Tests run on small synthetic ALOS mosaic tiles, written to disk in the layout and format of the JAXA mosaic (ENVI rasters named e.g. N01E030_07_sl_HV in the directory N01E030_07_MOS).
+"""
+
+
+LAT, LON = 1, 30
+
+YEARS = [2007, 2010]
+
+SIZE = 240
+
+
+def _writeENVI(filename, data, dtype, lat = LAT, lon = LON):
+    """
+    Write an array as a single band ENVI raster, as distributed in the ALOS mosaic.
+    """
+
+    from osgeo import gdal, osr
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+
+    ds = gdal.GetDriverByName('ENVI').Create(filename, data.shape[1], data.shape[0], 1, dtype)
+    ds.SetGeoTransform((float(lon), 1. / data.shape[1], 0., float(lat), 0., -1. / data.shape[0]))
+    ds.SetProjection(srs.ExportToWkt())
+    ds.GetRasterBand(1).WriteArray(data)
+    ds = None
+
+
+def _syntheticDN(size, seed):
+    """
+    Generate synthetic DN values with spatial structure and speckle, spanning nonforest to high biomass forest.
+    """
+
+    rng = np.random.RandomState(seed)
+
+    # Smooth field of mean DN, from ~500 (nonforest) to ~6000 (dense forest)
+    field = ndimage.uniform_filter(rng.rand(size, size), size = 15)
+    field = 500. + 5500. * (field - field.min()) / (field.max() - field.min())
+
+    return (field * np.sqrt(rng.gamma(4., 1. / 4., (size, size)))).clip(1, 2 ** 16 - 1).astype(np.uint16)
+
+
+def writeTile(data_dir, year, size = SIZE, seed = 0, lat = LAT, lon = LON):
+    """
+    Write a synthetic ALOS-1 mosaic tile for year, with scattered nodata and a masked block.
+    """
+
+    from osgeo import gdal
+
+    name = 'N%sE%s_%s'%(str(lat).zfill(2), str(lon).zfill(3), str(year)[-2:])
+
+    directory = os.path.join(data_dir, name + '_MOS')
+    os.makedirs(directory)
+
+    rng = np.random.RandomState(seed + 1)
+
+    # Valid pixels are 255 in the ALOS mosaic mask
+    mask = np.full((size, size), 255, dtype = np.uint8)
+    mask[rng.rand(size, size) < 0.02] = 0
+    mask[size // 3:size // 2, size // 3:size // 2] = 0
+
+    _writeENVI(os.path.join(directory, name + '_sl_HH'), _syntheticDN(size, seed + 2), gdal.GDT_UInt16, lat = lat, lon = lon)
+    _writeENVI(os.path.join(directory, name + '_sl_HV'), _syntheticDN(size, seed), gdal.GDT_UInt16, lat = lat, lon = lon)
+    _writeENVI(os.path.join(directory, name + '_mask'), mask, gdal.GDT_Byte, lat = lat, lon = lon)
+    _writeENVI(os.path.join(directory, name + '_date'), np.full((size, size), 100, dtype = np.uint16), gdal.GDT_UInt16, lat = lat, lon = lon)
+
+
+@pytest.fixture(scope = 'session')
+def data_dir(tmp_path_factory):
+    """
+    A directory of synthetic ALOS mosaic tiles at (LAT, LON) for each of YEARS.
+    """
+
+    pytest.importorskip('osgeo')
+
+    data_dir = str(tmp_path_factory.mktemp('alos'))
+
+    for n, year in enumerate(YEARS):
+        writeTile(data_dir, year, seed = 10 * n)
+
+    return data_dir
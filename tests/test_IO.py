@@ -0,0 +1,39 @@
+import numpy as np
+import threading
+import time
+
+import biota.IO
+
+"""
+Tests of GeoTiff output in biota.IO.
+"""
+
+
+def test_async_writes_bounded():
+    """
+    Background writes block once max_pending are outstanding, including successive strips of the same file.
+    """
+
+    outstanding = []
+    lock = threading.Lock()
+
+    def _slowWrite(data, filename, geo_t, proj, **kwargs):
+        with lock:
+            outstanding.append(len(biota.IO._writer_pending))
+        time.sleep(0.01)
+
+    biota.IO.setWriterThreads(2, max_pending = 3)
+
+    try:
+        for yoff in range(0, 200, 10):
+            biota.IO._submitWrite(_slowWrite, np.zeros((10, 10)), 'strips', None, None, {'yoff': yoff})
+            assert len(biota.IO._writer_pending) <= 3
+
+        biota.IO.flush()
+
+    finally:
+        biota.IO.setWriterThreads(2, max_pending = 4)
+
+    assert len(outstanding) == 20
+    assert max(outstanding) <= 3
+    assert len(biota.IO._writer_pending) == 0
@@ -0,0 +1,107 @@
+import concurrent.futures
+import numpy as np
+import os
+import pytest
+import sqlite3
+
+import biota.batch
+import biota.IO
+
+from conftest import LAT, LON
+
+"""
+Tests of batch processing of change from a manifest.
+"""
+
+
+def _writeManifest(path, rows):
+    """
+    Write a manifest of jobs for the synthetic tiles, with a column of change_intensity_threshold for each row.
+    """
+
+    with open(path, 'w') as f:
+        f.write('lat,lon,year1,year2,output,change_intensity_threshold,contiguity\n')
+        for change_intensity_threshold, contiguity in rows:
+            f.write('%s,%s,2007,2010,ChangeType,%s,%s\n'%(LAT, LON, change_intensity_threshold, contiguity))
+
+
+def test_job_ids(tmp_path):
+    """
+    Numbers written as ints or floats give the same job.
+    """
+
+    manifest = str(tmp_path / 'manifest.csv')
+    _writeManifest(manifest, [('1', 'queen'), ('1.0', 'queen'), ('0.5', 'queen')])
+
+    assert len(biota.batch.loadManifest(manifest)) == 2
+
+
+def test_run_batch(data_dir, tmp_path):
+    """
+    Jobs for the same tile and years with different options write separate outputs, and completed jobs are skipped when the batch is run again.
+    """
+
+    manifest = str(tmp_path / 'manifest.csv')
+    _writeManifest(manifest, [('0.2', 'queen'), ('0.8', 'queen'), ('0.2', 'rook')])
+
+    output_dir = tmp_path / 'outputs'
+    output_dir.mkdir()
+
+    summary = biota.batch.runBatch(data_dir, manifest, output_dir = str(output_dir), n_processes = 2)
+
+    assert summary['Completed'] == 3 and len(summary['Failed']) == 0
+
+    jobs = biota.batch.loadManifest(manifest)
+
+    change_types = [biota.IO.loadArray('%s/%s/ChangeType_2007_2010_N01E030.tif'%(str(output_dir), job['job_id'][:8])) for job in jobs]
+
+    assert not np.array_equal(change_types[0], change_types[1])
+    assert len(os.listdir(str(output_dir))) == 3
+
+    summary = biota.batch.runBatch(data_dir, manifest, output_dir = str(output_dir))
+
+    assert summary['Skipped'] == 3 and summary['Completed'] == 0
+
+
+def test_interrupt_batch(data_dir, tmp_path, monkeypatch):
+    """
+    Interrupting a batch cancels queued jobs, records jobs that finished, and leaves the rest to run when the batch is resumed.
+    """
+
+    manifest = str(tmp_path / 'manifest.csv')
+    _writeManifest(manifest, [(str(change_intensity_threshold), 'queen') for change_intensity_threshold in [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8]])
+
+    journal = str(tmp_path / 'journal.sqlite')
+
+    output_dir = tmp_path / 'outputs'
+    output_dir.mkdir()
+
+    as_completed = concurrent.futures.as_completed
+
+    def interruptedAsCompleted(futures):
+        """
+        Interrupt the batch once the first job has finished.
+        """
+
+        yield next(as_completed(futures))
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(biota.batch.concurrent.futures, 'as_completed', interruptedAsCompleted)
+
+    with pytest.raises(KeyboardInterrupt):
+        biota.batch.runBatch(data_dir, manifest, journal = journal, output_dir = str(output_dir))
+
+    monkeypatch.undo()
+
+    conn = sqlite3.connect(journal)
+    states = dict(conn.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+    conn.close()
+
+    # Queued jobs were cancelled rather than run
+    assert states.get('done', 0) >= 1
+    assert states.get('pending', 0) >= 1
+    assert sum(states.values()) == 8
+
+    summary = biota.batch.runBatch(data_dir, manifest, journal = journal, output_dir = str(output_dir))
+
+    assert summary['Skipped'] == states['done'] and summary['Completed'] == 8 - states['done'] and len(summary['Failed']) == 0
@@ -0,0 +1,48 @@
+import numpy as np
+
+import biota
+
+from conftest import LAT, LON, YEARS
+
+"""
+Tests of the on-disk cache of tile products.
+"""
+
+
+def _loadTiles(data_dir, tmp_path):
+    """
+    Load the synthetic tiles for each year, sharing a cache directory.
+    """
+
+    cache_dir = tmp_path / 'cache'
+    cache_dir.mkdir(exist_ok = True)
+
+    return [biota.LoadTile(data_dir, LAT, LON, year, cache_dir = str(cache_dir), output_dir = str(tmp_path), precision = 'float64') for year in YEARS]
+
+
+def test_multitemporal_cache(data_dir, tmp_path):
+    """
+    The multitemporal filter keeps the tiles' cache, without confusing its products with those of the spatial filter, and releasing Gamma0 reverts to the spatial filter.
+    """
+
+    tiles = _loadTiles(data_dir, tmp_path)
+
+    AGB_spatial = tiles[0].getAGB().copy()
+
+    biota.filterMultitemporal(tiles)
+
+    assert tiles[0].cache_dir is not None
+
+    AGB_multitemporal = tiles[0].getAGB().copy()
+
+    assert not np.allclose(AGB_spatial.data[~AGB_spatial.mask], AGB_multitemporal.data[~AGB_multitemporal.mask])
+
+    # A new tile gets products of the spatial filter from the cache
+    assert np.array_equal(_loadTiles(data_dir, tmp_path)[0].getAGB().data, AGB_spatial.data)
+
+    # Releasing Gamma0 reverts to the spatial filter
+    tiles[0].release('Gamma0')
+    tiles[0].release('AGB')
+
+    assert tiles[0].multitemporal is None
+    assert np.array_equal(tiles[0].getAGB().data, AGB_spatial.data)
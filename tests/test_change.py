@@ -0,0 +1,178 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+import biota
+
+from conftest import LAT, LON
+
+"""
+Tests of change classification by LoadChange.
+"""
+
+
+def _contiguous(data, min_pixels, contiguity):
+    """
+    Pixels of data in contiguous areas of at least min_pixels, by labelling the whole array.
+    """
+
+    location_id, n_areas = ndimage.label(data, structure = ndimage.generate_binary_structure(2, 1 if contiguity == 'rook' else 2))
+
+    return (np.bincount(location_id.ravel()) >= min_pixels)[location_id] & data
+
+
+def _referenceChangeCode(tile_change):
+    """
+    Classify change pixel by pixel, following the definitions of each change type in turn.
+    """
+
+    AGB_t1, AGB_t2 = tile_change.tile_t1.getAGB().data.astype(np.float64), tile_change.tile_t2.getAGB().data.astype(np.float64)
+    WC_t1, WC_t2 = tile_change.tile_t1.getWoodyCover().data, tile_change.tile_t2.getWoodyCover().data
+
+    valid = tile_change.mask == False
+
+    F_NF, NF_F, F_F, NF_NF = WC_t1 & ~WC_t2, ~WC_t1 & WC_t2, WC_t1 & WC_t2, ~WC_t1 & ~WC_t2
+
+    AGB_change = AGB_t2 - AGB_t1
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        intensity = AGB_change / AGB_t1
+
+    CHANGE = ((intensity >= tile_change.change_intensity_threshold) | (intensity < -tile_change.change_intensity_threshold)) & \
+             ((AGB_change >= tile_change.change_magnitude_threshold) | (AGB_change < -tile_change.change_magnitude_threshold))
+
+    DECREASE, INCREASE = AGB_t2 < AGB_t1, AGB_t2 >= AGB_t1
+
+    if tile_change.change_area_threshold > 0:
+
+        min_pixels = int(round(tile_change.change_area_threshold / (tile_change.yRes * tile_change.xRes * 0.0001)))
+
+        if tile_change.combine_areas:
+            groups = [INCREASE & (NF_F | F_F), DECREASE & (F_NF | F_F)]
+        else:
+            groups = [DECREASE & F_NF, DECREASE & F_F, INCREASE & F_F, INCREASE & NF_F]
+
+        CHANGE = np.any([_contiguous(CHANGE & group & valid, min_pixels, tile_change.contiguity) for group in groups], axis = 0)
+
+    NOCHANGE = ~CHANGE
+
+    DEFORESTED = AGB_t2 < tile_change.deforestation_threshold
+
+    change_code = np.full(AGB_t1.shape, 255, dtype = np.uint8)
+
+    change_code[NF_NF] = 0
+    change_code[F_NF & CHANGE & DEFORESTED] = 1
+    change_code[(F_F & CHANGE & DECREASE) | (F_NF & CHANGE & ~DEFORESTED)] = 2
+    change_code[(F_F | F_NF) & NOCHANGE & DECREASE] = 3
+    change_code[(F_F | NF_F) & NOCHANGE & INCREASE] = 4
+    change_code[F_F & CHANGE & INCREASE] = 5
+    change_code[NF_F & CHANGE] = 6
+
+    change_code[~valid] = 255
+
+    return change_code
+
+
+@pytest.mark.parametrize('change_area_threshold', [0, 500.])
+@pytest.mark.parametrize('combine_areas', [True, False])
+@pytest.mark.parametrize('deforestation_threshold', [None, 5.])
+def test_change_type(data_dir, tmp_path, change_area_threshold, combine_areas, deforestation_threshold):
+    """
+    Change types classified in a single blockwise pass match the definition of each change type.
+    """
+
+    tile_t1 = biota.LoadTile(data_dir, LAT, LON, 2007, precision = 'float64', output_dir = str(tmp_path))
+    tile_t2 = biota.LoadTile(data_dir, LAT, LON, 2010, precision = 'float64', output_dir = str(tmp_path))
+
+    tile_change = biota.LoadChange(tile_t1, tile_t2, change_intensity_threshold = 0.2, change_magnitude_threshold = 2., change_area_threshold = change_area_threshold, combine_areas = combine_areas, deforestation_threshold = deforestation_threshold)
+
+    change_type = tile_change.getChangeType()
+
+    reference = _referenceChangeCode(tile_change)
+
+    # Test pixels where the intensity of change is well defined
+    defined = np.abs(tile_t1.getAGB().data) > 1e-6
+
+    assert np.array_equal(np.asarray(tile_change.ChangeCode)[defined], reference[defined])
+
+    # Each pixel has one change type
+    for code, name in enumerate(['nonforest', 'deforestation', 'degradation', 'minorloss', 'minorgain', 'growth', 'afforestation']):
+        assert np.array_equal(np.asarray(change_type[name])[defined], (reference == code)[defined])
+
+
+@pytest.mark.parametrize('change_area_threshold', [0, 500.])
+@pytest.mark.parametrize('deforestation_threshold', [None, 5.])
+def test_risk_maps(data_dir, tmp_path, change_area_threshold, deforestation_threshold):
+    """
+    Risk maps from one change classification match those from classifying change again without a deforestation_threshold, with buffers measured from the nearest deforestation pixel.
+    """
+
+    buffer_sizes = [500., 1000., 2000.]
+
+    tile_t1 = biota.LoadTile(data_dir, LAT, LON, 2007, precision = 'float64', output_dir = str(tmp_path))
+    tile_t2 = biota.LoadTile(data_dir, LAT, LON, 2010, precision = 'float64', output_dir = str(tmp_path))
+
+    kwargs = {'change_intensity_threshold': 0.2, 'change_magnitude_threshold': 2., 'change_area_threshold': change_area_threshold}
+
+    tile_change = biota.LoadChange(tile_t1, tile_t2, deforestation_threshold = deforestation_threshold, **kwargs)
+    risk_maps = tile_change.getRiskMaps(buffer_sizes = buffer_sizes)
+
+    deforestation = np.asarray(tile_change.ChangeCode) == 1
+    deforestation_noDF = np.asarray(biota.LoadChange(tile_t1, tile_t2, **kwargs).getChangeType()['deforestation']) & (tile_change.mask == False)
+
+    # Distance in m from each pixel to the nearest deforestation pixel
+    rows, cols = np.indices(deforestation.shape)
+    coords = np.stack([rows.ravel() * tile_change.yRes, cols.ravel() * tile_change.xRes], axis = 1)
+    change = (deforestation | deforestation_noDF).ravel()
+    distance = cKDTree(coords[change]).query(coords)[0].reshape(deforestation.shape)
+
+    for buffer_size in buffer_sizes:
+
+        reference = np.where(deforestation, 1, np.where(deforestation_noDF, 2, np.where(distance <= buffer_size + 1e-6, 3, 0)))
+
+        valid = tile_change.mask == False
+
+        assert np.array_equal(risk_maps[buffer_size].data[valid], reference[valid])
+        assert np.array_equal(tile_change.getRiskMap(buffer_size = buffer_size).data[valid], reference[valid])
+
+
+@pytest.mark.parametrize('change_area_threshold', [0, 500.])
+def test_undefined_intensity(data_dir, tmp_path, change_area_threshold):
+    """
+    Pixels where AGB_t1 is 0 have an undefined intensity of change, so are masked in, and left out of the totals of, every change type other than nonforest.
+    """
+
+    tile_t1 = biota.LoadTile(data_dir, LAT, LON, 2007, precision = 'float64', output_dir = str(tmp_path))
+    tile_t2 = biota.LoadTile(data_dir, LAT, LON, 2010, precision = 'float64', output_dir = str(tmp_path))
+
+    # AGB of 0 at t1, with (x / 0) and without (0 / 0) change at t2
+    AGB_t1, AGB_t2 = tile_t1.getAGB(), tile_t2.getAGB()
+    AGB_t1.data[10:40, 10:40] = 0.
+    AGB_t2.data[10:25, 10:40] = 0.
+    AGB_t2.data[25:40, 10:40] = 50.
+
+    tile_change = biota.LoadChange(tile_t1, tile_t2, change_intensity_threshold = 0.2, change_magnitude_threshold = 2., change_area_threshold = change_area_threshold)
+
+    change_type = tile_change.getChangeType()
+
+    undefined = AGB_t1.data == 0
+    valid = tile_change.mask == False
+    change_code = np.asarray(tile_change.ChangeCode)
+
+    pixel_hectares = tile_change.xRes * tile_change.yRes * 0.0001
+    AGB_change = (AGB_t2.data - AGB_t1.data) * pixel_hectares
+
+    area_sum, AGB_sum = tile_change.getAreaSum(), tile_change.getAGBSum()
+
+    for change, code in biota.core.CHANGE_CODES.items():
+
+        included = valid if change == 'nonforest' else valid & ~undefined
+
+        assert np.array_equal(np.ma.getmaskarray(change_type[change]), ~included)
+        assert change_type[change].sum() == (change_code[included] == code).sum()
+        assert np.isclose(area_sum[change], (change_code[included] == code).sum() * pixel_hectares)
+        assert np.isclose(AGB_sum[change], AGB_change[included][change_code[included] == code].sum())
+
+    # Without a change area threshold, undefined pixels must be classified as something other than nonforest for the test to mean anything
+    if change_area_threshold == 0: assert np.any(np.isin(change_code[undefined & valid], [1, 2, 3, 4, 5, 6]))
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+
+import biota.filter
+
+"""
+Tests of the speckle filters in biota.filter.
+"""
+
+
+def _syntheticGamma0(size = 300, n_looks = 16):
+    """
+    Generate a synthetic gamma0 image (natural units) with gamma distributed speckle, scattered nodata and a large masked area.
+    """
+
+    rng = np.random.RandomState(0)
+
+    gamma0 = ndimage.uniform_filter(rng.gamma(2., 0.01, (size, size)), size = 15)
+    gamma0 = gamma0 * rng.gamma(n_looks, 1. / n_looks, (size, size))
+
+    mask = rng.rand(size, size) < 0.05
+    mask[size // 4:size // 2, size // 4:size // 2] = True
+
+    return np.ma.array(gamma0, mask = mask)
+
+
+@pytest.mark.parametrize('name', sorted(biota.filter.FILTERS.keys()))
+@pytest.mark.parametrize('nodata_method', ['nearest', 'normalized'])
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_parallel_blocks(name, nodata_method, dtype):
+    """
+    Filtering blocks of rows in parallel is identical to filtering the same blocks in a single thread, and matches filtering the whole image at once to within floating point rounding.
+    """
+
+    speckle_filter, units = biota.filter.get_filter(name)
+
+    img = _syntheticGamma0().astype(dtype)
+    if units == 'decibels': img = dtype(10.) * np.ma.log10(img)
+
+    whole = speckle_filter(img, window_size = 5, nodata_method = nodata_method, n_workers = 1, block_size = img.shape[0])
+    single = speckle_filter(img, window_size = 5, nodata_method = nodata_method, n_workers = 1, block_size = 32)
+    parallel = speckle_filter(img, window_size = 5, nodata_method = nodata_method, n_workers = 3, block_size = 32)
+
+    assert parallel.dtype == dtype
+
+    assert np.array_equal(np.ma.getmaskarray(single), np.ma.getmaskarray(parallel))
+    assert np.array_equal(np.ma.getdata(single), np.ma.getdata(parallel), equal_nan = True)
+
+    assert np.array_equal(np.ma.getmaskarray(whole), np.ma.getmaskarray(parallel))
+    assert np.allclose(np.ma.getdata(whole), np.ma.getdata(parallel), rtol = 1e-12, atol = 0., equal_nan = True)
+
+
+@pytest.mark.parametrize('name', sorted(biota.filter.FILTERS.keys()))
+@pytest.mark.parametrize('window_size', [7., '7', 7.5])
+def test_window_size_type(name, window_size):
+    """
+    Each filter rejects window sizes that aren't integers.
+    """
+
+    speckle_filter, units = biota.filter.get_filter(name)
+
+    with pytest.raises(AssertionError):
+        speckle_filter(_syntheticGamma0(size = 50), window_size = window_size)
@@ -0,0 +1,183 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+
+import biota
+import biota.indices
+
+from conftest import SIZE, writeTile
+
+"""
+Tests of contiguous area labelling in biota.indices.
+"""
+
+
+def _referenceLabels(data, value, min_pixels, contiguity):
+    """
+    Label contiguous areas of the whole array at once, numbered from 1 in order of each area's first pixel.
+    """
+
+    structure = ndimage.generate_binary_structure(2, 1 if contiguity == 'rook' else 2)
+
+    location_id, n_areas = ndimage.label(np.ma.filled(data == value, False), structure = structure)
+
+    include = np.bincount(location_id.ravel()) >= min_pixels
+    include[0] = False
+
+    return np.where(include[location_id], np.cumsum(include)[location_id], 0)
+
+
+def _randomData(seed, shape = (97, 83)):
+    """
+    Generate a random binary array with clumped areas, and a masked array version of it.
+    """
+
+    rng = np.random.RandomState(seed)
+
+    data = ndimage.uniform_filter(rng.rand(*shape), size = 3) > 0.5
+    mask = rng.rand(*shape) < 0.1
+
+    return data, np.ma.array(data, mask = mask)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('contiguity', ['rook', 'queen'])
+@pytest.mark.parametrize('strip_size', [1, 2, 7, 1024])
+@pytest.mark.parametrize('min_pixels', [1, 10])
+def test_label_strips(seed, contiguity, strip_size, min_pixels):
+    """
+    Labelling in strips gives the same area IDs as labelling the whole array, including areas that cross many strips.
+    """
+
+    for data in _randomData(seed):
+
+        location_id = biota.indices.labelStrips(data, True, min_pixels = min_pixels, contiguity = contiguity, strip_size = strip_size)
+
+        assert location_id.dtype == np.int32
+        assert np.array_equal(location_id, _referenceLabels(data, True, min_pixels, contiguity))
+
+
+def test_label_strips_spiral():
+    """
+    A single area that winds back and forth across every strip boundary is labelled as one area.
+    """
+
+    data = np.zeros((41, 41), dtype = bool)
+    data[::2, 1:-1] = True
+    data[1::4, -2] = True
+    data[3::4, 1] = True
+
+    for strip_size in [1, 3, 1024]:
+        location_id = biota.indices.labelStrips(data, True, contiguity = 'rook', strip_size = strip_size)
+        assert np.array_equal(location_id, data.astype(np.int32))
+
+
+@pytest.mark.parametrize('contiguity', ['rook', 'queen'])
+def test_contiguous_areas(contiguity):
+    """
+    getContiguousAreas() keeps areas of at least min_pixels and restores the input mask.
+    """
+
+    data, data_masked = _randomData(0)
+
+    contiguous_area, location_id = biota.indices.getContiguousAreas(data_masked, True, min_pixels = 10, contiguity = contiguity, strip_size = 8)
+
+    reference = _referenceLabels(data_masked, True, 10, contiguity)
+
+    assert np.array_equal(location_id.data, reference)
+    assert np.array_equal(contiguous_area.data, reference > 0)
+    assert np.array_equal(contiguous_area.mask, data_masked.mask)
+
+
+# A region of 2 x 2 tiles, as (lat, lon) of each tile's north-west corner
+REGION = [(2, 30), (2, 31), (1, 30), (1, 31)]
+
+
+@pytest.fixture(scope = 'module')
+def region_dir(tmp_path_factory):
+    """
+    A directory of synthetic ALOS mosaic tiles covering REGION in 2007.
+    """
+
+    pytest.importorskip('osgeo')
+
+    region_dir = str(tmp_path_factory.mktemp('region'))
+
+    for n, (lat, lon) in enumerate(REGION):
+        writeTile(region_dir, 2007, seed = 10 * n, lat = lat, lon = lon)
+
+    return region_dir
+
+
+def _mosaic(region_dir, patches, **kwargs):
+    """
+    Mosaic forest, mask, pixel area (ha) and patch IDs of each tile of REGION.
+    """
+
+    forest, mask, hectares, location_id = np.zeros((2 * SIZE, 2 * SIZE), dtype = bool), np.zeros((2 * SIZE, 2 * SIZE), dtype = bool), np.zeros((2 * SIZE, 2 * SIZE)), np.zeros((2 * SIZE, 2 * SIZE), dtype = np.int32)
+
+    for lat, lon in REGION:
+
+        tile = biota.LoadTile(region_dir, lat, lon, 2007, output_dir = region_dir, **kwargs)
+
+        rows, cols = slice((2 - lat) * SIZE, (3 - lat) * SIZE), slice((lon - 30) * SIZE, (lon - 29) * SIZE)
+
+        forest[rows, cols] = tile.getAGB().data >= tile.forest_threshold
+        mask[rows, cols] = tile.mask
+        hectares[rows, cols] = tile.xRes * tile.yRes * 0.0001
+        location_id[rows, cols] = np.load(patches[(lat, lon)])
+
+    return forest, mask, hectares, location_id
+
+
+@pytest.mark.parametrize('contiguity', ['rook', 'queen'])
+@pytest.mark.parametrize('area_threshold', [0., 5000.])
+def test_label_region(region_dir, tmp_path, contiguity, area_threshold):
+    """
+    Labelling a region tile by tile gives the same forest patches as labelling a mosaic of the region at once.
+    """
+
+    kwargs = {'area_threshold': area_threshold, 'contiguity': contiguity, 'precision': 'float64'}
+
+    patches = biota.indices.labelRegion(region_dir, REGION[::-1], 2007, output_dir = str(tmp_path), strip_size = 50, **kwargs)
+
+    forest, mask, hectares, location_id = _mosaic(region_dir, patches, **kwargs)
+
+    structure = ndimage.generate_binary_structure(2, 1 if contiguity == 'rook' else 2)
+    reference, n_areas = ndimage.label(forest & ~mask, structure = structure)
+
+    include = np.bincount(reference.ravel(), weights = hectares.ravel()) >= area_threshold
+    include[0] = False
+    reference[~include[reference]] = 0
+
+    # Some patches must cross tile edges for the test to mean anything
+    assert len(np.unique(np.concatenate([reference[SIZE - 1], reference[:, SIZE - 1]]) [np.concatenate([reference[SIZE - 1] == reference[SIZE], reference[:, SIZE - 1] == reference[:, SIZE]])])) > 1
+
+    # Patches are numbered 1 to n, each corresponding to one patch of the mosaic
+    pairs = np.unique(np.stack([location_id.ravel(), reference.ravel()]), axis = 1)
+
+    assert np.array_equal(location_id > 0, reference > 0)
+    assert np.array_equal(np.unique(location_id), np.arange(location_id.max() + 1))
+    assert len(np.unique(pairs[0])) == len(np.unique(pairs[1])) == pairs.shape[1]
+
+
+def test_label_region_forest_dir(region_dir, tmp_path):
+    """
+    Labelling a region from forest pixels saved by saveForest() is identical to calculating AGB for each tile.
+    """
+
+    kwargs = {'area_threshold': 5000., 'precision': 'float64'}
+
+    forest_dir = tmp_path / 'forest'
+    forest_dir.mkdir()
+
+    for lat, lon in REGION:
+        biota.indices.saveForest(biota.LoadTile(region_dir, lat, lon, 2007, output_dir = region_dir, **kwargs), str(forest_dir))
+
+    for name in ['agb', 'saved']: (tmp_path / name).mkdir()
+
+    patches = biota.indices.labelRegion(region_dir, REGION, 2007, output_dir = str(tmp_path / 'agb'), **kwargs)
+    patches_saved = biota.indices.labelRegion(region_dir, REGION, 2007, output_dir = str(tmp_path / 'saved'), forest_dir = str(forest_dir), **kwargs)
+
+    for location in REGION:
+        assert np.array_equal(np.load(patches[location]), np.load(patches_saved[location]))
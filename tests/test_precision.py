@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import biota
+import biota.filter
+
+from conftest import LAT, LON
+
+"""
+Tests that processing at float32 working precision stays within stated bounds of float64.
+"""
+
+
+# Maximum difference between float32 and float64 processing
+GAMMA0_DB_TOLERANCE = 1e-4 # dB
+GAMMA0_RTOL = 1e-5 # Relative, in natural units
+AGB_TOLERANCE = 2e-3 # tC/ha, for both AGB and AGBChange
+
+
+def _loadChange(data_dir, tmp_path, precision, **kwargs):
+    """
+    Load a LoadChange() object for the synthetic tiles at a working precision.
+    """
+
+    tile_t1 = biota.LoadTile(data_dir, LAT, LON, 2007, precision = precision, output_dir = str(tmp_path), **kwargs)
+    tile_t2 = biota.LoadTile(data_dir, LAT, LON, 2010, precision = precision, output_dir = str(tmp_path), **kwargs)
+
+    return biota.LoadChange(tile_t1, tile_t2)
+
+
+def _maxDifference(a, b):
+    """
+    Maximum absolute difference between two masked arrays over unmasked pixels, which must be the same.
+    """
+
+    assert np.array_equal(np.ma.getmaskarray(a), np.ma.getmaskarray(b)), "Masks differ between precisions"
+
+    valid = ~np.ma.getmaskarray(b)
+
+    return np.max(np.abs(a.data[valid].astype(np.float64) - b.data[valid]))
+
+
+@pytest.mark.parametrize('speckle_filter', sorted(biota.filter.FILTERS.keys()) + [None])
+def test_float32_bounds(data_dir, tmp_path, speckle_filter):
+    """
+    Filtered Gamma0, AGB and AGBChange at float32 agree with float64 within the stated tolerances.
+    """
+
+    kwargs = {'lee_filter': False} if speckle_filter is None else {'speckle_filter': speckle_filter}
+
+    change_32 = _loadChange(data_dir, tmp_path, 'float32', **kwargs)
+    change_64 = _loadChange(data_dir, tmp_path, 'float64', **kwargs)
+
+    tile_32, tile_64 = change_32.tile_t1, change_64.tile_t1
+
+    # Arrays are held at the working precision
+    assert tile_32.getAGB().dtype == np.float32
+    assert tile_64.getAGB().dtype == np.float64
+
+    assert _maxDifference(tile_32.getGamma0(units = 'decibels'), tile_64.getGamma0(units = 'decibels')) <= GAMMA0_DB_TOLERANCE
+
+    gamma0_32, gamma0_64 = tile_32.getGamma0(units = 'natural'), tile_64.getGamma0(units = 'natural')
+    valid = ~gamma0_64.mask
+    assert np.allclose(gamma0_32.data[valid], gamma0_64.data[valid], rtol = GAMMA0_RTOL, atol = 0.)
+
+    assert _maxDifference(tile_32.getAGB(), tile_64.getAGB()) <= AGB_TOLERANCE
+
+    assert _maxDifference(change_32.getAGBChange(), change_64.getAGBChange()) <= AGB_TOLERANCE
@@ -0,0 +1,91 @@
+import numpy as np
+import os
+import pytest
+
+import biota
+import biota.filter
+import biota.IO
+
+from conftest import LAT, LON
+
+"""
+Tests that LoadTile.streamOutput() reproduces whole tile processing, strip by strip.
+"""
+
+
+def _outputs(tile, products):
+    """
+    Load the GeoTiffs output by a tile for each product.
+    """
+
+    return {product: biota.IO.loadArray(os.path.join(tile.output_dir, tile.output_pattern%product)) for product in products}
+
+
+def _wholeAndStreamed(data_dir, tmp_path, products, max_memory = 1., **kwargs):
+    """
+    Output products from the whole tile and streamed in strips, to separate directories.
+    """
+
+    os.makedirs(str(tmp_path / 'whole'))
+    os.makedirs(str(tmp_path / 'streamed'))
+
+    tile = biota.LoadTile(data_dir, LAT, LON, 2007, output_dir = str(tmp_path / 'whole'), **kwargs)
+    for product in products:
+        getattr(tile, 'get' + product)(output = True)
+
+    tile_streamed = biota.LoadTile(data_dir, LAT, LON, 2007, output_dir = str(tmp_path / 'streamed'), **kwargs)
+    strip_size = tile_streamed.streamOutput(products = products, max_memory = max_memory)
+
+    # The memory budget must split the tile into several strips for the test to mean anything
+    assert strip_size < tile_streamed.ySize // 2
+
+    return _outputs(tile, products), _outputs(tile_streamed, products)
+
+
+@pytest.mark.parametrize('speckle_filter', sorted(biota.filter.FILTERS.keys()))
+@pytest.mark.parametrize('nodata_method', ['nearest', 'normalized'])
+def test_streamed_filtered(data_dir, tmp_path, speckle_filter, nodata_method):
+    """
+    Streamed Gamma0 and AGB match the whole tile to within floating point rounding for each speckle filter.
+    """
+
+    whole, streamed = _wholeAndStreamed(data_dir, tmp_path, ['Gamma0', 'AGB'], speckle_filter = speckle_filter, nodata_method = nodata_method, precision = 'float64')
+
+    for product in ['Gamma0', 'AGB']:
+        assert np.allclose(whole[product], streamed[product], rtol = 1e-9, atol = 1e-9), "Streamed %s differs from whole tile"%product
+
+
+def test_streamed_unfiltered(data_dir, tmp_path):
+    """
+    Without the speckle filter, streamed outputs are identical to the whole tile.
+    """
+
+    whole, streamed = _wholeAndStreamed(data_dir, tmp_path, ['Gamma0', 'AGB', 'WoodyCover'], lee_filter = False)
+
+    for product in ['Gamma0', 'AGB', 'WoodyCover']:
+        assert np.array_equal(whole[product], streamed[product]), "Streamed %s differs from whole tile"%product
+
+
+def test_streamed_woody_cover(data_dir, tmp_path):
+    """
+    Streamed WoodyCover matches the whole tile, other than where AGB is within rounding of the forest threshold.
+    """
+
+    whole, streamed = _wholeAndStreamed(data_dir, tmp_path, ['AGB', 'WoodyCover'], precision = 'float64')
+
+    near_threshold = np.abs(whole['AGB'] - 10.) < 1e-6
+
+    assert np.array_equal(whole['WoodyCover'][~near_threshold], streamed['WoodyCover'][~near_threshold])
+
+
+def test_streamed_cog(data_dir, tmp_path):
+    """
+    Streamed cloud-optimized GeoTiffs match the whole tile, and leave no partially written files behind.
+    """
+
+    whole, streamed = _wholeAndStreamed(data_dir, tmp_path, ['Gamma0', 'AGB'], precision = 'float64', output_profile = 'cog')
+
+    for product in ['Gamma0', 'AGB']:
+        assert np.allclose(whole[product], streamed[product], rtol = 1e-9, atol = 1e-9), "Streamed %s differs from whole tile"%product
+
+    assert not any(['_partial' in filename for filename in os.listdir(str(tmp_path / 'streamed'))])